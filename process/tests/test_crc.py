@@ -0,0 +1,190 @@
+import os
+import re
+import random
+import shutil
+import ctypes
+import tempfile
+import unittest
+import subprocess
+import numpy
+from wpm.crc import crc16, crc16_byte, crc16_words, crc16_block
+from wpm.samples import decode_samples
+from wpm.synth import load_trace, CURRENT_TRACES, VOLTAGE_TRACE
+
+# Checks the table driven CRC16 against the bit by bit decoders it replaced and
+# against the firmware's own crc16_bits(), compiled from main_logging.c when
+# there's a C compiler. Run from the process directory with
+#
+#	python -m unittest discover -s tests -t .
+
+################################################################################
+################################################################################
+
+FIRMWARE_SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "main_logging.c")
+
+# Samples per block the firmware sends in transparent mode
+BLOCK_SAMPLES = 405
+
+################################################################################
+################################################################################
+
+# The CRC16 of the processing scripts before wpm.crc, as they had it
+def original_crc16_bits(data, seed):
+	feedback = 0
+
+	# Keep our variables bound to 8/16 bits
+	data = data & 0xFF
+	seed = seed & 0xFFFF
+
+	# CRC16 Algorithm
+	for i in range(8):
+		feedback = ((data>>7) ^ (seed>>15)) & 0x1
+		if (feedback == 0):
+			seed <<= 1
+			seed = seed & 0xFFFF
+		else:
+			seed ^= (0x10 | 0x800)
+			seed <<= 1
+			seed |= 0x01
+			seed = seed & 0xFFFF
+		data <<= 1
+		data = data & 0xFF
+
+	return seed
+
+# A sample block's CRC16 chained byte by byte, the way the old decoders and the
+# firmware compute it: the timestamp and then every sample, high byte first
+def chained_block_crc(crc16_bits, timestamp, samples):
+	seed = 0
+	for shift in (24, 16, 8, 0):
+		seed = crc16_bits((timestamp >> shift) & 0xFF, seed)
+	for data in samples:
+		seed = crc16_bits((data >> 8) & 0xFF, seed)
+		seed = crc16_bits(data & 0xFF, seed)
+	return seed
+
+# The firmware's crc16_bits() from main_logging.c, built into a shared library
+# in directory, or None if it can't be
+def build_firmware_crc(directory):
+	f = open(FIRMWARE_SOURCE)
+	source = f.read()
+	f.close()
+	match = re.search(r"uint16_t crc16_bits\(uint8_t data, uint16_t seed\) \{.*?\n\}", source, re.S)
+	if (match is None):
+		return None
+
+	cFile = os.path.join(directory, "crc16_bits.c")
+	libFile = os.path.join(directory, "crc16_bits.so")
+	f = open(cFile, "w")
+	f.write("#include <stdint.h>\n" + match.group(0) + "\n")
+	f.close()
+	try:
+		if (subprocess.call(["cc", "-shared", "-fPIC", "-o", libFile, cFile]) != 0):
+			return None
+	except OSError:
+		return None
+
+	lib = ctypes.CDLL(libFile)
+	lib.crc16_bits.argtypes = [ctypes.c_uint8, ctypes.c_uint16]
+	lib.crc16_bits.restype = ctypes.c_uint16
+	return lib.crc16_bits
+
+# Blocks of ADC codes from the recorded traces of real meters
+def trace_blocks():
+	blocks = []
+	for name in sorted(CURRENT_TRACES.values()) + [VOLTAGE_TRACE]:
+		codes = numpy.clip(numpy.round(load_trace(name)), 0, 1023).astype(numpy.uint16)
+		for start in range(0, len(codes) - BLOCK_SAMPLES + 1, BLOCK_SAMPLES):
+			blocks.append(codes[start:start+BLOCK_SAMPLES])
+	return blocks
+
+# A sample block as the firmware sends it in transparent mode, with the
+# checksum the firmware computes for it
+def firmware_block(crc16_bits, timestamp, samples):
+	text = "".join(["%03X," % data for data in samples])
+	return "T%08XS%sX%04XZ" % (timestamp, text, chained_block_crc(crc16_bits, timestamp, samples))
+
+################################################################################
+################################################################################
+
+class TestCRC16(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		cls.rng = random.Random(1)
+		cls.directory = tempfile.mkdtemp(prefix="wpm-test-crc-")
+		cls.firmware_crc16_bits = build_firmware_crc(cls.directory)
+
+	@classmethod
+	def tearDownClass(cls):
+		shutil.rmtree(cls.directory)
+
+	def require_firmware(self):
+		if (self.firmware_crc16_bits is None):
+			self.skipTest("can't build crc16_bits() from %s" % FIRMWARE_SOURCE)
+
+	# Every seed with a spread of data bytes, and every data byte with the
+	# single bit seeds and the extremes
+	def test_byte_matches_original(self):
+		for seed in range(0x10000):
+			for data in (0x00, 0x01, 0x55, 0x80, 0xAA, 0xFF, seed & 0xFF, seed >> 8):
+				self.assertEqual(crc16_byte(data, seed), original_crc16_bits(data, seed), "byte 0x%02X seed 0x%04X" % (data, seed))
+		for data in range(256):
+			for seed in [0x0000, 0xFFFF] + [1 << i for i in range(16)]:
+				self.assertEqual(crc16_byte(data, seed), original_crc16_bits(data, seed), "byte 0x%02X seed 0x%04X" % (data, seed))
+
+	def test_byte_matches_firmware(self):
+		self.require_firmware()
+		for seed in range(0x10000):
+			data = self.rng.randint(0, 255)
+			self.assertEqual(crc16_byte(data, seed), self.firmware_crc16_bits(data, seed), "byte 0x%02X seed 0x%04X" % (data, seed))
+
+	# Random buffers of every type crc16() takes against chained bytes
+	def test_buffers_match_original(self):
+		for i in range(200):
+			buf = bytearray(self.rng.randint(0, 255) for j in range(self.rng.randint(0, 600)))
+			seed = self.rng.randint(0, 0xFFFF)
+			expected = seed
+			for data in buf:
+				expected = original_crc16_bits(data, expected)
+			self.assertEqual(crc16(buf, seed), expected)
+			self.assertEqual(crc16(bytes(buf), seed), expected)
+			self.assertEqual(crc16(memoryview(buf), seed), expected)
+
+	def test_words_match_original(self):
+		for i in range(50):
+			words = [self.rng.randint(0, 0xFFFF) for j in range(self.rng.randint(0, 300))]
+			expected = 0
+			for data in words:
+				expected = original_crc16_bits(data >> 8, expected)
+				expected = original_crc16_bits(data & 0xFF, expected)
+			self.assertEqual(crc16_words(words), expected)
+			self.assertEqual(crc16_words(numpy.array(words, dtype=numpy.uint16)), expected)
+
+	# Random sample blocks against the old decoders' and the firmware's
+	# chained checksum
+	def test_random_blocks(self):
+		for i in range(50):
+			timestamp = self.rng.randint(0, 0xFFFFFFFF)
+			samples = numpy.array([self.rng.randint(0, 0x3FF) for j in range(BLOCK_SAMPLES)], dtype=numpy.uint16)
+			self.assertEqual(crc16_block(timestamp, samples), chained_block_crc(original_crc16_bits, timestamp, samples))
+			if (self.firmware_crc16_bits is not None):
+				self.assertEqual(crc16_block(timestamp, samples), chained_block_crc(self.firmware_crc16_bits, timestamp, samples))
+
+	# Blocks of recorded meter samples, checksummed by the firmware's own
+	# code and sent the way it sends them, pass the decoder's check
+	def test_firmware_sample_blocks(self):
+		self.require_firmware()
+		blocks = trace_blocks()
+		self.assertTrue(len(blocks) > 0)
+		for (i, samples) in enumerate(blocks):
+			timestamp = self.rng.randint(0, 0xFFFFFFFF)
+			self.assertEqual(crc16_block(timestamp, samples), chained_block_crc(original_crc16_bits, timestamp, samples))
+			block = decode_samples(firmware_block(self.firmware_crc16_bits, timestamp, samples))
+			self.assertTrue(block is not None and block.checksum_ok(), "trace block %d" % i)
+
+	# 0x1021 with a zero seed is CRC-16/XMODEM, with a standard check value
+	def test_check_value(self):
+		self.assertEqual(crc16(b"123456789"), 0x31C3)
+
+if __name__ == '__main__':
+	unittest.main()
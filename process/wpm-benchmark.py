@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+from wpm.xbee import API_RECEIVE_PACKET, buffer_view, scan_frames, decode_frame
+from wpm.samples import decode_samples, sample_times
+from wpm.calibration import adc_volts, ADC_SCALING
+from wpm.meters import MeterRegistry
+from wpm.columns import ColumnStore
+from wpm.textout import format_samples
+from wpm.synth import SyntheticMeter, meter_address, capture_frames
+
+################################################################################
+################################################################################
+
+TIME_PER_SAMPLE = 0.083
+
+# Baseline results are kept next to this script. Rates only compare on the
+# machine they were measured on, so there's none until one is saved there
+# with --save.
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark-baseline.json")
+
+################################################################################
+################################################################################
+
+# Each stage of the offline processor's pipeline, timed on its own. A stage
+# takes what the stage before it produced, and returns what it produces and
+# the number of frames or samples it went through.
+
+# Find the frames in the capture
+def stage_Scan(data):
+	view = buffer_view(data)
+	frames = [f for f in scan_frames(data, view, 0, len(data)) if f[1] >= 0]
+	return (frames, len(frames))
+
+# Sequence the frames into sample blocks
+def stage_Reassembly(data, frames):
+	view = buffer_view(data)
+	meters = MeterRegistry()
+	payloads = []
+	for (offset, frameLen) in frames:
+		frame = decode_frame(view, offset, frameLen)
+		if (frame.frame_type != API_RECEIVE_PACKET or frame.source is None):
+			continue
+		meter = meters.get(frame.source, frame.name)
+		payload = meter.assembler.add(frame.frame_id, frame.payload)
+		if (payload is not None):
+			payloads.append((meter.address, payload))
+	return (payloads, len(frames))
+
+# Decode the ASCII hex sample blocks
+def stage_Decode(payloads):
+	blocks = []
+	for (address, payload) in payloads:
+		block = decode_samples(payload)
+		if (block is not None):
+			blocks.append((address, block))
+	return (blocks, sum([len(block.samples) for (address, block) in blocks]))
+
+# Check the sample block checksums
+def stage_CRC(blocks):
+	good = [(address, block) for (address, block) in blocks if block.checksum_ok()]
+	return (good, sum([len(block.samples) for (address, block) in good]))
+
+# Format the samples as the processor's text output
+def stage_Text(blocks):
+	size = 0
+	for (address, block) in blocks:
+		timestamps = sample_times(block.timestamp, len(block.samples), TIME_PER_SAMPLE)
+		voltages = adc_volts(block.samples)
+		size += len(format_samples(timestamps, voltages, address))
+	return (size, sum([len(block.samples) for (address, block) in blocks]))
+
+# Write the samples as the processor's binary output
+def stage_Binary(blocks):
+	directory = tempfile.mkdtemp(prefix="wpm-benchmark-")
+	try:
+		store = ColumnStore(directory, TIME_PER_SAMPLE, ADC_SCALING)
+		for (address, block) in blocks:
+			store.write(address, sample_times(block.timestamp, len(block.samples), TIME_PER_SAMPLE), block.samples)
+		store.close()
+	finally:
+		shutil.rmtree(directory)
+	return (None, sum([len(block.samples) for (address, block) in blocks]))
+
+# Stage name, the unit its rate is measured in, and how to run it given the
+# capture and the output of every stage before it
+STAGES = [
+	("scan", "frames", lambda data, out: stage_Scan(data)),
+	("reassembly", "frames", lambda data, out: stage_Reassembly(data, out["scan"])),
+	("decode", "samples", lambda data, out: stage_Decode(out["reassembly"])),
+	("crc", "samples", lambda data, out: stage_CRC(out["decode"])),
+	("text", "samples", lambda data, out: stage_Text(out["crc"])),
+	("binary", "samples", lambda data, out: stage_Binary(out["crc"])),
+]
+
+################################################################################
+################################################################################
+
+# Time every stage, keeping the best of repeat runs, and return the rate of
+# each in its unit per second
+def run_Stages(data, repeat):
+	results = {}
+	outputs = {}
+	for (name, unit, run) in STAGES:
+		best = None
+		for i in range(repeat):
+			start = time.time()
+			output, count = run(data, outputs)
+			elapsed = time.time() - start
+			if (best is None or elapsed < best):
+				best = elapsed
+		outputs[name] = output
+		results[name] = {'unit': unit, 'count': count, 'seconds': best, 'rate': count / max(best, 1e-9)}
+	return results
+
+# Compare results to a baseline, returning the stages that got slower by more
+# than tolerance
+def compare_Results(results, baseline, tolerance):
+	regressions = []
+	print "%-12s %16s %16s %8s" % ("stage", "rate", "baseline", "change")
+	for (name, unit, run) in STAGES:
+		rate = results[name]['rate']
+		if (name not in baseline):
+			print "%-12s %12.0f %s/s %16s %8s" % (name, rate, unit[0], "-", "-")
+			continue
+		base = baseline[name]['rate']
+		change = rate / base - 1
+		flag = ""
+		if (change < -tolerance):
+			regressions.append(name)
+			flag = " REGRESSION"
+		print "%-12s %12.0f %s/s %12.0f %s/s %+7.1f%%%s" % (name, rate, unit[0], base, unit[0], 100*change, flag)
+	return regressions
+
+################################################################################
+################################################################################
+
+parser = argparse.ArgumentParser(description="Benchmark each stage of capture processing on a synthetic capture, against a stored baseline.")
+parser.add_argument("-m", "--meters", type=int, default=20, help="number of meters in the capture (default: %(default)s)")
+parser.add_argument("-b", "--blocks", type=int, default=50, help="sample blocks per meter (default: %(default)s)")
+parser.add_argument("--corrupt", type=float, default=0.01, help="fraction of frames with a flipped bit (default: %(default)s)")
+parser.add_argument("--loss", type=float, default=0.01, help="fraction of frames lost (default: %(default)s)")
+parser.add_argument("-r", "--repeat", type=int, default=10, help="runs of each stage, the best is kept (default: %(default)s)")
+parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline results to compare against, saved on this machine with --save (default: %(default)s)")
+parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+parser.add_argument("--tolerance", type=float, default=0.25, help="slowdown from the baseline that counts as a regression (default: %(default)s)")
+args = parser.parse_args()
+
+# Generate the capture, the same every run
+meters = [SyntheticMeter(meter_address(n), seed=n) for n in range(args.meters)]
+data = b"".join(capture_frames(meters, args.blocks, args.corrupt, args.loss))
+capture = {'meters': args.meters, 'blocks': args.blocks, 'corrupt': args.corrupt, 'loss': args.loss, 'bytes': len(data)}
+print "Capture: %d meters, %d blocks each, %d bytes" % (args.meters, args.blocks, len(data))
+
+results = run_Stages(data, args.repeat)
+
+# Compare against the baseline, if we have one for the same capture
+regressions = []
+baseline = None
+if (os.path.exists(args.baseline)):
+	f = open(args.baseline)
+	baseline = json.load(f)
+	f.close()
+	if (baseline['capture'] != capture):
+		print "Baseline %s is for a different capture, not comparing" % args.baseline
+		baseline = None
+if (baseline is not None):
+	regressions = compare_Results(results, baseline['results'], args.tolerance)
+else:
+	compare_Results(results, {}, args.tolerance)
+
+if (args.save):
+	f = open(args.baseline, "w")
+	json.dump({'capture': capture, 'results': results}, f, indent=1, sort_keys=True)
+	f.close()
+	print "Saved baseline to %s" % args.baseline
+
+if (len(regressions) > 0):
+	print "Slower than the baseline: %s" % ", ".join(regressions)
+	sys.exit(1)
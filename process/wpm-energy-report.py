@@ -0,0 +1,25 @@
+import sys
+import time
+import argparse
+from wpm.energy import load_checkpoint
+
+################################################################################
+################################################################################
+
+parser = argparse.ArgumentParser(description="Report every meter's energy from an energy checkpoint.")
+parser.add_argument("checkpoint", help="energy checkpoint file written by wpm-zigbee-process.py --energy")
+args = parser.parse_args()
+
+try:
+	meters = load_checkpoint(args.checkpoint)
+except (IOError, ValueError) as (strError):
+	print "Error reading checkpoint: %s" % strError
+	sys.exit(1)
+
+print "%-16s %12s %10s %9s %6s %10s  %s" % ("meter", "energy kWh", "hours", "readings", "gaps", "gap hours", "last reading")
+for address in sorted(meters.keys()):
+	meter = meters[address]
+	updated = "-"
+	if (meter.updated is not None):
+		updated = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(meter.updated))
+	print "%-16s %12.6f %10.3f %9d %6d %10.3f  %s" % (address, meter.energy / 1000., meter.covered / 3600000., meter.readings, meter.gaps, meter.gap_time / 3600000., updated)
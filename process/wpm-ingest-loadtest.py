@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from wpm.ingest import IngestLoop
+from wpm.synth import SyntheticMeter, meter_address
+
+################################################################################
+################################################################################
+
+# Load test for the ingest loop: simulated meters send sample blocks to ptys
+# from writer processes, one per port, while this process ingests all the
+# ports on one thread and reports whether it kept up and what CPU it used.
+
+################################################################################
+################################################################################
+
+# Writes the sample blocks of a port's meters to its pty, each meter sending
+# one block every interval milliseconds, staggered across the interval
+def write_Port(fd, meterIDs, blocks, interval):
+	meters = [SyntheticMeter(meter_address(n), interval=interval, seed=n) for n in meterIDs]
+	start = time.time()
+	schedule = []
+	for (i, meter) in enumerate(meters):
+		offset = (interval/1000.) * i / len(meters)
+		schedule.extend([(offset + k*interval/1000., i) for k in range(blocks)])
+	schedule.sort()
+
+	for (due, i) in schedule:
+		delay = start + due - time.time()
+		if (delay > 0):
+			time.sleep(delay)
+		data = b"".join(meters[i].next_block()[2])
+		while (len(data) > 0):
+			data = data[os.write(fd, data):]
+
+	# A pty drops whatever hasn't been read yet when its master closes, so
+	# give the ingest loop time to catch up first
+	time.sleep(1.0)
+	os.close(fd)
+
+################################################################################
+################################################################################
+
+parser = argparse.ArgumentParser(description="Load test the ingest loop with simulated meters on ptys.")
+parser.add_argument("-m", "--meters", type=int, default=300, help="number of simulated meters (default: %(default)s)")
+parser.add_argument("-p", "--ports", type=int, default=4, help="number of ports the meters are spread over (default: %(default)s)")
+parser.add_argument("-d", "--duration", type=float, default=10.0, help="seconds to send sample blocks for (default: %(default)s)")
+parser.add_argument("-i", "--interval", type=int, default=1000, help="milliseconds between each meter's sample blocks (default: %(default)s)")
+args = parser.parse_args()
+
+blocks = max(1, int(args.duration * 1000 / args.interval))
+
+# Count the blocks received, and when the last one was
+received = [0]
+lastBlock = [0]
+def count_Block(port, meter, block):
+	received[0] += 1
+	lastBlock[0] = time.time()
+
+ingest = IngestLoop(count_Block)
+
+# Open a pty for each port, the ingest loop reads the slave end and a writer
+# process the master end
+masters = []
+for p in range(args.ports):
+	master, slave = os.openpty()
+	ingest.add_port(os.ttyname(slave))
+	os.close(slave)
+	masters.append(master)
+
+writers = []
+for p in range(args.ports):
+	writer = multiprocessing.Process(target=write_Port, args=(masters[p], range(p, args.meters, args.ports), blocks, args.interval))
+	writer.start()
+	writers.append(writer)
+for master in masters:
+	os.close(master)
+
+startTimes = os.times()
+start = time.time()
+
+# Run until every writer is done and its port has closed
+ingest.run()
+
+endTimes = os.times()
+elapsed = lastBlock[0] - start
+cpu = (endTimes[0] - startTimes[0]) + (endTimes[1] - startTimes[1])
+for writer in writers:
+	writer.join()
+
+expected = blocks * args.meters
+meters = ingest.meters()
+totalBytes = sum([port.bytes for port in ingest.closed])
+print "%d meters on %d ports, a block every %d ms each, for %.1f seconds" % (args.meters, args.ports, args.interval, blocks * args.interval / 1000.)
+print "Meters seen: %d" % len(meters)
+print "Blocks: %d of %d received (%d bad, %d incomplete, %d evicted)" % (received[0], expected, sum([m.bad_blocks for m in meters]), sum([m.assembler.incomplete for m in meters]), sum([m.assembler.evicted for m in meters]))
+print "Ingested %d bytes in %.3f seconds (%.2f MB/s, %.1f blocks/s)" % (totalBytes, elapsed, totalBytes / elapsed / 1e6, received[0] / elapsed)
+print "Ingest CPU time: %.3f seconds (%.1f%% of one core)" % (cpu, 100. * cpu / elapsed)
+
+if (received[0] != expected):
+	sys.exit(1)
@@ -0,0 +1,143 @@
+import os
+import sys
+import tty
+import time
+import errno
+import fcntl
+import signal
+import argparse
+import multiprocessing
+from wpm.synth import SyntheticMeter, meter_address, trace_wave, CURRENT_TRACES, SAMPLES_PER_BLOCK, SAMPLES_PER_BLOCK_TRANSPARENT
+
+################################################################################
+################################################################################
+
+# A network of virtual meters on pseudo-terminals. Each pty stands in for a
+# coordinator's serial port: the live scripts open the printed device (or the
+# --link name) as if it were one, and get the sample blocks of the recorded
+# traces in data/, as API frames from many meters or as a transparent mode
+# meter's raw blocks.
+#
+# The simulator keeps every pty's slave end open, so scripts can come and go
+# without the pty hanging up. Like a coordinator's UART, it doesn't wait for a
+# script that isn't keeping up: blocks that don't fit in the pty are dropped
+# and counted.
+
+################################################################################
+################################################################################
+
+# Sends the sample blocks of a port's meters to its pty until stop is set or
+# duration seconds have passed, each meter sending one block every interval
+# milliseconds, staggered across the interval
+def write_Port(fd, path, meters, interval, duration, stop):
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+	start = time.time()
+	period = interval / 1000.
+	sent = 0
+	dropped = 0
+	sentBytes = 0
+	k = 0
+	while (not stop.is_set()):
+		if (duration is not None and k * period >= duration):
+			break
+		for (i, meter) in enumerate(meters):
+			delay = start + k*period + period * i / len(meters) - time.time()
+			if (delay > 0):
+				if (stop.wait(delay)):
+					break
+			data = b"".join(meter.next_block()[2])
+			try:
+				written = os.write(fd, data)
+			except OSError as (e):
+				if (e.errno != errno.EAGAIN):
+					raise
+				written = 0
+			sentBytes += written
+			if (written == len(data)):
+				sent += 1
+			else:
+				dropped += 1
+		k += 1
+
+	elapsed = time.time() - start
+	print "%s: %d blocks sent, %d dropped, %d bytes in %.1f seconds (%.1f kB/s)" % (path, sent, dropped, sentBytes, elapsed, sentBytes / max(elapsed, 1e-9) / 1000.)
+	sys.stdout.flush()
+	os.close(fd)
+
+# A simple sigint handler to stop the writers
+def sigint_handler(signal, frame):
+	stop.set()
+
+################################################################################
+################################################################################
+
+parser = argparse.ArgumentParser(description="Simulate meters on pseudo-terminals that the live scripts can open as serial ports.")
+parser.add_argument("-m", "--meters", type=int, default=10, help="number of meters on each port (default: %(default)s)")
+parser.add_argument("-p", "--ports", type=int, default=1, help="number of ptys (default: %(default)s)")
+parser.add_argument("-i", "--interval", type=int, default=1000, help="milliseconds between each meter's sample blocks (default: %(default)s)")
+parser.add_argument("-d", "--duration", type=float, help="seconds to send for (default: until interrupted)")
+parser.add_argument("--mode", choices=["api", "transparent"], default="api", help="send API frames, or raw sample blocks like a meter in transparent mode (default: %(default)s)")
+parser.add_argument("--load", choices=sorted(CURRENT_TRACES.keys()), help="current trace every meter sends (default: the traces in turn)")
+parser.add_argument("--noise", type=int, default=2, help="most ADC codes of noise added to each sample (default: %(default)s)")
+parser.add_argument("--link", help="also make symlinks to the ptys, LINK for one port or LINK0, LINK1, ... for more")
+parser.add_argument("--seed", type=int, default=0, help="random seed (default: %(default)s)")
+args = parser.parse_args()
+
+loads = sorted(CURRENT_TRACES.keys())
+if (args.load is not None):
+	loads = [args.load]
+waves = dict([(load, trace_wave(load)) for load in loads])
+
+# Open a pty for each port, in raw mode so nothing is echoed or line buffered
+# before a script opens it
+ports = []
+for p in range(args.ports):
+	master, slave = os.openpty()
+	tty.setraw(slave)
+	path = os.ttyname(slave)
+	if (args.link is not None):
+		link = args.link
+		if (args.ports > 1):
+			link = "%s%d" % (args.link, p)
+		if (os.path.islink(link)):
+			os.unlink(link)
+		os.symlink(path, link)
+		path = link
+	ports.append((master, slave, path))
+
+# The meters of each port, starting at random points in their traces
+stop = multiprocessing.Event()
+writers = []
+for (p, (master, slave, path)) in enumerate(ports):
+	meters = []
+	for i in range(args.meters):
+		n = p*args.meters + i
+		if (args.mode == "api"):
+			meter = SyntheticMeter(meter_address(n), SAMPLES_PER_BLOCK, args.interval, args.seed + n, waves[loads[n % len(loads)]], args.noise)
+		else:
+			meter = SyntheticMeter(None, SAMPLES_PER_BLOCK_TRANSPARENT, args.interval, args.seed + n, waves[loads[n % len(loads)]], args.noise)
+		# Keep the current and voltage channels in step
+		meter.position = 2 * meter.rng.randint(0, len(meter.wave) // 2)
+		meters.append(meter)
+
+	writer = multiprocessing.Process(target=write_Port, args=(master, path, meters, args.interval, args.duration, stop))
+	writer.start()
+	writers.append(writer)
+	os.close(master)
+	print "%s: %d meters, %s mode, a block every %d ms each" % (path, args.meters, args.mode, args.interval)
+sys.stdout.flush()
+
+# Set up our signal handler
+signal.signal(signal.SIGINT, sigint_handler)
+
+# Wait for the writers, waking up for signals now and then
+while (any([writer.is_alive() for writer in writers])):
+	for writer in writers:
+		writer.join(0.5)
+
+for (master, slave, path) in ports:
+	os.close(slave)
+	if (args.link is not None):
+		os.unlink(path)
@@ -0,0 +1,42 @@
+import sys
+import time
+import argparse
+from wpm.textindex import build_index, open_index, INDEX_EVERY
+
+################################################################################
+################################################################################
+
+parser = argparse.ArgumentParser(description="Print a meter's samples between two timestamps from a text sample file, using (and building if needed) its index.")
+parser.add_argument("input", help="text output of wpm-uart-process.py, wpm-zigbee-datalog.py or a --split file")
+parser.add_argument("meter", nargs="?", help="meter address (not needed for files of a single meter)")
+parser.add_argument("--start", type=float, help="first timestamp, in milliseconds of device time")
+parser.add_argument("--end", type=float, help="last timestamp, in milliseconds of device time")
+parser.add_argument("--build", action="store_true", help="rebuild the index even if it's up to date")
+parser.add_argument("--every", type=int, default=INDEX_EVERY, help="samples of each meter between index entries, when building (default: %(default)s)")
+parser.add_argument("--list", action="store_true", help="list the meters in the file and stop")
+args = parser.parse_args()
+
+# Open the index, building it if there isn't an up to date one
+try:
+	index = None
+	if (not args.build):
+		index = open_index(args.input)
+	if (index is None):
+		startTime = time.time()
+		index = build_index(args.input, args.every)
+		sys.stderr.write("Indexed %s: %d bytes, %d meters, %d entries in %.3f seconds\n" % (args.input, index.size, len(index.meters), len(index.entries), time.time() - startTime))
+except (IOError, OSError, ValueError) as (strError):
+	print "Error indexing file: %s" % strError
+	sys.exit(1)
+
+if (args.list):
+	for address in index.meters:
+		print address
+	sys.exit(0)
+
+if (index.addressed and args.meter is None):
+	print "The file has samples from %d meters, give one of them (see --list)" % len(index.meters)
+	sys.exit(1)
+
+for line in index.query(args.meter, args.start, args.end):
+	sys.stdout.write(line)
@@ -0,0 +1,51 @@
+import sys
+import time
+import argparse
+from wpm.rollups import read_rollups, rollup_meters, bucket_range, RESOLUTIONS
+
+################################################################################
+################################################################################
+
+# Times on the command line, in local time
+TIME_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"]
+
+################################################################################
+################################################################################
+
+# Parse a local time from the command line into seconds since the epoch
+def parse_Time(text):
+	for timeFormat in TIME_FORMATS:
+		try:
+			return time.mktime(time.strptime(text, timeFormat))
+		except ValueError:
+			pass
+	raise argparse.ArgumentTypeError("not a time: %r (expected YYYY-MM-DD [HH:MM[:SS]])" % text)
+
+################################################################################
+################################################################################
+
+parser = argparse.ArgumentParser(description="Report meter power and energy from the rollups, without touching the sample data.")
+parser.add_argument("rollups", help="rollup directory written by wpm-zigbee-process.py")
+parser.add_argument("meters", nargs="*", help="meter addresses to report (default: all of them)")
+parser.add_argument("-r", "--resolution", choices=[name for (name, length) in RESOLUTIONS], default="hour", help="bucket size (default: %(default)s)")
+parser.add_argument("--start", type=parse_Time, help="first local time to report, YYYY-MM-DD [HH:MM[:SS]]")
+parser.add_argument("--end", type=parse_Time, help="local time to report up to")
+parser.add_argument("--total", action="store_true", help="only print each meter's totals over the range")
+args = parser.parse_args()
+
+meters = args.meters
+if (len(meters) == 0):
+	meters = rollup_meters(args.rollups)
+
+for address in meters:
+	buckets = bucket_range(read_rollups(args.rollups, address, args.resolution), args.start, args.end)
+	count = buckets['count'].sum()
+	energy = buckets['energy'].sum()
+
+	print "%s: %d %s buckets, %d readings, %.6f kWh" % (address, len(buckets), args.resolution, count, energy / 1000.)
+	if (args.total or len(buckets) == 0):
+		continue
+	print "%-19s %8s %10s %10s %10s %12s" % ("start", "readings", "mean W", "min W", "max W", "energy Wh")
+	for bucket in buckets:
+		print "%-19s %8d %10.2f %10.2f %10.2f %12.3f" % (time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(bucket['start'])), bucket['count'], bucket['mean'], bucket['min'], bucket['max'], bucket['energy'])
+	print
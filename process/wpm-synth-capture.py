@@ -0,0 +1,36 @@
+import sys
+import argparse
+from wpm.synth import SyntheticMeter, meter_address, capture_frames, WAVEFORMS, SAMPLES_PER_BLOCK
+
+################################################################################
+################################################################################
+
+parser = argparse.ArgumentParser(description="Generate a raw XBee API capture from simulated meters, encoded the way the firmware sends sample blocks.")
+parser.add_argument("output", help="capture file to write, in the format of wpm-uart-datalog.py")
+parser.add_argument("-m", "--meters", type=int, default=5, help="number of meters (default: %(default)s)")
+parser.add_argument("-b", "--blocks", type=int, default=100, help="sample blocks per meter (default: %(default)s)")
+parser.add_argument("-s", "--samples", type=int, default=SAMPLES_PER_BLOCK, help="samples per block (default: %(default)s)")
+parser.add_argument("-w", "--waveform", choices=sorted(WAVEFORMS.keys()), default="sine", help="sample content (default: %(default)s)")
+parser.add_argument("--noise", type=int, default=2, help="most ADC codes of noise added to each sample (default: %(default)s)")
+parser.add_argument("--corrupt", type=float, default=0.0, help="fraction of frames with a flipped bit (default: %(default)s)")
+parser.add_argument("--loss", type=float, default=0.0, help="fraction of frames lost (default: %(default)s)")
+parser.add_argument("--seed", type=int, default=0, help="random seed, the same seed gives the same capture (default: %(default)s)")
+args = parser.parse_args()
+
+# Open our capture file
+try:
+	outputFile = open(args.output, "wb")
+except IOError as (strError):
+	print "Error opening file: %s" % strError
+	sys.exit(1)
+
+meters = [SyntheticMeter(meter_address(n), args.samples, seed=args.seed*args.meters + n, waveform=args.waveform, noise=args.noise) for n in range(args.meters)]
+
+written = 0
+for frame in capture_frames(meters, args.blocks, args.corrupt, args.loss, args.seed):
+	outputFile.write(frame)
+	written += len(frame)
+
+outputFile.close()
+
+print "Wrote %d blocks from %d meters, %d bytes" % (args.blocks * args.meters, args.meters, written)
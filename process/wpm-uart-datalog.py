@@ -3,46 +3,77 @@ import time
 import struct
 import serial
 import signal
+import argparse
+from wpm.capture import CaptureWriter, BUFFER_SIZE, FLUSH_INTERVAL
+from wpm.metrics import Histogram
+from wpm.profiling import add_profile_arguments, start_profiling
 
 ################################################################################
 ################################################################################
 
-# A simple sigint handler to stop the reading
-def sigint_handler(signal, frame):
-	dataFile.close()
-	sp.close()
-	sys.exit(0)
+# Time spent reading (waiting included) and writing, for --profile
+stages = Histogram("wpm_stage_seconds", "Seconds spent in each processing stage.", "stage")
+
+# Set by sigint to stop recording
+stopRecording = False
 
 ################################################################################
 ################################################################################
 
-# Check for minimum arguments
-if (len(sys.argv) < 3):
-	print "Usage: %s <serial port> <output file>" % sys.argv[0]
-	sys.exit(1)
+# A sigint handler that stops the reading after the current read, so the
+# capture is flushed and closed once, never from inside a flush
+def sigint_stop_handler(signal, frame):
+	global stopRecording
+	stopRecording = True
 
-# Open our data file
-try:
-	dataFile = open(sys.argv[2], "w")
-except IOError as (strError):
-	print "Error opening file: %s" % strError
+################################################################################
+################################################################################
+
+parser = argparse.ArgumentParser(description="Record the raw data from an XBee coordinator's serial port.")
+parser.add_argument("port", help="serial port of the coordinator")
+parser.add_argument("output", help="capture file to write, with a sidecar index of receive times at <output>.idx")
+parser.add_argument("--buffer", type=int, default=BUFFER_SIZE, help="bytes buffered before writing (default: %(default)s)")
+parser.add_argument("--flush", type=float, default=FLUSH_INTERVAL, help="most seconds data is buffered for (default: %(default)s)")
+parser.add_argument("--rotate-size", type=int, help="start a new capture file after this many bytes")
+parser.add_argument("--rotate-hourly", action="store_true", help="start a new capture file every hour")
+parser.add_argument("--append", action="store_true", help="append to the capture file instead of overwriting it")
+add_profile_arguments(parser)
+args = parser.parse_args()
+
+# Our capture file, named <output>.<UTC time opened> if it's rotated
+capture = CaptureWriter(args.output, args.buffer, args.flush, args.rotate_size, args.rotate_hourly, args.append)
 
 # Open the serial port
 try:
-	sp = serial.Serial(sys.argv[1], baudrate=9600, bytesize=8, parity='N', stopbits=1, timeout=1);
+	sp = serial.Serial(args.port, baudrate=9600, bytesize=8, parity='N', stopbits=1, timeout=1);
 except serial.SerialException as (strError):
 	print "Error opening serial port!: ", strError
 	sys.exit(1)
 
-# Set up our signal handler
-signal.signal(signal.SIGINT, sigint_handler)
+# Set up our signal handler and profiling
+signal.signal(signal.SIGINT, sigint_stop_handler)
+start_profiling(args, stages)
 
-while True:
+while not stopRecording:
 	# Read raw data from the serial port
+	t0 = time.time()
 	rawData = sp.read(128)
-	# Write to the data file
-	if (len(rawData) > 0):
-		dataFile.write(rawData)
-		dataFile.flush()
-
+	t1 = time.time()
+	stages.observe(t1 - t0, "read")
+	# Write to the capture, which writes it out now and then
+	try:
+		if (len(rawData) > 0):
+			capture.write(rawData)
+		else:
+			capture.poll()
+		stages.observe(time.time() - t1, "write")
+	except IOError as (strError):
+		print "Error writing capture: %s" % strError
+		sys.exit(1)
 
+try:
+	capture.close()
+except IOError as (strError):
+	print "Error writing capture: %s" % strError
+	sys.exit(1)
+sp.close()
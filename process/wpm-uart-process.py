@@ -1,52 +1,70 @@
+import os
 import sys
+import mmap
+import stat
 import time
 import signal
+import socket
 import struct
 import serial
 import threading
+import argparse
+import multiprocessing
+import numpy
+from wpm.xbee import APIFrameDecoder, API_RECEIVE_PACKET, buffer_view, scan_frames, decode_frame
+from wpm.samples import decode_samples, sample_times
+from wpm.calibration import adc_volts, ADC_SCALING
+from wpm.columns import ColumnStore
+from wpm.textout import format_samples, TextWriter, SplitTextWriter
+from wpm.shards import split_shards, scan_shard, merge_shards
+from wpm.meters import MeterRegistry
+from wpm.statefile import save_state, load_state
+from wpm.metrics import Metrics, pipeline_collector, export_metrics
+from wpm.profiling import add_profile_arguments, start_profiling
 
 ################################################################################
 ################################################################################
 
 TIME_PER_SAMPLE = 0.083
 
+# Number of capture shards per worker process, and the number of sample
+# blocks handed to the workers at a time, with --jobs
+SHARDS_PER_JOB = 4
+BLOCK_BATCH = 2048
+
+# Seconds between saving the decoder state while following a capture with
+# --state
+STATE_INTERVAL = 30.0
+
 ################################################################################
 ################################################################################
 
-# Timestamp ascii hex characters
-timestamp_str = ''
-# Timestamp converted to a number
-timestamp = 0
-
-# Sample data ascii hex characters
-number_str = ''
-# Sample data converted to a number
-data = 0
-# Adjusted sample data to voltage
-voltage = 0
-
-# Checksum ascii hex characters
-checksum_str = ''
-# Checksum data converted to a number
-sample_checksum = -1
-# Locally computed checksum on the data
-local_checksum = 0
-
-# Zigbee permanent addresses list
-paList = []
-# Map of data bytes corresponding to zigbee permanent address list
-dataMapList = []
-# Fully assembled sample data buffer list
-sampleDataList = []
+# Zigbee devices we've seen, keyed by their permanent addresses
+meters = MeterRegistry()
 
 # Index of the last current meter processed
 last_processed_index = -1
 
-# Formatted sample data
-print_buffer = ''
+# Streaming API frame decoder for the input data, whose frame statistics
+# count the frames of the mapped capture too
+frameDecoder = APIFrameDecoder()
+
+# Bytes of the capture processed so far
+processedBytes = 0
+
+# Processing statistics, served with --metrics-port and dumped on SIGUSR1
+metrics = Metrics()
+stages = metrics.histogram("wpm_stage_seconds", "Seconds spent in each processing stage: decoding a sample block, and writing it out.", "stage")
+
+# Assembled sample blocks waiting for the worker processes, with --jobs
+blockQueue = None
+
+# The capture as mapped in a worker process, with --jobs
+workerData = None
+workerView = None
 
-# Yet to be processed serial port data
-unprocessedData = ''
+# Set by sigint to stop processing at the next frame, with --follow or --state
+stopProcessing = False
 
 # A simple sigint handler to stop the reading thread
 def sigint_handler(signal, frame):
@@ -54,317 +72,333 @@ def sigint_handler(signal, frame):
 	outputFile.close()
 	sys.exit(0)
 
-# Perform a CRC16 on 8-bit data blocks with a 16-bit seed
-def crc16_bits(data, seed):
-	feedback = 0
-
-	# Keep our variables bound to 8/16 bits
-	data = data & 0xFF
-	seed = seed & 0xFFFF
-
-	# CRC16 Algorithm
-	for i in range(8):
-		feedback = ((data>>7) ^ (seed>>15)) & 0x1
-		if (feedback == 0):
-			seed <<= 1
-			seed = seed & 0xFFFF
-		else:
-			seed ^= (0x10 | 0x800)
-			seed <<= 1
-			seed |= 0x01
-			seed = seed & 0xFFFF
-		data <<= 1
-		data = data & 0xFF
-
-	return seed
-
-# Parses the actual assembled sample data
-def parse_Samples(index):
-	global timestamp_str, timestamp, timeindex, checksum_str, sample_checksum, number_str, data, voltage, last_processed_index, print_buffer
-
-	# Ensure that we have both packet start and packet ends
-	if (sampleDataList[index].find('T') < 0 or sampleDataList[index].find('Z') < 0):
-		sampleDataList[index] = ''
+# A sigint handler that stops processing between frames, so the decoder state
+# can be saved
+def sigint_stop_handler(signal, frame):
+	global stopProcessing
+	stopProcessing = True
+
+# Decodes an assembled block of sample data from a meter into what we write
+# to our output, or None if the block is unusable
+def decode_Block(address, payload):
+	# Decode the whole block of samples
+	block = decode_samples(payload)
+
+	# Only output the samples if our local checksum matches
+	if (block is None or not block.checksum_ok()):
+		return None
+
+	timestamps = sample_times(block.timestamp, len(block.samples), TIME_PER_SAMPLE)
+	if (args.format == "binary"):
+		return (timestamps, block.samples)
+
+	# Scale the data to an actual voltage
+	voltages = adc_volts(block.samples)
+
+	# Format the samples with their timestamps, and their address unless
+	# each meter has its own file
+	if (args.split):
+		address = None
+	return format_samples(timestamps, voltages, address)
+
+# Writes a decoded block of samples from a meter to our output
+def write_Block(meter, output):
+	global last_processed_index
+
+	if (output is None):
+		meter.bad_blocks += 1
 		return -1
+	meter.blocks += 1
 
-	local_checksum = 0
-	state = -1
-	for rawData in sampleDataList[index]:
-		if (rawData == 'T'):
-			state = 1
-			print_buffer = ''
-			continue
-		elif (rawData == 'S' and state != -1):
-			state = 2
-			continue
-		elif ((rawData == 'X' or rawData == 'Y') and state != -1):
-			state = 3
-			continue
-		elif ((rawData == 'Z') and state != -1):
-			# Only print the buffer of samples if our local checksum
-			# matches
-			if (local_checksum == sample_checksum):
-				outputFile.write(print_buffer)
-				outputFile.flush()
-				print "New samples from %s!" % paList[index]
-				# Set our last processed index to this index
-				last_processed_index = index
-			break
-
-		# State: Timestamp Data
-		if (state == 1):
-			# Add the timestamp ascii hex character to our string
-			timestamp_str += rawData
-			# Convert the string once its reached its max length
-			if (len(timestamp_str) == 8):
-				try:
-					timestamp = int(timestamp_str, 16)
-				except ValueError:
-					return -1
-				# Calculate our local checksum based on all
-				# of the bytes of the timestamp number
-				local_checksum = crc16_bits((timestamp >> 24) & 0xFF, local_checksum)
-				local_checksum = crc16_bits((timestamp >> 16) & 0xFF, local_checksum)
-				local_checksum = crc16_bits((timestamp >> 8) & 0xFF, local_checksum)
-				local_checksum = crc16_bits(timestamp & 0xFF, local_checksum)
-				# Reset the timestamp string
-				timestamp_str = ''
-				state = 0
-
-		# State: Sample Data
-		if (state == 2):
-			# If our number string has reached max length or we
-			# encounter a comma
-			if (rawData == ',' or len(number_str) == 3):
-				# If we're not at the necessary length, reset
-				# the number string
-				if (len(number_str) != 3):
-					number_str = ''
-					continue
-
-				# Convert the number string to its actual data
-				try:
-					data = int(number_str, 16)
-				except ValueError:
-					return -1
-				# Run the data through our local checksum
-				local_checksum = crc16_bits((data >> 8) & 0xFF, local_checksum)
-				local_checksum = crc16_bits(data & 0xFF, local_checksum)
-				# Scale the data to an actual voltage
-				voltage = 5.0*(data/1024.)
-				# Add this sample to our print buffer
-				print_buffer += "%f %s %f\n" % (timestamp, paList[index], voltage)
-				# Increment our timestamp to align with our
-				# next sample
-				timestamp += TIME_PER_SAMPLE
-				# Reset the number string
-				number_str = ''
-			else:
-				# Append this ascii hex data to our number
-				# string
-				number_str += rawData
-
-		# State: Checksum Data
-		if (state == 3):
-			# Append this ascii hex data to our checksum string
-			checksum_str += rawData
-			# Make sure we haven't gone over the checksum string
-			# length
-			if (len(checksum_str) > 4):
-				# If so, reset the checksum_str and state
-				checksum_str = ''
-				state = 0
-			# If we've reached necessary length of our checksum
-			# string
-			elif (len(checksum_str) == 4):
-				# Convert the checksum ascii hex to a number
-				try:
-					sample_checksum = int(checksum_str, 16)
-				except ValueError:
-					return -1
-				# Reset the checksum string
-				checksum_str = ''
-				state = 0
-
-	sampleDataList[index] = ''
-	return 0
+	t0 = time.time()
+	if (args.format == "binary"):
+		meter.samples += len(output[1])
+		outputFile.write(meter.address, output[0], output[1])
+	else:
+		meter.samples += output.count("\n")
+		outputFile.write(meter.address, output)
+	stages.observe(time.time() - t0, "sink")
 
-# Parses API frame data and sequences the sample frame data
-def parse_Frame_Data(data, dataLen):
-	# Unpack the frame data into an array of databytes
-	dataBytes = struct.unpack(str(dataLen) + "B", data)
+	print "New samples from %s!" % meter.address
+	# Set our last processed index to this index
+	last_processed_index = meter.index
 
-	# Check that the frame data type is a Zigbee Receive Packet
-	if dataBytes[0] != 0x90:
-		return -1
+	return 0
 
-	# Check that the frame data contains the sample information we need
-	if dataLen < 13:
+# Parses the actual assembled sample data
+def parse_Samples(meter, payload):
+	# Ensure that we have both packet start and packet ends
+	if (payload.find('T') < 0 or payload.find('Z') < 0):
 		return -1
 
-	# Pull out the permanent and network addresses
-	permanentAddress = ""
-	for i in range(2, 10):
-		permanentAddress += "%02X" % dataBytes[i]
-
-	# (we don't actually use the network address for anything)
-	#networkAddress = "%02X%02X" % (dataBytes[10], dataBytes[11])
+	# Leave the decoding to the worker processes if we have them
+	if (blockQueue is not None):
+		blockQueue.append((meter, payload))
+		return 0
 
-	# Subtract the length of frame data type, frame id, permanent address,
-	# network address, and receive options byes -- essentially the header
-	dataLen -= (2+8+2+1)
+	t0 = time.time()
+	output = decode_Block(meter.address, payload)
+	stages.observe(time.time() - t0, "decode")
+	return write_Block(meter, output)
 
-	# Make sure we have actual data left over
-	if (dataLen <= 0):
+# Parses API frame data and sequences the sample frame data
+def parse_Frame_Data(frame):
+	# Check that the frame is a Zigbee Receive Packet with sample data
+	if (frame.frame_type != API_RECEIVE_PACKET or frame.source is None):
 		return -1
 
+	# Look up the device by its permanent address, adding it to our
+	# registry if it's new
+	meter = meters.get(frame.source, frame.name)
+	meter.frames += 1
+
 	# Extract the Frame ID
-	frameID = dataBytes[12]
+	frameID = frame.frame_id
 
-	# Check if we have this device in our permanent address list
-	try:
-		index = paList.index(permanentAddress)
-	except ValueError:
-		# Otherwise add the device to our list
-		paList.append(permanentAddress)
-		# Create a new data map for this device
-		dataMapList.append({})
-		# Create a new sample data buffer in our list
-		sampleDataList.append('')
-		index = len(paList)-1
-
-	# Extract the sample data
-	sampleData = data[13:(13+dataLen)]
-
-	print "Sample data from %s with frameID %d" % (permanentAddress, frameID)
-
-	# If we already have this frame in our data map, clear our data map
-	# before adding the frame data
-	if (dataMapList[index].has_key(frameID) == True):
-		dataMapList[index].clear()
-
-	# Add the sample data to our data map
-	dataMapList[index][frameID] = sampleData[:]
-
-	# Check if this packet is the end of the sample data
-	if (sampleData.find('Z') >= 0):
-		# Sort all of the keys in our data map
-		keys = dataMapList[index].keys()
-		keys.sort()
-		# Clear our sample buffer
-		sampleDataList[index] = ''
-		# Make sure the 0th key is the 0th frame ID
-		if (keys[0] == 0):
-			# Check that all other frame IDs follow in order, and
-			# assemble the sample buffer
-			for i in range(len(keys)):
-				# If they're out of order, clear the data map
-				if (keys[i] != i):
-					dataMapList[index].clear()
-					return -1
-				# Assemble the sample buffer
-				sampleDataList[index] += dataMapList[index][keys[i]]
-
-			# Clear the data map now that we're done with it
-			dataMapList[index].clear()
-			# The 0th key is the 0th frame ID and all other frame
-			# IDs follow in order, time to parse the sample data
-			parse_Samples(index)
-		else:
-			# If the 0th key is not the 0th frame ID
-			dataMapList[index].clear()
-			return -1
+	print "Sample data from %s with frameID %d" % (meter.address, frameID)
 
-	return 0
+	# Add the sample data to the meter's block, and parse the block once
+	# all of its frames are in
+	payload = meter.assembler.add(frameID, frame.payload)
+	if (payload is None):
+		return 0
+
+	return parse_Samples(meter, payload)
 
 # Parses API frames for the frame data
 def parse_API_Frame(data):
-	global unprocessedData
 	retVal = 0
 
-	dataLen = len(data)
-
-	# If we have unprocessed data from our last parsing attempt,
-	# insert it before out current data and adjust our data length
-	if (len(unprocessedData) > 0):
-		data = unprocessedData + data
-		dataLen += len(unprocessedData)
-		unprocessedData = ''
-
-	# Minimum length of frame: start, length MSB, length LSB, checksum
-	if dataLen < 4:
-		return -1
-
-	# Unpack the frame into an array of databytes
-	dataBytes = struct.unpack(str(dataLen) + "B", data)
-
-	for i in range(dataLen):
-		# Check for the start of an API frame
-		if dataBytes[i] == 0x7E:
-			# Check that the next two length bytes and at least
-			# the checksum byte exist, otherwise skip this frame
-			# (but save it for later in unprocessedData)
-			if dataLen < i+3:
-				unprocessedData += data[i:]
-				break
+	# Pass each complete frame along to our frame data parsing function
+	for frame in frameDecoder.feed(data):
+		retVal = parse_Frame_Data(frame)
+	return retVal
 
-			# Pull out the API frame length from the next two bytes
-			frameLen = dataBytes[i+1]<<8
-			frameLen += dataBytes[i+2]
+# Processes a whole capture file, returning the number of bytes processed
+def process_loop(inputFile):
+	global processedBytes
 
-			# Check that the frame actually contains this specified
-			# frame length, otherwise skip the frame
-			# (but save it for later in unprocessedData)
-			if dataLen < (i+3+frameLen+1):
-				unprocessedData += data[i:]
+	# Map the capture into memory and decode frames directly from it
+	try:
+		data = mmap.mmap(inputFile.fileno(), 0, access=mmap.ACCESS_READ)
+	except (mmap.error, ValueError):
+		# Pipes and empty files can't be mapped, stream those in
+		# large reads instead
+		processed = 0
+		while (True):
+			data = inputFile.read(1024*1024)
+			if (len(data) > 0):
+				parse_API_Frame(data)
+				processed += len(data)
+				processedBytes = processed
+			else:
 				break
+		return processed
 
-			# Calculate the checksum of the frame
-			checksum = 0
-			for j in range(i+3, i+3+frameLen+1):
-				checksum += dataBytes[j]
-				checksum = (checksum & 0xFF)
-
-			# Check for an invalid frame
-			if (checksum != 0xFF):
-				continue
-
-			# Extract the actual frame data
-			frameData = data[i+3 : i+3+frameLen]
-
-			# Pass it along to our frame data parsing function
-			retVal = parse_Frame_Data(frameData, frameLen)
-	return retVal
-
-def process_loop(dataRead):
-	dataCopy = ''
-	timeout = 0
-
-	while (True):
-		data = inputFile.read(255)
-		if (len(data) > 0):
-			parse_API_Frame(data)
-		else:
+	view = buffer_view(data)
+	for (offset, frameLen) in scan_frames(data, view, 0, len(data), frameDecoder.stats):
+		# The capture ended part way through a frame
+		if (frameLen < 0):
 			break
+		processedBytes = offset
+		parse_Frame_Data(decode_frame(view, offset, frameLen))
+
+	processedBytes = len(data)
+	return len(data)
+
+# Maps the capture in a worker process
+def init_Worker(path):
+	global workerData, workerView
+
+	# Leave interrupts, and --profile, to the main process
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	sys.setprofile(None)
+
+	f = open(path, "rb")
+	workerData = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	workerView = buffer_view(workerData)
+
+# Scans a shard of the capture for frames in a worker process
+def scan_Shard(shard):
+	return scan_shard(workerData, workerView, shard[0], shard[1])
+
+# Decodes an assembled sample block in a worker process
+def decode_Block_Worker(item):
+	return decode_Block(item[0], item[1])
+
+# Hands the queued sample blocks to the workers, and writes what they decode
+# to our output in the order the blocks were assembled
+def flush_Blocks(pool):
+	global blockQueue
+
+	items = blockQueue
+	blockQueue = []
+	outputs = pool.map(decode_Block_Worker, [(meter.address, payload) for (meter, payload) in items])
+	for ((meter, payload), output) in zip(items, outputs):
+		write_Block(meter, output)
+
+# Processes a whole capture file with a pool of worker processes, returning
+# the number of bytes processed. The workers scan shards of the capture for
+# frames, the frames are sequenced into sample blocks here in capture order,
+# and the workers decode the blocks, so the output is the same as
+# process_loop()'s.
+def process_parallel(inputFile, jobs):
+	global blockQueue, processedBytes
 
-
-# Check for minimum arguments
-if (len(sys.argv) < 3):
-	print "Usage: %s <input file> <output file>" % sys.argv[0]
-	sys.exit(1)
+	try:
+		data = mmap.mmap(inputFile.fileno(), 0, access=mmap.ACCESS_READ)
+	except (mmap.error, ValueError):
+		# Captures we can't map have to be streamed in serially
+		return process_loop(inputFile)
+	view = buffer_view(data)
+
+	pool = multiprocessing.Pool(jobs, init_Worker, (args.input,))
+
+	# Find the frames in each shard of the capture
+	shards = split_shards(len(data), jobs*SHARDS_PER_JOB)
+	results = pool.map(scan_Shard, shards)
+
+	# Sequence the frames, decoding the sample blocks in batches
+	blockQueue = []
+	for (offset, frameLen) in merge_shards(data, view, shards, results):
+		frameDecoder.stats.frames += 1
+		processedBytes = offset
+		parse_Frame_Data(decode_frame(view, offset, frameLen))
+		if (len(blockQueue) >= BLOCK_BATCH):
+			flush_Blocks(pool)
+	flush_Blocks(pool)
+	processedBytes = len(data)
+
+	pool.close()
+	pool.join()
+
+	return len(data)
+
+# Processes the capture from byte offset on, as far as it goes right now.
+# Returns the offset processing got up to: the end of the capture, or the
+# start of the frame it ends part way through or sigint stopped at.
+def process_from(inputFile, offset):
+	global processedBytes
+
+	if (os.fstat(inputFile.fileno()).st_size <= offset):
+		return offset
+	data = mmap.mmap(inputFile.fileno(), 0, access=mmap.ACCESS_READ)
+	view = buffer_view(data)
+
+	for (frameOffset, frameLen) in scan_frames(data, view, offset, len(data), frameDecoder.stats):
+		# The capture ends part way through this frame, for now
+		if (frameLen < 0 or stopProcessing):
+			return frameOffset
+		processedBytes = frameOffset
+		parse_Frame_Data(decode_frame(view, frameOffset, frameLen))
+
+	processedBytes = len(data)
+	return len(data)
+
+# Saves where processing got up to in the capture and the state of every
+# meter, after writing out everything decoded before it
+def save_State(offset):
+	outputFile.flush()
+	save_state(args.state, {
+		'input': os.path.abspath(args.input),
+		'offset': offset,
+		'meters': meters.save(),
+	})
+
+# Processes a capture from byte offset on, returning the offset it got up to.
+# With --follow it keeps processing data as it's appended to the capture
+# until sigint, saving the decoder state now and then if there's a --state.
+def process_resumable(inputFile, offset):
+	lastSave = time.time()
+	while (True):
+		offset = process_from(inputFile, offset)
+		if (not args.follow or stopProcessing):
+			return offset
+
+		if (args.state is not None and time.time() - lastSave >= STATE_INTERVAL):
+			save_State(offset)
+			lastSave = time.time()
+		time.sleep(args.poll)
+
+# The capture's pipeline, for the metrics
+def metrics_Sources():
+	return [({'input': args.input}, processedBytes, frameDecoder.stats, meters)]
+
+parser = argparse.ArgumentParser(description="Process a raw XBee API capture into timestamped samples.")
+parser.add_argument("input", help="raw capture file from wpm-uart-datalog.py")
+parser.add_argument("output", help="output file, or output directory for the binary format and --split")
+parser.add_argument("--format", choices=["text", "binary"], default="text", help="text lines of \"timestamp address voltage\", or a directory per meter of binary timestamp and ADC code columns (default: text)")
+parser.add_argument("--split", action="store_true", help="write text to a file per meter in the output directory, <address>.dat, without the address column")
+parser.add_argument("-j", "--jobs", type=int, default=1, help="number of worker processes to split the capture across (default: 1)")
+parser.add_argument("--follow", action="store_true", help="keep processing data as it's appended to the capture, until interrupted")
+parser.add_argument("--poll", type=float, default=1.0, help="seconds between checking for new data with --follow (default: %(default)s)")
+parser.add_argument("--state", help="file to save where processing stopped in, and resume from (appending to the output) if it exists")
+parser.add_argument("--metrics-port", type=int, help="serve metrics in the Prometheus text format on http://127.0.0.1:PORT/metrics while processing (they're also dumped to stderr on SIGUSR1)")
+add_profile_arguments(parser)
+args = parser.parse_args()
+start_profiling(args, stages)
+
+if (args.jobs > 1 and (args.follow or args.state is not None)):
+	parser.error("--follow and --state process the capture serially, without --jobs")
+if ((args.follow or args.state is not None) and os.path.exists(args.input) and not stat.S_ISREG(os.stat(args.input).st_mode)):
+	parser.error("--follow and --state need a capture file, not a pipe or device")
+
+# Resume from where the last run stopped
+startOffset = 0
+resuming = False
+if (args.state is not None and os.path.exists(args.state)):
+	try:
+		state = load_state(args.state)
+	except (IOError, ValueError) as (strError):
+		print "Error reading state file: %s" % strError
+		sys.exit(1)
+	if (state['input'] != os.path.abspath(args.input) or os.path.getsize(args.input) < state['offset']):
+		print "State file %s is for a different capture than %s" % (args.state, args.input)
+		sys.exit(1)
+	startOffset = state['offset']
+	meters.restore(state['meters'])
+	resuming = True
+	print "Resuming %s at byte %d with %d meters" % (args.input, startOffset, len(meters))
 
 # Open our data file
 try:
-	inputFile = open(sys.argv[1], "r")
-	outputFile = open(sys.argv[2], "w")
-except IOError as (strError):
+	inputFile = open(args.input, "r")
+	if (args.format == "binary"):
+		outputFile = ColumnStore(args.output, TIME_PER_SAMPLE, ADC_SCALING, append=resuming)
+	elif (args.split):
+		outputFile = SplitTextWriter(args.output, append=resuming)
+	else:
+		outputFile = TextWriter(args.output, append=resuming)
+except (IOError, OSError) as (strError):
 	print "Error opening file: %s" % strError
+	sys.exit(1)
 
 # Set up our signal handler
-signal.signal(signal.SIGINT, sigint_handler)
+if (args.follow or args.state is not None):
+	signal.signal(signal.SIGINT, sigint_stop_handler)
+else:
+	signal.signal(signal.SIGINT, sigint_handler)
+metrics.collector(pipeline_collector(metrics_Sources))
+try:
+	export_metrics(metrics, args.metrics_port)
+except (socket.error) as (strError):
+	print "Error serving metrics on port %d: %s" % (args.metrics_port, strError)
+	sys.exit(1)
 
 # Process all of the data in the input file
-process_loop(inputFile)
+startTime = time.time()
+if (args.follow or args.state is not None):
+	offset = process_resumable(inputFile, startOffset)
+	processed = offset - startOffset
+	if (args.state is not None):
+		save_State(offset)
+elif (args.jobs > 1):
+	processed = process_parallel(inputFile, args.jobs)
+else:
+	processed = process_loop(inputFile)
+elapsed = time.time() - startTime
+
+print "Processed %d bytes in %.3f seconds (%.2f MB/s)" % (processed, elapsed, (processed / 1e6) / max(elapsed, 1e-9))
 
 # Close our input and output files
 inputFile.close()
@@ -3,197 +3,112 @@ import time
 import struct
 import serial
 import signal
+import argparse
+from wpm.samples import decode_samples, sample_times, BlockSplitter
+from wpm.textout import format_samples
+from wpm.calibration import adc_volts
+from wpm.metrics import Histogram
+from wpm.profiling import add_profile_arguments, start_profiling
 
 ################################################################################
 ################################################################################
 
 TIME_PER_SAMPLE = 0.083
 
+# Set by sigint to stop logging
+stopLogging = False
+
+# Most bytes taken from the serial port per read
+READ_SIZE = 4096
+
+# Validated sample blocks are written out in batches, when this many are
+# waiting or the oldest has waited this many seconds
+WRITE_BLOCKS = 32
+WRITE_INTERVAL = 5.0
+
+# Time spent reading (waiting included), decoding and writing, for --profile
+stages = Histogram("wpm_stage_seconds", "Seconds spent in each processing stage.", "stage")
+
 ################################################################################
 ################################################################################
 
-# A simple sigint handler to stop the reading
-def sigint_handler(signal, frame):
-	readStop = True
-	dataFile.close()
-	sys.exit(0)
-
-# Perform a CRC16 on 8-bit data blocks with a 16-bit seed
-def crc16_bits(data, seed):
-	feedback = 0
-
-	# Keep our variables bound to 8/16 bits
-	data = data & 0xFF
-	seed = seed & 0xFFFF
-
-	# CRC16 Algorithm
-	for i in range(8):
-		feedback = ((data>>7) ^ (seed>>15)) & 0x1
-		if (feedback == 0):
-			seed <<= 1
-			seed = seed & 0xFFFF
-		else:
-			seed ^= (0x10 | 0x800)
-			seed <<= 1
-			seed |= 0x01
-			seed = seed & 0xFFFF
-		data <<= 1
-		data = data & 0xFF
-
-	return seed
+# A sigint handler that stops the reading after the current read, so the
+# waiting sample blocks are written out once, never from inside write_Batch()
+def sigint_stop_handler(signal, frame):
+	global stopLogging
+	stopLogging = True
+
+# Write out the waiting sample blocks
+def write_Batch():
+	global batchStart
+	if (len(batch) > 0):
+		t0 = time.time()
+		dataFile.write("".join(batch))
+		del batch[:]
+		stages.observe(time.time() - t0, "write")
+	batchStart = None
+
+# Decode a sample block, and add its samples to the batch if our local
+# checksum matches
+def log_Block(blockData):
+	global batchStart
+	t0 = time.time()
+	block = decode_samples(blockData)
+	if (block is None or not block.checksum_ok()):
+		return
+
+	# Scale the data to an actual voltage
+	voltages = adc_volts(block.samples)
+	timestamps = sample_times(block.timestamp, len(block.samples), TIME_PER_SAMPLE)
+	batch.append(format_samples(timestamps, voltages))
+	stages.observe(time.time() - t0, "decode")
+	if (batchStart is None):
+		batchStart = time.time()
 
 ################################################################################
 ################################################################################
 
-# Check for minimum arguments
-if (len(sys.argv) < 3):
-	print "Usage: %s <serial port> <output file>" % sys.argv[0]
-	sys.exit(1)
+parser = argparse.ArgumentParser(description="Log the samples of a meter in transparent mode to a text file.")
+parser.add_argument("port", help="serial port of the meter's XBee")
+parser.add_argument("output", help="text file to write \"timestamp voltage\" lines to")
+add_profile_arguments(parser)
+args = parser.parse_args()
 
 # Open our data file
 try:
-	dataFile = open(sys.argv[2], "w")
+	dataFile = open(args.output, "w")
 except IOError as (strError):
 	print "Error opening file: %s" % strError
 
 # Open the serial port
 try:
-	sp = serial.Serial(sys.argv[1], baudrate=9600, bytesize=8, parity='N', stopbits=1, timeout=1);
+	sp = serial.Serial(args.port, baudrate=9600, bytesize=8, parity='N', stopbits=1, timeout=1);
 except serial.SerialException as (strError):
 	print "Error opening serial port!: ", strError
 	sys.exit(1)
 
-# Set up our signal handler
-signal.signal(signal.SIGINT, sigint_handler)
-
-# Timestamp ascii hex characters
-timestamp_str = ''
-# Timestamp converted to a number
-timestamp = 0
-
-# Sample data ascii hex characters
-number_str = ''
-# Sample data converted to a number
-data = 0
-# Adjusted sample data to voltage
-voltage = 0
-
-# Checksum ascii hex characters
-checksum_str = ''
-# Checksum data converted to a number
-sample_checksum = -1
-# Locally computed checksum on the data
-local_checksum = 0
-
-# Formatted sample data
-print_buffer = ''
-
-# A signal set by sigint to stop reading
-readStop = False
-
-state = -1
-
-while not readStop:
-	# Read raw data from the serial port
-	rawData = sp.read(1)
-	# If the read didn't time out, send it over for processing
-	if (len(rawData) > 0):
-		if (rawData == 'T'):
-			state = 1
-			timestamp_str = ''
-			number_str = ''
-			# Reset the checksum data and the print buffer
-			sample_checksum = -1
-			local_checksum = 0
-			print_buffer = ''
-
-			continue
-		elif (rawData == 'S' and state != -1):
-			state = 2
-			continue
-		elif ((rawData == 'X' or rawData == 'Y') and state != -1):
-			state = 3
-			continue
-		elif ((rawData == 'Z') and state != -1):
-			# Only print the buffer of samples if our local checksum
-			# matches
-			if (local_checksum == sample_checksum):
-				dataFile.write(print_buffer)
-
-			# Reset the state
-			state = -1
-			continue
-
-		# State: Timestamp Data
-		if (state == 1):
-			# Add the timestamp ascii hex character to our string
-			timestamp_str += rawData
-			# Convert the string once its reached its max length
-			if (len(timestamp_str) == 8):
-				timestamp = int(timestamp_str, 16)
-				# Calculate our local checksum based on all
-				# of the bytes of the timestamp number
-				local_checksum = crc16_bits((timestamp >> 24) & 0xFF, local_checksum)
-				local_checksum = crc16_bits((timestamp >> 16) & 0xFF, local_checksum)
-				local_checksum = crc16_bits((timestamp >> 8) & 0xFF, local_checksum)
-				local_checksum = crc16_bits(timestamp & 0xFF, local_checksum)
-				# Reset the timestamp string
-				timestamp_str = ''
-				state = 0
-
-		# State: Sample Data
-		if (state == 2):
-			# If our number string has reached max length or we
-			# encounter a comma
-			if (rawData == ',' or len(number_str) == 3):
-				# If we're not at the necessary length, reset
-				# the number string
-				if (len(number_str) != 3):
-					number_str = ''
-					continue
-
-				# Convert the number string to its actual data
-				try:
-					data = int(number_str, 16)
-				except ValueError:
-					state = 0
-					continue
-				# Run the data through our local checksum
-				local_checksum = crc16_bits((data >> 8) & 0xFF, local_checksum)
-				local_checksum = crc16_bits(data & 0xFF, local_checksum)
-				# Scale the data to an actual voltage
-				voltage = 5.0*(data/1024.)
-				# Add this sample to our print buffer
-				print_buffer += "%f %f\n" % (timestamp, voltage)
-				# Increment our timestamp to align with our
-				# next sample
-				timestamp += TIME_PER_SAMPLE
-				# Reset the number string
-				number_str = ''
-			else:
-				# Append this ascii hex data to our number
-				# string
-				number_str += rawData
-
-		# State: Checksum Data
-		if (state == 3):
-			# Append this ascii hex data to our checksum string
-			checksum_str += rawData
-			# Make sure we haven't gone over the checksum string
-			# length
-			if (len(checksum_str) > 4):
-				# If so, reset the checksum_str and state
-				checksum_str = ''
-				state = 0
-			# If we've reached necessary length of our checksum
-			# string
-			elif (len(checksum_str) == 4):
-				# Convert the checksum ascii hex to a number
-				sample_checksum = int(checksum_str, 16)
-				# Reset the checksum string
-				checksum_str = ''
-				state = 0
-
-# Close the serial port and the data file
+# Set up our signal handler and profiling
+signal.signal(signal.SIGINT, sigint_stop_handler)
+start_profiling(args, stages)
+
+# Sample blocks found in the stream, and the formatted samples waiting to be
+# written along with when the first of them arrived
+splitter = BlockSplitter()
+batch = []
+batchStart = None
+
+while not stopLogging:
+	# Read whatever has arrived, waiting for at least a byte (or the
+	# timeout). inWaiting() rather than in_waiting, which needs pyserial 3.
+	t0 = time.time()
+	rawData = sp.read(max(1, min(sp.inWaiting(), READ_SIZE)))
+	stages.observe(time.time() - t0, "read")
+	for blockData in splitter.feed(rawData):
+		log_Block(blockData)
+
+	if (len(batch) >= WRITE_BLOCKS or (batchStart is not None and time.time() - batchStart >= WRITE_INTERVAL)):
+		write_Batch()
+
+write_Batch()
+dataFile.close()
 sp.close()
-
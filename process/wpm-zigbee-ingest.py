@@ -0,0 +1,87 @@
+import sys
+import time
+import signal
+import socket
+import argparse
+from wpm.ingest import IngestLoop
+from wpm.samples import sample_times
+from wpm.calibration import ADC_SCALING
+from wpm.columns import ColumnStore
+from wpm.metrics import Metrics, pipeline_collector, export_metrics
+from wpm.profiling import add_profile_arguments, start_profiling
+
+################################################################################
+################################################################################
+
+TIME_PER_SAMPLE = 0.083
+
+################################################################################
+################################################################################
+
+# A simple sigint handler to stop the ingest loop
+def sigint_handler(signal, frame):
+	ingest.stop = True
+
+# Writes a sample block from a meter to our output
+def write_Block(port, meter, block):
+	if (outputStore is not None):
+		timestamps = sample_times(block.timestamp, len(block.samples), TIME_PER_SAMPLE)
+		outputStore.write(meter.address, timestamps, block.samples)
+
+# Prints how much data every port and meter has brought in
+def print_Stats():
+	for port in sorted(ingest.ports.values() + ingest.closed, key=lambda p: p.path):
+		meters = port.meters
+		print "%s: %d bytes, %d frames, %d checksum errors, %d meters, %d blocks, %d bad, %d incomplete, %d evicted" % (port.path, port.bytes, port.frames, port.decoder.stats.checksum_errors, len(meters), sum([m.blocks for m in meters]), sum([m.bad_blocks for m in meters]), sum([m.assembler.incomplete for m in meters]), sum([m.assembler.evicted for m in meters]))
+	if (outputStore is not None):
+		outputStore.flush()
+	sys.stdout.flush()
+
+# The pipeline of every port, for the metrics
+def metrics_Sources():
+	return [({'port': port.path}, port.bytes, port.decoder.stats, port.meters) for port in sorted(ingest.ports.values() + ingest.closed, key=lambda p: p.path)]
+
+################################################################################
+################################################################################
+
+parser = argparse.ArgumentParser(description="Read sample data from any number of XBee coordinators at once.")
+parser.add_argument("ports", nargs="+", help="serial ports (or ptys, FIFOs or capture files) of the coordinators")
+parser.add_argument("-o", "--output", help="directory to write per-meter sample columns to")
+parser.add_argument("--stats", type=float, default=10.0, help="seconds between printing statistics (default: %(default)s)")
+parser.add_argument("--metrics-port", type=int, help="serve metrics in the Prometheus text format on http://127.0.0.1:PORT/metrics (they're also dumped to stderr on SIGUSR1)")
+add_profile_arguments(parser)
+args = parser.parse_args()
+
+metrics = Metrics()
+stages = metrics.histogram("wpm_stage_seconds", "Seconds spent in each processing stage: reading a port (everything below included), decoding a sample block, and writing it out.", "stage")
+metrics.collector(pipeline_collector(metrics_Sources))
+start_profiling(args, stages)
+
+ingest = IngestLoop(write_Block, stages=stages)
+
+# Open our ports
+for path in args.ports:
+	try:
+		ingest.add_port(path)
+	except (OSError, IOError) as (strError):
+		print "Error opening port %s: %s" % (path, strError)
+		sys.exit(1)
+
+# Open our output
+outputStore = None
+if (args.output is not None):
+	outputStore = ColumnStore(args.output, TIME_PER_SAMPLE, ADC_SCALING, append=True)
+
+# Set up our signal handlers and metrics
+signal.signal(signal.SIGINT, sigint_handler)
+try:
+	export_metrics(metrics, args.metrics_port)
+except (socket.error) as (strError):
+	print "Error serving metrics on port %d: %s" % (args.metrics_port, strError)
+	sys.exit(1)
+
+ingest.run(tick=print_Stats, interval=args.stats)
+
+print_Stats()
+if (outputStore is not None):
+	outputStore.close()
@@ -7,20 +7,50 @@ import struct
 import serial
 import threading
 import copy
+import argparse
+import numpy
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 from matplotlib.figure import Figure
 from matplotlib.axes import Subplot
-from matplotlib.backends.backend_gtkagg import FigureCanvasGTK
+from matplotlib.backends.backend_gtkagg import FigureCanvasGTKAgg
 from matplotlib import pylab
 import pygtk
 import gtk
 import gtk.glade
 import gobject
+from wpm.samples import decode_samples, sample_times
+from wpm.queues import StageQueue, BLOCK, DROP_OLDEST
+from wpm.render import BlitAxes, FrameClock
+from wpm.history import PowerHistory
+from wpm.power import measure
+from wpm.calibration import CalibrationConfig
+from wpm.metrics import Histogram
+from wpm.profiling import add_profile_arguments, start_profiling
 
 TIME_PER_SAMPLE = 0.083
-powers = []
+
+# Sample block text waiting to be decoded. The reader waits for room when the
+# decoder falls behind, dropping a block only if it waits this long.
+RAW_QUEUE_SIZE = 32
+RAW_QUEUE_TIMEOUT = 5.0
+# Decoded sample blocks waiting to be plotted. The plot only needs the latest
+# data, so the oldest blocks are dropped when it falls behind.
+PLOT_QUEUE_SIZE = 4
+# How often the plot checks for new sample blocks, in milliseconds
+REPLOT_INTERVAL = 50
+# Most plot frames rendered per second, unless given on the command line
+FRAME_RATE = 10
+# How often the measured frame times are updated, in milliseconds
+FRAME_STATS_INTERVAL = 1000
+# Power history of the meter
+powers = PowerHistory()
+# The meter's calibration, from a file if we were given one
+calibrations = CalibrationConfig()
+calibration = calibrations.get()
+# Time spent decoding, plotting and rendering, for --profile
+stages = Histogram("wpm_stage_seconds", "Seconds spent in each processing stage.", "stage")
 
 pylab.hold(False)
 
@@ -29,6 +59,9 @@ tlock = threading.Lock()
 def sigint_handler(signal, frame):
 	dataLog.stop = True
 	dataRead.stop = True
+	print
+	print rawQueue.stats()
+	print plotQueue.stats()
 	sys.exit(0)
 
 class DataPlotter:
@@ -46,6 +79,10 @@ class DataPlotter:
 		self.vbox = gtk.VBox(False, 0)
 		self.window.add(self.vbox)
 
+		# Measured frame times go in a status line under the plots
+		self.status = gtk.Label("")
+		self.status.show()
+
 		self.plotfig_i = Figure(figsize=(100, 100), dpi=75)
 		self.plotfig_v = Figure(figsize=(100, 100), dpi=75)
 		self.plotax_i = self.plotfig_i.add_subplot(111)
@@ -55,14 +92,23 @@ class DataPlotter:
 
 		self.plotax_i.set_ylim(-15, 15)
 		self.plotax_v.set_ylim(0, 178)
+		self.plotlines_i[0].set_color('r')
+		self.plotlines_v[0].set_color('r')
 
-		self.plotcanvas_i = FigureCanvasGTK(self.plotfig_i)
-		self.plotcanvas_v = FigureCanvasGTK(self.plotfig_v)
+		self.plotcanvas_i = FigureCanvasGTKAgg(self.plotfig_i)
+		self.plotcanvas_v = FigureCanvasGTKAgg(self.plotfig_v)
 		self.plotcanvas_i.show()
 		self.plotcanvas_v.show()
 
 		self.vbox.pack_start(self.plotcanvas_i, True, True, 0)
-		self.vbox.pack_end(self.plotcanvas_v, True, True, 0)
+		self.vbox.pack_start(self.plotcanvas_v, True, True, 0)
+		self.vbox.pack_end(self.status, False, False, 0)
+
+		# Only the plot lines are redrawn for new data, blitted over the
+		# rest of their axes
+		self.blit_i = BlitAxes(self.plotcanvas_i, self.plotax_i, self.plotlines_i)
+		self.blit_v = BlitAxes(self.plotcanvas_v, self.plotax_v, self.plotlines_v)
+		self.clock = FrameClock(frameRate)
 		self.vbox.show()
 
 
@@ -71,95 +117,94 @@ class DataPlotter:
 		sigint_handler(0, 0)
 
 	def data_adjust(self):
-		x = -1
-		y = -1
-		self.data_i = []
-		self.data_v = []
-
-		self.data_y.pop(0)
-		self.data_x.pop(0)
-
-		for i in range(len(self.data_y)):
-			if (i % 2 == 0):
-				self.data_y[i] *= (170000/4300.)/1000
-				if (y != -1):
-					self.data_v.append((y + self.data_y[i]) / 2)
-				else:
-					self.data_v.append(self.data_y[i])
-				self.data_v.append(self.data_y[i])
-				y = self.data_y[i]
-			else:
-				self.data_y[i] -= 2500
-				self.data_y[i] /= 100
-				if (x != -1):
-					self.data_i.append((x + self.data_y[i]) / 2)
-				else:
-					self.data_i.append(self.data_y[i])
-				self.data_i.append(self.data_y[i])
-				x = self.data_y[i]
-
-
-		power = 0
-
-		# Perform a numerical integration on this power
-		for i in range(len(self.data_i)):
-			power += abs(self.data_i[i]) * self.data_v[i]
-		# Divide by the time length for the average power
-		power /= (len(self.data_y))
+		self.data_y = self.data_y[1:]
+		self.data_x = self.data_x[1:]
+
+		# Split the alternating voltage and current ADC codes into volts
+		# and amps, each interpolated onto the other's sample times
+		self.data_i, self.data_v = calibration.split(self.data_y, current_first=False)
+		reading = measure(self.data_i, self.data_v)
+		print "Vrms: %f V, Irms: %f A, Real Power: %f W, Apparent Power: %f VA, Power Factor: %f" % (reading.vrms, reading.irms, reading.real, reading.apparent, reading.power_factor)
+
+		# Integrate the power over the block, dividing by the time
+		# length for the average power. The power readings are the
+		# rectified |i|*v they've always been, not the real power.
+		power = reading.rectified * reading.samples / len(self.data_y)
 		# Divide by two since we took the absolute value of
 		# both I and V
 		#power /= 2.
 
-		# Subtract our "idle" power value
-		#power -= 18.30
-		#if (power < 0):
-		#	power = 0
+		# Subtract the meter's "idle" power value, if it has one
+		power = calibration.net_power(power)
 
-		# Push this power to our list
-		powers.insert(0, power)
-		# Pop off the first if we've reached 6 powers
-		if (len(powers) == 6):
-			powers.pop()
+		# Push this power to our history
+		powers.push(time.time(), power)
 
-		# Print out current list of powers
+		# Print out the latest powers, newest first
 		print "Power:",
-		avgpower = 0
-		for i in range(len(powers)):
+		latest = powers.recent.latest(len(powers.recent))
+		for i in range(len(latest)):
 			if (i == 0):
-				print "[%f]" % powers[i],
+				print "[%f]" % latest[i],
 			else:
-				print "%f" % powers[i],
-			avgpower += powers[i]
+				print "%f" % latest[i],
 		print "watts"
 
-		# Calculate and print the average power
-		avgpower /= (len(powers) + 0.0)
-		print "Average Power: %f" % avgpower, "watts"
+		# Print the average power of the latest powers, and of our rolling
+		# windows
+		print "Average Power: %f" % powers.recent.mean(), "watts"
+		for window in powers.windows:
+			print "%d Second Average Power: %f watts (min %f, max %f)" % (window.seconds, window.mean(), window.min(), window.max())
 		print "Latest Power Reading: %f" % power, "watts\n\n"
 
 	def replot(self):
-		if (dataLog.new_data > 0):
-			self.data_x = dataLog.back_axis_time[:]
-			self.data_y = dataLog.back_axis_voltage[:]
+		# Plot whatever sample blocks arrived since the last time
+		blocks = plotQueue.drain()
+		for (times, codes) in blocks:
+			t0 = time.time()
+			self.data_x = times
+			self.data_y = codes
 			self.data_adjust()
-			self.plotlines_i[0].set_xdata(self.data_x)
-			self.plotlines_v[0].set_xdata(self.data_x)
-			self.plotlines_i[0].set_ydata(self.data_i)
-			self.plotlines_v[0].set_ydata(self.data_v)
-			self.plotlines_i[0].set_color('r')
-			self.plotlines_v[0].set_color('r')
-
-			self.plotax_i.set_xlim(self.data_x[0], self.data_x[-1])
-			self.plotax_v.set_xlim(self.data_x[0], self.data_x[-1])
-			dataLog.new_data = 0
-
-		self.plotcanvas_i.draw_idle();
-		self.plotcanvas_v.draw_idle();
+
+			# Plot against the time into the block, so the x limits
+			# (and the cached axes backgrounds) stay the same from
+			# block to block
+			times = numpy.asarray(self.data_x) - self.data_x[0]
+			self.blit_i.set_data(self.plotlines_i[0], times, self.data_i)
+			self.blit_v.set_data(self.plotlines_v[0], times, self.data_v)
+			self.blit_i.set_xlim(0, times[-1])
+			self.blit_v.set_xlim(0, times[-1])
+			stages.observe(time.time() - t0, "plot")
+
+		# Render a frame if something changed, at most frameRate times
+		# a second
+		if ((self.blit_i.dirty or self.blit_v.dirty) and self.clock.ready()):
+			t0 = time.time()
+			self.clock.frame(self.render)
+			stages.observe(time.time() - t0, "render")
+		return True
+
+	def render(self):
+		self.blit_i.render()
+		self.blit_v.render()
+
+	def update_Status(self):
+		global calibration
+		self.status.set_text(self.clock.stats())
+
+		# Pick up changes to the calibration file
+		try:
+			if (calibrations.reload()):
+				calibration = calibrations.get()
+				print "Reloaded calibration from %s" % calibrations.path
+		except (IOError, ValueError) as (strError):
+			print "Error reloading calibration, keeping the last: %s" % strError
 		return True
 
 	def main(self):
 		self.window.show()
-		gobject.idle_add(self.replot)
+		gobject.timeout_add(REPLOT_INTERVAL, self.replot)
+		gobject.timeout_add(FRAME_STATS_INTERVAL, self.update_Status)
 		gtk.main()
 
 class DataLogger(threading.Thread):
@@ -167,84 +212,41 @@ class DataLogger(threading.Thread):
 		threading.Thread.__init__(self)
 
 		self.axis_time = []
-		self.axis_voltage = []
+		self.axis_codes = []
 
-		self.back_axis_time = []
-		self.back_axis_voltage = []
+		self.stop = False
 
-		self.new_data = 0
 
-		self.stop = False
+	def parse_Samples(self, blockData):
+		t0 = time.time()
+		block = decode_samples(blockData)
+		if (block is None):
+			return
 
+		# Each sample is timestamped one sample period after the last,
+		# starting one period after the block timestamp
+		timeindex = sample_times(block.timestamp, len(block.samples)+1, TIME_PER_SAMPLE)[1:]
 
-	def parse_Samples(self):
-		timestamp_str = ''
-		timestamp = 0
-		timeindex = 0
-
-		number_str = ''
-		data = 0
-		voltage = 0
-
-		state = -1
-		for rawData in self.dataCopy:
-			if (rawData == 'T'):
-				state = 1
-				self.axis_time = []
-				self.axis_voltage = []
-				continue
-			elif (rawData == 'S' and state != -1):
-				state = 2
-				continue
-			elif ((rawData == 'X' or rawData == 'Y') and state != -1):
-				self.back_axis_time = self.axis_time[:]
-				self.back_axis_voltage = self.axis_voltage[:]
-				self.new_data = 1
-				state = 0
-				break
-
-			if (state == 1):
-				timestamp_str += rawData
-				if (len(timestamp_str) == 8):
-					timestamp = int(timestamp_str, 16)
-					timeindex = timestamp
-					timestamp_str = ''
-					state = 0
-
-			if (state == 2):
-				if (rawData == ',' or len(number_str) == 3):
-					if (len(number_str) != 3):
-						number_str = ''
-						continue
-					timeindex += TIME_PER_SAMPLE
-					try:
-						data = int(number_str, 16)
-					except ValueError:
-						#print "Error with this number string: %s" % number_str
-						state = -1
-						break
-					voltage = 5000*(data/1024.)
-
-					self.axis_time.append(timeindex)
-					self.axis_voltage.append(voltage)
-					#print "%f %f" % (timeindex, voltage)
-					number_str = ''
-				else:
-					number_str += rawData
+		# The ADC codes are converted by the calibration when they're
+		# plotted
+		self.axis_time = timeindex.tolist()
+		self.axis_codes = block.samples
+		stages.observe(time.time() - t0, "decode")
+
+		# Hand the block over to be plotted
+		plotQueue.put((self.axis_time, self.axis_codes))
 
 	def run(self):
 		while not self.stop:
-			if (dataRead.new_data == 1):
-				self.dataCopy = copy.copy(dataRead.dataCopy)
-				self.parse_Samples()
-				dataRead.new_data = 0
+			# Wait for the next block of sample data
+			blockData = rawQueue.take(0.5)
+			if (blockData is not None):
+				self.parse_Samples(blockData)
 
 class DataReader(threading.Thread):
 	def __init__(self, portPath):
 		threading.Thread.__init__(self)
 		self.dataBuffer = ''
-		self.dataCopy = ''
-		self.new_data = 0
 		self.stop = False
 
 	# Open the serial port
@@ -264,13 +266,30 @@ class DataReader(threading.Thread):
 			if (len(rawData) > 0):
 				self.dataBuffer += rawData
 				if (rawData == 'X'):
-					self.dataCopy = copy.copy(self.dataBuffer)
+					rawQueue.put(self.dataBuffer)
 					self.dataBuffer = ''
-					self.new_data = 1
 
 if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Plot and report the power of a meter in transparent mode.")
+	parser.add_argument("port", help="serial port of the meter's XBee")
+	parser.add_argument("frame_rate", nargs="?", type=float, default=FRAME_RATE, help="most plot frames rendered per second (default: %(default)s)")
+	parser.add_argument("--calibration", help="JSON file of calibration constants (its \"default\" entry), reloaded when it changes")
+	add_profile_arguments(parser)
+	args = parser.parse_args()
+
+	frameRate = args.frame_rate
+	try:
+		calibrations = CalibrationConfig(args.calibration)
+	except (IOError, OSError, ValueError) as (strError):
+		print "Error reading calibration: %s" % strError
+		sys.exit(1)
+	calibration = calibrations.get()
+	start_profiling(args, stages)
+
 	signal.signal(signal.SIGINT, sigint_handler)
-	dataRead = DataReader(sys.argv[1])
+	rawQueue = StageQueue("sample data", RAW_QUEUE_SIZE, BLOCK, RAW_QUEUE_TIMEOUT)
+	plotQueue = StageQueue("sample blocks", PLOT_QUEUE_SIZE, DROP_OLDEST)
+	dataRead = DataReader(args.port)
 	dataLog = DataLogger()
 	dataLog.start()
 	dataRead.start()
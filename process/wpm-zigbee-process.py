@@ -2,26 +2,70 @@ import random
 import termios
 import sys
 import signal
+import socket
 import time
 import struct
 import serial
 import threading
+import argparse
 import copy
+import numpy
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 from matplotlib.figure import Figure
 from matplotlib.axes import Subplot
-from matplotlib.backends.backend_gtkagg import FigureCanvasGTK
+from matplotlib.backends.backend_gtkagg import FigureCanvasGTKAgg
 from matplotlib import pylab
 import pygtk
 import gtk
 import gtk.glade
 import gobject
+from wpm.xbee import APIFrameDecoder, API_RECEIVE_PACKET
+from wpm.samples import decode_samples, sample_times
+from wpm.queues import StageQueue, BLOCK, DROP_OLDEST
+from wpm.render import BlitAxes, FrameClock
+from wpm.history import PowerHistory
+from wpm.power import measure
+from wpm.calibration import CalibrationConfig, IDLE_POWER
+from wpm.meters import MeterRegistry
+from wpm.rollups import RollupStore
+from wpm.energy import EnergyAccumulator
+from wpm.metrics import Metrics, pipeline_collector, queue_collector, export_metrics
+from wpm.profiling import add_profile_arguments, start_profiling
 
 TIME_PER_SAMPLE = 0.083
+
+# Serial data chunks waiting to be decoded. The reader waits for room when the
+# decoder falls behind, dropping a chunk only if it waits this long.
+RAW_QUEUE_SIZE = 256
+RAW_QUEUE_TIMEOUT = 5.0
+# Sample blocks waiting to be plotted. The plot only needs the latest data, so
+# the oldest blocks are dropped when it falls behind.
+PLOT_QUEUE_SIZE = 16
+# Seconds a partially received sample block is kept waiting for the rest of
+# its frames
+BLOCK_MAX_AGE = 5.0
+# How often the plot checks for new sample blocks, in milliseconds
+REPLOT_INTERVAL = 50
+# Most plot frames rendered per second, unless given on the command line
+FRAME_RATE = 10
+# How often the measured frame times are updated, in milliseconds
+FRAME_STATS_INTERVAL = 1000
+# Power history of each meter
 powers = []
-powers.append([])
+powers.append(PowerHistory())
+# Per-minute, hour and day rollups of every meter's power, if we were given a
+# directory for them
+rollups = None
+# Every meter's energy, checkpointed if we were given a file for it, when
+# there's a checkpoint or rollups to keep it for
+energy = None
+# Every meter's calibration, from a file if we were given one
+calibrations = CalibrationConfig(defaults={'idle_power': IDLE_POWER})
+# Processing statistics, served with --metrics-port and dumped on SIGUSR1
+metrics = Metrics()
+stages = metrics.histogram("wpm_stage_seconds", "Seconds spent in each processing stage: decoding a sample block, updating a meter's plot with it, and rendering a plot frame.", "stage")
 
 pylab.hold(False)
 
@@ -30,6 +74,15 @@ tlock = threading.Lock()
 def sigint_handler(signal, frame):
 	dataLog.stop = True
 	dataRead.stop = True
+	print
+	print rawQueue.stats()
+	print plotQueue.stats()
+	# The logger adds to the energy, let it finish its chunk first
+	dataLog.join()
+	if (rollups is not None):
+		rollups.close()
+	if (energy is not None):
+		energy.close()
 	sys.exit(0)
 
 class DataPlotter:
@@ -54,7 +107,15 @@ class DataPlotter:
 
 		self.hbox = gtk.HBox(False, 0)
 		self.hbox.pack_start(self.vbox[0], True, True, 0)
-		self.window.add(self.hbox)
+
+		# Measured frame times go in a status line under the plots
+		self.status = gtk.Label("")
+		self.status.show()
+		self.mainbox = gtk.VBox(False, 0)
+		self.mainbox.pack_start(self.hbox, True, True, 0)
+		self.mainbox.pack_end(self.status, False, False, 0)
+		self.mainbox.show()
+		self.window.add(self.mainbox)
 
 		self.plotfig_i = Figure(figsize=(100, 100), dpi=75)
 		self.plotfig_v = Figure(figsize=(100, 100), dpi=75)
@@ -69,14 +130,24 @@ class DataPlotter:
 
 		self.plotax_i[0].set_ylim(-10, 10)
 		self.plotax_v[0].set_ylim(0, 178)
+		self.plotlines_i[0][0].set_color(self.colors[0])
+		self.plotlines_v[0][0].set_color(self.colors[0])
 
 		self.plotcanvas_i = []
 		self.plotcanvas_v = []
-		self.plotcanvas_i.append(FigureCanvasGTK(self.plotfig_i))
-		self.plotcanvas_v.append(FigureCanvasGTK(self.plotfig_v))
+		self.plotcanvas_i.append(FigureCanvasGTKAgg(self.plotfig_i))
+		self.plotcanvas_v.append(FigureCanvasGTKAgg(self.plotfig_v))
 		self.plotcanvas_i[0].show()
 		self.plotcanvas_v[0].show()
 
+		# Only the plot lines are redrawn for new data, blitted over the
+		# rest of their axes
+		self.blit_i = []
+		self.blit_v = []
+		self.blit_i.append(BlitAxes(self.plotcanvas_i[0], self.plotax_i[0], self.plotlines_i[0]))
+		self.blit_v.append(BlitAxes(self.plotcanvas_v[0], self.plotax_v[0], self.plotlines_v[0]))
+		self.clock = FrameClock(frameRate)
+
 		self.vbox[0].pack_start(self.plotcanvas_i[0], True, True, 0)
 		self.vbox[0].pack_end(self.plotcanvas_v[0], True, True, 0)
 		self.vbox[0].show()
@@ -88,401 +159,258 @@ class DataPlotter:
 		sigint_handler(0, 0)
 
 	def data_adjust(self, index):
-#		if (toggle == 1):
-#			if (dataType == 1):
-#				for i in range(len(self.data_i)):
-#					self.data_i[i] -= 2500.
-#					self.data_i[i] /= 100.
-#			elif (dataType == 2):
-#				for i in range(len(self.data_i)):
-#					self.data_v[i] *= (170000/4250.)/1000
-#		else:
-		x = -1
-		y = -1
-		self.data_i[index] = []
-		self.data_v[index] = []
-
-		for i in range(len(self.data_y[index])):
-			if (i % 2 == 0):
-				self.data_y[index][i] -= 2500
-				self.data_y[index][i] /= 100
-				if (x != -1):
-					self.data_i[index].append((x + self.data_y[index][i]) / 2)
-				else:
-					self.data_i[index].append(self.data_y[index][i])
-				self.data_i[index].append(self.data_y[index][i])
-				x = self.data_y[index][i]
-			else:
-				self.data_y[index][i] *= (170000/4300.)/1000
-				if (y != -1):
-					self.data_v[index].append((y + self.data_y[index][i]) / 2)
-				else:
-					self.data_v[index].append(self.data_y[index][i])
-				self.data_v[index].append(self.data_y[index][i])
-				y = self.data_y[index][i]
+		# Look up the meter's calibration, again after it's reloaded
+		meter = dataLog.meters[index]
+		if (meter.calibration is None):
+			meter.calibration = calibrations.get(meter.address)
 
-		power = 0
+		# Split the alternating current and voltage ADC codes into amps
+		# and volts, each interpolated onto the other's sample times
+		self.data_i[index], self.data_v[index] = meter.calibration.split(self.data_y[index], current_first=True)
+		reading = measure(self.data_i[index], self.data_v[index])
 
-		print "\n[%d] Power Information for %s" % (index, dataLog.paList[index])
+		print "\n[%d] Power Information for %s" % (index, dataLog.meters[index].address)
 		#print "index: %d len x: %d len y: %d" % (index, len(self.data_i[index]), len(self.data_v[index]))
+		print "[%d] Vrms: %f V, Irms: %f A, Real Power: %f W, Apparent Power: %f VA, Power Factor: %f" % (index, reading.vrms, reading.irms, reading.real, reading.apparent, reading.power_factor)
 
-		# Perform a numerical integration on this power
-		for i in range(len(self.data_i[index])):
-			power += abs(self.data_i[index][i]) * self.data_v[index][i]
-		# Divide by the time length for the average power
-		power /= (len(self.data_y[index]))
+		# Integrate the power over the block, dividing by the time
+		# length for the average power. The power readings are the
+		# rectified |i|*v they've always been, not the real power.
+		power = reading.rectified * reading.samples / len(self.data_y[index])
 		# Divide by two since we took the absolute value of
 		# both I and V
 		power /= 2.
 
-		# Subtract our "idle" power value
-		power -= 18.30
-		if (power < 0):
-			power = 0
+		# Subtract the meter's "idle" power value
+		power = meter.calibration.net_power(power)
 
 
-		# Push this power to our list
-		powers[index].insert(0, power)
-		# Pop off the first if we've reached 6 powers
-		if (len(powers[index]) == 6):
-			powers[index].pop()
+		# Push this power to our history
+		now = time.time()
+		powers[index].push(now, power)
+		recent = powers[index].recent
 
-		# Print out current list of powers
+		# Print out the latest powers, newest first
 		print "[%d] Power:" % index,
-		avgpower = 0
-		for i in range(len(powers[index])):
+		latest = recent.latest(len(recent))
+		for i in range(len(latest)):
 			if (i == 0):
-				print "[%f]" % powers[index][i],
+				print "[%f]" % latest[i],
 			else:
-				print "%f" % powers[index][i],
-			avgpower += powers[index][i]
+				print "%f" % latest[i],
 		print "watts"
 
-		# Calculate and print the average power
-		avgpower /= (len(powers[index]) + 0.0)
-		print "[%d] Average Power:" % index, avgpower, "watts"
+		# Print the average power of the latest powers, and of our rolling
+		# windows
+		print "[%d] Average Power:" % index, recent.mean(), "watts"
+		for window in powers[index].windows:
+			print "[%d] %d Second Average Power: %f watts (min %f, max %f)" % (index, window.seconds, window.mean(), window.min(), window.max())
 		print "[%d] Latest Power Reading:" % index, power, "watts\n\n"
 
-	def replot(self):
-		if (dataLog.new_data > 0):
-			cindex = dataLog.new_data-1
-					# If this is a new meter, add it to our data / plotline arrays
-			while (dataLog.new_data > len(self.data_x)):
-				newMemberID = len(self.data_x)
-				#print "new member!"
-				self.data_x.append([0])
-				self.data_y.append([0])
-				self.data_i.append([0])
-				self.data_v.append([0])
-				self.vbox.append(gtk.VBox(False, 0))
-				pi = Figure(figsize=(100, 100), dpi=75)
-				pv = Figure(figsize=(100, 100), dpi=75)
-				self.plotax_i.append(pi.add_subplot(111))
-				self.plotax_v.append(pv.add_subplot(111))
-				self.plotlines_i.append(self.plotax_i[newMemberID].plot(self.data_x[newMemberID], self.data_i[newMemberID], '.'))
-				self.plotlines_v.append(self.plotax_v[newMemberID].plot(self.data_x[newMemberID], self.data_v[newMemberID], '.'))
-				self.plotax_i[newMemberID].set_ylim(-10, 10)
-				self.plotax_v[newMemberID].set_ylim(0, 178)
-
-				self.plotcanvas_i.append(FigureCanvasGTK(pi))
-				self.plotcanvas_v.append(FigureCanvasGTK(pv))
-				self.plotcanvas_i[newMemberID].show()
-				self.plotcanvas_v[newMemberID].show()
-
-				self.vbox[newMemberID].pack_start(self.plotcanvas_i[newMemberID], True, True, 0)
-				self.vbox[newMemberID].pack_end(self.plotcanvas_v[newMemberID], True, True, 0)
-				self.vbox[newMemberID].show()
-				self.hbox.pack_end(self.vbox[newMemberID], True, True, 0)
-				self.hbox.show()
-
-				powers.append([])
-
-			self.data_x[cindex] = dataLog.back_axis_time[cindex][:]
-			self.data_y[cindex] = dataLog.back_axis_voltage[cindex][:]
-			if (len(self.data_x[cindex]) % 2 != 0 or len(self.data_y[cindex]) % 2 != 0):
-				dataLog.new_data = 0
-				return True
+	# Add the data / plotline arrays for a new meter
+	def add_Meter(self):
+		newMemberID = len(self.data_x)
+		self.data_x.append([0])
+		self.data_y.append([0])
+		self.data_i.append([0])
+		self.data_v.append([0])
+		self.vbox.append(gtk.VBox(False, 0))
+		pi = Figure(figsize=(100, 100), dpi=75)
+		pv = Figure(figsize=(100, 100), dpi=75)
+		self.plotax_i.append(pi.add_subplot(111))
+		self.plotax_v.append(pv.add_subplot(111))
+		self.plotlines_i.append(self.plotax_i[newMemberID].plot(self.data_x[newMemberID], self.data_i[newMemberID], '.'))
+		self.plotlines_v.append(self.plotax_v[newMemberID].plot(self.data_x[newMemberID], self.data_v[newMemberID], '.'))
+		self.plotax_i[newMemberID].set_ylim(-10, 10)
+		self.plotax_v[newMemberID].set_ylim(0, 178)
+		self.plotlines_i[newMemberID][0].set_color(self.colors[newMemberID])
+		self.plotlines_v[newMemberID][0].set_color(self.colors[newMemberID])
+
+		self.plotcanvas_i.append(FigureCanvasGTKAgg(pi))
+		self.plotcanvas_v.append(FigureCanvasGTKAgg(pv))
+		self.plotcanvas_i[newMemberID].show()
+		self.plotcanvas_v[newMemberID].show()
+		self.blit_i.append(BlitAxes(self.plotcanvas_i[newMemberID], self.plotax_i[newMemberID], self.plotlines_i[newMemberID]))
+		self.blit_v.append(BlitAxes(self.plotcanvas_v[newMemberID], self.plotax_v[newMemberID], self.plotlines_v[newMemberID]))
+
+		self.vbox[newMemberID].pack_start(self.plotcanvas_i[newMemberID], True, True, 0)
+		self.vbox[newMemberID].pack_end(self.plotcanvas_v[newMemberID], True, True, 0)
+		self.vbox[newMemberID].show()
+		self.hbox.pack_end(self.vbox[newMemberID], True, True, 0)
+		self.hbox.show()
 
+		powers.append(PowerHistory())
+
+	# Update a meter's plot lines with a new block of samples, returns
+	# False if the block can't be plotted
+	def update_Meter(self, cindex, times, codes):
+		# If this is a new meter, add it to our data / plotline arrays
+		while (cindex >= len(self.data_x)):
+			self.add_Meter()
+
+		self.data_x[cindex] = times
+		self.data_y[cindex] = codes
+		if (len(self.data_x[cindex]) % 2 != 0 or len(self.data_y[cindex]) % 2 != 0):
+			return False
+
+		#print "index: %d len x: %d len y: %d" % (cindex, len(self.data_x[cindex]), len(self.data_y[cindex]))
+		self.data_adjust(cindex)
+
+		# Plot against the time into the block, so the x limits (and the
+		# cached axes backgrounds) stay the same from block to block
+		times = numpy.asarray(self.data_x[cindex]) - self.data_x[cindex][0]
+		self.blit_i[cindex].set_data(self.plotlines_i[cindex][0], times, self.data_i[cindex])
+		self.blit_v[cindex].set_data(self.plotlines_v[cindex][0], times, self.data_v[cindex])
+		self.blit_i[cindex].set_xlim(0, times[-1])
+		self.blit_v[cindex].set_xlim(0, times[-1])
+		return True
+
+	# Redraw the plots of meters with new data
+	def render(self):
+		for i in range(len(self.blit_i)):
+			self.blit_i[i].render()
+			self.blit_v[i].render()
+
+	# Whether any plot has new data to draw
+	def dirty(self):
+		for i in range(len(self.blit_i)):
+			if (self.blit_i[i].dirty or self.blit_v[i].dirty):
+				return True
+		return False
 
-			#print "index: %d len x: %d len y: %d" % (cindex, len(self.data_x[cindex]), len(self.data_y[cindex]))
-			self.data_adjust(cindex)
-			for i in range(len(self.plotlines_i)):
-				self.plotlines_i[i][0].set_xdata(self.data_x[i])
-				self.plotlines_v[i][0].set_xdata(self.data_x[i])
-				self.plotlines_i[i][0].set_ydata(self.data_i[i])
-				self.plotlines_v[i][0].set_ydata(self.data_v[i])
-				self.plotlines_i[i][0].set_color(self.colors[i])
-				self.plotlines_v[i][0].set_color(self.colors[i])
+	def replot(self):
+		# Plot whatever sample blocks arrived since the last time
+		for (cindex, times, codes) in plotQueue.drain():
+			t0 = time.time()
+			self.update_Meter(cindex, times, codes)
+			stages.observe(time.time() - t0, "plot")
+
+		# Render a frame if something changed, at most frameRate times
+		# a second
+		if (self.dirty() and self.clock.ready()):
+			t0 = time.time()
+			self.clock.frame(self.render)
+			stages.observe(time.time() - t0, "render")
+		return True
 
-			self.plotax_i[cindex].set_xlim(self.data_x[cindex][0], self.data_x[cindex][-1])
-			self.plotax_v[cindex].set_xlim(self.data_x[cindex][0], self.data_x[cindex][-1])
-			dataLog.new_data = 0
+	def update_Status(self):
+		self.status.set_text(self.clock.stats())
 
-		for i in range(len(self.plotcanvas_i)):
-			self.plotcanvas_i[i].draw_idle();
-			self.plotcanvas_v[i].draw_idle();
+		# Pick up changes to the calibration file, every meter's
+		# calibration is looked up again with the new constants
+		try:
+			if (calibrations.reload()):
+				for meter in dataLog.meters:
+					meter.calibration = None
+				print "Reloaded calibration from %s" % calibrations.path
+		except (IOError, ValueError) as (strError):
+			print "Error reloading calibration, keeping the last: %s" % strError
 		return True
 
 	def main(self):
 		self.window.show()
-		gobject.idle_add(self.replot)
+		gobject.timeout_add(REPLOT_INTERVAL, self.replot)
+		gobject.timeout_add(FRAME_STATS_INTERVAL, self.update_Status)
 		gtk.main()
 
 class DataLogger(threading.Thread):
 	def __init__(self):
 		threading.Thread.__init__(self)
 
-		self.axis_time = []
-		self.axis_voltage = []
-		self.back_axis_time = []
-		self.back_axis_voltage = []
-		self.new_data = 0
-
 		self.stop = False
 
 
-		# Zigbee permanent addresses list
-		self.paList = []
-		# Map of data bytes corresponding to zigbee permanent address list
-		self.dataMapList = []
-		# Fully assembled sample data buffer list
-		self.sampleDataList = []
-		# Time index list
-		self.tiList = []
+		# Zigbee devices we've seen, keyed by their permanent addresses
+		self.meters = MeterRegistry(BLOCK_MAX_AGE)
 
 		# Index of the last current meter processed
 		self.last_processed_index = -1
 
-		# Yet to be processed serial port data
-		self.unprocessedData = ''
+		# Streaming API frame decoder for the serial port data
+		self.frameDecoder = APIFrameDecoder()
 
 		self.timeout = 0
 
-	# Perform a CRC16 on 8-bit data blocks with a 16-bit seed
-	def crc16_bits(self, data, seed):
-		feedback = 0
-
-		# Keep our variables bound to 8/16 bits
-		data = data & 0xFF
-		seed = seed & 0xFFFF
-
-		# CRC16 Algorithm
-		for i in range(8):
-			feedback = ((data>>7) ^ (seed>>15)) & 0x1
-			if (feedback == 0):
-				seed <<= 1
-				seed = seed & 0xFFFF
-			else:
-				seed ^= (0x10 | 0x800)
-				seed <<= 1
-				seed |= 0x01
-				seed = seed & 0xFFFF
-			data <<= 1
-			data = data & 0xFF
-
-		return seed
-
-	def parse_Samples(self, index):
-		timestamp_str = ''
-		timestamp = 0
-
-		checksum_str = ''
-		sample_checksum = -1
-		local_checksum = 0
-
-		number_str = ''
-		data = 0
-		voltage = 0
-
-		print_buffer = ''
-
+	def parse_Samples(self, meter, payload):
 		# Ensure that we have both packet start and packet ends
-		if (self.sampleDataList[index].find('T') < 0 or self.sampleDataList[index].find('Z') < 0):
-			return -1
-
-		state = -1
-		for rawData in self.sampleDataList[index]:
-			if (rawData == 'T'):
-				state = 1
-				self.axis_time[index] = []
-				self.axis_voltage[index] = []
-				continue
-			elif (rawData == 'S' and state != -1):
-				state = 2
-				continue
-			elif ((rawData == 'X' or rawData == 'Y') and state != -1):
-				state = 3
-				continue
-			elif ((rawData == 'Z') and state != -1):
-				# Make sure our time and data axis match up
-				if (len(self.axis_time[index]) != len(self.axis_voltage[index])):
-					break
-
-				# If we already have new data we need to process
-				# and we just processed this meter, skip it
-				#if (self.new_data != 0):
-				#	if (index == self.last_processed_index):
-				#		print "skipped"
-				#		break
-				#	else:
-				#		print "not skipped"
-				#		self.last_processed_index = -1
-				#		break
-
-				# Only offer new data to plot if the checksum matches
-				if (local_checksum == sample_checksum):
-					self.back_axis_time[index] = self.axis_time[index][:]
-					self.back_axis_voltage[index] = self.axis_voltage[index][:]
-					self.new_data = index+1
-					# Set our last processed index to this index
-					self.last_processed_index = index
-					# Wait until this data has been plotted
-					while (self.new_data != 0):
-						pass
-				else:
-					self.last_processed_index = index
-					break
-
-				# Clear all acquire data
-				self.unprocessedData = ''
-				for i in range(len(self.paList)):
-					self.dataMapList[i].clear()
-
-				break
-
-			# State: Timestamp Data
-			if (state == 1):
-				# Add the timestamp ascii hex character to our string
-				timestamp_str += rawData
-				# Convert the string once its reached its max length
-				if (len(timestamp_str) == 8):
-					timestamp = int(timestamp_str, 16)
-					# Make sure this is a newer sample
-					if (self.tiList[index] != -1 and self.tiList[index] > timestamp):
-						# Clear all acquire data
-						self.unprocessedData = ''
-						for i in range(len(self.paList)):
-							self.dataMapList[i].clear()
-						break
-					self.tiList[index] = timestamp
-					# Calculate our local checksum based on all
-					# of the bytes of the timestamp number
-					local_checksum = self.crc16_bits((timestamp >> 24) & 0xFF, local_checksum)
-					local_checksum = self.crc16_bits((timestamp >> 16) & 0xFF, local_checksum)
-					local_checksum = self.crc16_bits((timestamp >> 8) & 0xFF, local_checksum)
-					local_checksum = self.crc16_bits(timestamp & 0xFF, local_checksum)
-					# Reset the timestamp string
-					timestamp_str = ''
-					state = 0
-
-			# State: Sample Data
-			if (state == 2):
-				# If our number string has reached max length or we
-				# encounter a comma
-				if (rawData == ',' or len(number_str) == 3):
-					# If we're not at the necessary length, reset
-					# the number string
-					if (len(number_str) != 3):
-						number_str = ''
-						continue
-
-					# Convert the number string to its actual data
-					data = int(number_str, 16)
-					# Run the data through our local checksum
-					local_checksum = self.crc16_bits((data >> 8) & 0xFF, local_checksum)
-					local_checksum = self.crc16_bits(data & 0xFF, local_checksum)
-					# Scale the data to an actual voltage
-					voltage = 5000.*(data/1024.)
-					# Add this sample to our time and voltage data lists
-					self.axis_time[index].append(timestamp)
-					self.axis_voltage[index].append(voltage)
-					# Increment our timestamp to align with our
-					# next sample
-					timestamp += TIME_PER_SAMPLE
-					# Reset the number string
-					number_str = ''
-				else:
-					# Append this ascii hex data to our number
-					# string
-					number_str += rawData
-
-			# State: Checksum Data
-			if (state == 3):
-				# Append this ascii hex data to our checksum string
-				checksum_str += rawData
-				# Make sure we haven't gone over the checksum string
-				# length
-				if (len(checksum_str) > 4):
-					# If so, reset the checksum_str and state
-					checksum_str = ''
-					state = 0
-				# If we've reached necessary length of our checksum
-				# string
-				elif (len(checksum_str) == 4):
-					# Convert the checksum ascii hex to a number
-					sample_checksum = int(checksum_str, 16)
-					# Reset the checksum string
-					checksum_str = ''
-					state = 0
-
-		self.sampleDataList[index] = ''
-		return 0
-
-	def parse_Frame_Data(self, data, dataLen):
-		retVal = 0
-
-		# Unpack the frame data into an array of databytes
-		dataBytes = struct.unpack(str(dataLen) + "B", data)
-
-		# Check that the frame data type is a Zigbee Receive Packet
-		if dataBytes[0] != 0x90:
+		if (payload.find('T') < 0 or payload.find('Z') < 0):
 			return -1
 
-		# Check that the frame data contains the sample information we need
-		if dataLen < 13:
+		# Decode the whole block of samples
+		t0 = time.time()
+		block = decode_samples(payload)
+		if (block is None):
+			meter.bad_blocks += 1
 			return -1
 
-		# Pull out the permanent and network addresses
-		permanentAddress = ""
-		for i in range(2, 10):
-			permanentAddress += "%02X" % dataBytes[i]
+		# Make sure this is a newer sample
+		if (meter.last_timestamp != -1 and meter.last_timestamp > block.timestamp):
+			meter.stale_blocks += 1
+			# Clear all acquire data
+			self.meters.clear_reassembly()
+			return 0
+		meter.last_timestamp = block.timestamp
+
+		# Only offer new data to plot if the checksum matches
+		if (not block.checksum_ok()):
+			meter.bad_blocks += 1
+			self.last_processed_index = meter.index
+			return 0
+		meter.blocks += 1
+
+		# Timestamp the samples, their ADC codes are converted by the
+		# meter's calibration when they're plotted
+		axis_time = sample_times(block.timestamp, len(block.samples), TIME_PER_SAMPLE).tolist()
+		meter.samples += len(block.samples)
+		# Integrate and roll up every good block's energy here, the plot
+		# queue drops blocks when the plot falls behind
+		if (energy is not None):
+			self.add_Energy(meter, block)
+		stages.observe(time.time() - t0, "decode")
+
+		# Hand the block over to be plotted
+		plotQueue.put((meter.index, axis_time, block.samples))
+		# Set our last processed index to this index
+		self.last_processed_index = meter.index
+
+		# Clear all acquire data
+		self.meters.clear_reassembly()
 
-		# (we don't actually use the network address for anything)
-		#networkAddress = "%02X%02X" % (dataBytes[10], dataBytes[11])
+		return 0
 
-		# Subtract the length of frame data type, frame id, permanent address,
-		# network address, and receive options byes -- essentially the header
-		dataLen -= (2+8+2+1)
+	# Measure the real power of a sample block with the meter's calibration,
+	# and integrate it over the device time since the meter's last block.
+	# The rollups get the same power and energy, in buckets of host time.
+	def add_Energy(self, meter, block):
+		calibration = meter.calibration
+		if (calibration is None):
+			calibration = calibrations.get(meter.address)
+			meter.calibration = calibration
+		current, voltage = calibration.split(block.samples, current_first=True)
+		power = measure(current, voltage).real
+		wattHours = energy.add(meter.address, block.timestamp, power)
+		if (rollups is not None):
+			rollups.push(meter.address, time.time(), power, wattHours)
+
+	def parse_Frame_Data(self, frame):
+		retVal = 0
 
-		# Make sure we have actual data left over
-		if (dataLen <= 0):
+		# Check that the frame is a Zigbee Receive Packet with sample data
+		if (frame.frame_type != API_RECEIVE_PACKET or frame.source is None):
 			return -1
 
-		# Extract the Frame ID
-		frameID = dataBytes[12]
+		# Look up the device by its permanent address, adding it to our
+		# registry if it's new
+		meter = self.meters.get(frame.source, frame.name)
+		meter.frames += 1
+		index = meter.index
 
-		# Check if we have this device in our permanent address list
-		try:
-			index = self.paList.index(permanentAddress)
-		except ValueError:
-			# Otherwise add the device to our list
-			self.paList.append(permanentAddress)
-			# Create a new data map for this device
-			self.dataMapList.append({})
-			# Create a new sample data buffer in our list
-			self.sampleDataList.append('')
-			self.tiList.append(-1)
-			index = len(self.paList)-1
-			self.axis_voltage.append([])
-			self.axis_time.append([])
-			self.back_axis_voltage.append([])
-			self.back_axis_time.append([])
+		# Extract the Frame ID
+		frameID = frame.frame_id
 
 		# Don't collect this data if we just processed this meter
-		if (len(self.paList) > 1 and self.last_processed_index >= 0 and self.last_processed_index == index):
-			self.unprocessedData = ''
-			#for i in range(len(self.paList)):
-			#	self.dataMapList[i].clear()
+		if (len(self.meters) > 1 and self.last_processed_index >= 0 and self.last_processed_index == index):
+			#self.meters.clear_reassembly()
 			#self.last_processed_index = -1
 			if (self.timeout == 0):
 				self.timeout_index = index
@@ -494,122 +422,37 @@ class DataLogger(threading.Thread):
 			self.timeout_index = -1
 			self.timeout = 0
 
-		# Extract the sample data
-		sampleData = data[13:(13+dataLen)]
-
-		# If we already have this frame in our data map, clear our data map
-		# before adding the frame data
-		if (self.dataMapList[index].has_key(frameID) == True):
-			self.dataMapList[index].clear()
-			# Only add the frame if we're restarting at 0
-		#	if (self.last_processed_index == -1 and frameID != 0):
-		#		return -1
-
-		# Add the sample data to our data map
-		self.dataMapList[index][frameID] = sampleData[:]
-
-		# Check if this packet is the end of the sample data
-		if (sampleData.find('Z') >= 0):
-			# Sort all of the keys in our data map
-			keys = self.dataMapList[index].keys()
-			keys.sort()
-			# Clear our sample buffer
-			self.sampleDataList[index] = ''
-			# Make sure the 0th key is the 0th frame ID
-			if (keys[0] == 0):
-				# Check that all other frame IDs follow in order, and
-				# assemble the sample buffer
-				for i in range(len(keys)):
-					# If they're out of order, clear the data map
-					if (keys[i] != i):
-						self.dataMapList[index].clear()
-						return -1
-					# Assemble the sample buffer
-					self.sampleDataList[index] += self.dataMapList[index][keys[i]]
-
-				# Clear the data map now that we're done with it
-				self.dataMapList[index].clear()
-				# The 0th key is the 0th frame ID and all other frame
-				# IDs follow in order, time to parse the sample data
-				retVal = self.parse_Samples(index)
-			else:
-				# If the 0th key is not the 0th frame ID
-				self.dataMapList[index].clear()
-				return -1
+		# Add the sample data to the meter's block, and parse the block
+		# once all of its frames are in
+		payload = meter.assembler.add(frameID, frame.payload, time.time())
+		if (payload is not None):
+			retVal = self.parse_Samples(meter, payload)
 
 		return retVal
 
 
 	def parse_API_Frame(self, data):
-		dataLen = len(data)
-
-		# Minimum length of frame: start, length MSB, length LSB, checksum
-		if dataLen < 4:
-			return -1
-
-		# If we have unprocessed data from our last parsing attempt,
-		# insert it before out current data and adjust our data length
-		if (len(self.unprocessedData) > 0):
-			data = self.unprocessedData + data
-			dataLen += len(self.unprocessedData)
-			self.unprocessedData = ''
-
-		# Unpack the frame into an array of databytes
-		dataBytes = struct.unpack(str(dataLen) + "B", data)
-
-		for i in range(dataLen):
-			# Check for the start of an API frame
-			if dataBytes[i] == 0x7E:
-				# Check that the next two length bytes and at least
-				# the checksum byte exist, otherwise skip this frame
-				# (but save it for later in unprocessedData)
-				if dataLen < i+3:
-					self.unprocessedData += data[i:]
-					continue
-
-				# Pull out the API frame length from the next two bytes
-				frameLen = dataBytes[i+1]<<8
-				frameLen += dataBytes[i+2]
-
-				# Check that the frame actually contains this specified
-				# frame length, otherwise skip the frame
-				# (but save it for later in unprocessedData)
-				if dataLen < (i+3+frameLen+1):
-					self.unprocessedData += data[i:]
-					continue
-
-				# Calculate the checksum of the frame
-				checksum = 0
-				for j in range(i+3, i+3+frameLen+1):
-					checksum += dataBytes[j]
-					checksum = (checksum & 0xFF)
-
-				# Check for an invalid frame
-				if (checksum != 0xFF):
-					continue
-
-				# Extract the actual frame data
-				frameData = data[i+3 : i+3+frameLen]
-
-				# Pass it along to our frame data parsing function
-				self.parse_Frame_Data(frameData, frameLen)
+		# Pass each complete frame along to our frame data parsing function
+		for frame in self.frameDecoder.feed(data):
+			self.parse_Frame_Data(frame)
 		return 0
 
 
 	def run(self):
 		while not self.stop:
-			if (dataRead.new_data == 1):
-				self.dataCopy = copy.copy(dataRead.dataCopy)
-				self.parse_API_Frame(self.dataCopy)
-				dataRead.new_data = 0
+			# Wait for the next chunk of serial port data
+			rawData = rawQueue.take(0.5)
+			if (rawData is not None):
+				self.parse_API_Frame(rawData)
+			# Drop blocks from meters that stopped part way through
+			self.meters.expire(time.time())
 
 class DataReader(threading.Thread):
 	def __init__(self, portPath):
 		threading.Thread.__init__(self)
 		self.dataBuffer = ''
-		self.dataCopy = ''
-		self.new_data = 0
 		self.stop = False
+		self.bytes = 0
 
 	# Open the serial port
 		try:
@@ -629,17 +472,50 @@ class DataReader(threading.Thread):
 			#print "got data len %d" % len(rawData)
 			# If the read didn't time out, send it over for processing
 			if (len(rawData) > 0):
+				self.bytes += len(rawData)
 				self.dataBuffer += rawData
 				if (len(self.dataBuffer) >= 100):
-					self.dataCopy = copy.copy(self.dataBuffer)
+					rawQueue.put(self.dataBuffer)
 					self.dataBuffer = ''
-					self.new_data = 1
 
 
 if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Plot and report the power of every meter on an XBee coordinator.")
+	parser.add_argument("port", help="serial port of the coordinator")
+	parser.add_argument("frame_rate", nargs="?", type=float, default=FRAME_RATE, help="most plot frames rendered per second (default: %(default)s)")
+	parser.add_argument("rollups", nargs="?", help="directory to keep per-minute, hour and day power rollups in")
+	parser.add_argument("--energy", help="checkpoint file of every meter's energy, resumed from if it exists")
+	parser.add_argument("--calibration", help="JSON file of calibration constants keyed by meter address, reloaded when it changes")
+	parser.add_argument("--metrics-port", type=int, help="serve metrics in the Prometheus text format on http://127.0.0.1:PORT/metrics (they're also dumped to stderr on SIGUSR1)")
+	add_profile_arguments(parser)
+	args = parser.parse_args()
+	start_profiling(args, stages)
+
+	frameRate = args.frame_rate
+	if (args.rollups is not None):
+		rollups = RollupStore(args.rollups)
+	if (args.energy is not None or rollups is not None):
+		energy = EnergyAccumulator(args.energy)
+	try:
+		calibrations = CalibrationConfig(args.calibration, calibrations.defaults)
+	except (IOError, OSError, ValueError) as (strError):
+		print "Error reading calibration: %s" % strError
+		sys.exit(1)
+
 	signal.signal(signal.SIGINT, sigint_handler)
-	dataRead = DataReader(sys.argv[1])
+	rawQueue = StageQueue("serial data", RAW_QUEUE_SIZE, BLOCK, RAW_QUEUE_TIMEOUT)
+	plotQueue = StageQueue("sample blocks", PLOT_QUEUE_SIZE, DROP_OLDEST)
+	dataRead = DataReader(args.port)
 	dataLog = DataLogger()
+
+	metrics.collector(pipeline_collector(lambda: [({'port': args.port}, dataRead.bytes, dataLog.frameDecoder.stats, dataLog.meters)]))
+	metrics.collector(queue_collector([rawQueue, plotQueue]))
+	try:
+		export_metrics(metrics, args.metrics_port)
+	except (socket.error) as (strError):
+		print "Error serving metrics on port %d: %s" % (args.metrics_port, strError)
+		sys.exit(1)
+
 	dataLog.start()
 	dataRead.start()
 
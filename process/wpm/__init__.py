@@ -0,0 +1 @@
+# Shared decoding support for the wireless power meter processing scripts
@@ -0,0 +1,187 @@
+import os
+import json
+import numpy
+from wpm.power import align_channel
+
+################################################################################
+################################################################################
+
+# The meters' 10-bit ADC codes span 0-5000 mV at the ADC input
+ADC_CODES = 1024
+ADC_MILLIVOLTS = 5000.
+
+# ADC code to volts at the ADC input, as the binary column outputs record it
+ADC_SCALING = {'scale': (ADC_MILLIVOLTS/1000.)/ADC_CODES, 'offset': 0.0, 'units': 'V'}
+
+# The meters sample current and voltage alternately. Both come in as
+# millivolts at the ADC input: the current sensor sits on a 2500 mV offset
+# with 100 mV per amp, and the voltage divider scales line volts by 4300/170000.
+CURRENT_OFFSET = 2500.
+CURRENT_DIVISOR = 100.
+VOLTAGE_SCALE = (170000/4300.)/1000
+
+# Power the multi-meter display has always taken off every reading, the draw of
+# its test setup with nothing plugged in
+IDLE_POWER = 18.30
+
+# The constants a calibration has, and their defaults
+CONSTANTS = {
+	'adc_millivolts': ADC_MILLIVOLTS,
+	'current_offset': CURRENT_OFFSET,
+	'current_divisor': CURRENT_DIVISOR,
+	'voltage_scale': VOLTAGE_SCALE,
+	'idle_power': 0.0,
+}
+
+# Calibration file entry that every meter's constants start from
+DEFAULT_ENTRY = "default"
+
+################################################################################
+################################################################################
+
+# A lookup table of float32 values for every ADC code
+def _table(values):
+	return numpy.asarray(values, dtype=numpy.float32)
+
+# Convert ADC codes through a table. A 10-bit ADC can't give a code past the
+# table, but three hex digits can hold one, those are clipped to its end.
+def _lookup(table, codes):
+	return numpy.take(table, codes, mode='clip')
+
+# Volts at the ADC input of every ADC code, with the default constants
+ADC_VOLT_TABLE = _table(numpy.arange(ADC_CODES) * (ADC_MILLIVOLTS/ADC_CODES) / 1000.)
+
+# Convert ADC codes to volts at the ADC input
+def adc_volts(codes):
+	return _lookup(ADC_VOLT_TABLE, codes)
+
+# One meter's calibration: its constants, and the lookup tables of
+# millivolts at the ADC input, amps and line volts for every ADC code that
+# are built from them. A calibration never changes once built, a new one
+# replaces it.
+class Calibration(object):
+	__slots__ = ('adc_millivolts', 'current_offset', 'current_divisor', 'voltage_scale', 'idle_power', 'millivolt_table', 'current_table', 'voltage_table')
+
+	def __init__(self, adc_millivolts=ADC_MILLIVOLTS, current_offset=CURRENT_OFFSET, current_divisor=CURRENT_DIVISOR, voltage_scale=VOLTAGE_SCALE, idle_power=0.0):
+		self.adc_millivolts = adc_millivolts
+		self.current_offset = current_offset
+		self.current_divisor = current_divisor
+		self.voltage_scale = voltage_scale
+		self.idle_power = idle_power
+
+		millivolts = numpy.arange(ADC_CODES) * (adc_millivolts/ADC_CODES)
+		self.millivolt_table = _table(millivolts)
+		self.current_table = _table((millivolts - current_offset) / current_divisor)
+		self.voltage_table = _table(millivolts * voltage_scale)
+
+	def millivolts(self, codes):
+		return _lookup(self.millivolt_table, codes)
+
+	def current(self, codes):
+		return _lookup(self.current_table, codes)
+
+	def voltage(self, codes):
+		return _lookup(self.voltage_table, codes)
+
+	# Split interleaved ADC codes into current in amps and voltage in
+	# volts, both aligned onto the full sample grid. current_first says
+	# whether the current is sampled first (even samples) or second (odd
+	# samples).
+	def split(self, codes, current_first=True):
+		codes = numpy.asarray(codes)
+		if (current_first):
+			current, voltage = codes[0::2], codes[1::2]
+		else:
+			voltage, current = codes[0::2], codes[1::2]
+		return (align_channel(self.current(current)), align_channel(self.voltage(voltage)))
+
+	# A power reading less the meter's idle power, never below zero once
+	# there's an idle power to take off
+	def net_power(self, power):
+		if (self.idle_power == 0):
+			return power
+		return max(power - self.idle_power, 0.)
+
+################################################################################
+################################################################################
+
+# Every meter's calibration, from a JSON file of constants keyed by meter
+# address, like
+#
+#	{"default": {"idle_power": 18.3},
+#	 "13A20040000001FF": {"current_offset": 2497.5, "voltage_scale": 0.0392}}
+#
+# A meter's constants are the defaults given here, overridden by the file's
+# "default" entry, overridden by its own entry. Meters with the same constants
+# share their lookup tables. reload() picks up changes to the file, and
+# meters' calibrations from get() before it should be looked up again.
+class CalibrationConfig:
+	def __init__(self, path=None, defaults=None):
+		self.path = path
+		self.defaults = dict(CONSTANTS)
+		if (defaults is not None):
+			self.defaults.update(defaults)
+		self.entries = {}
+		self.mtime = None
+		self.calibrations = {}
+		if (path is not None):
+			self.load()
+
+	# Read the calibration file, raising IOError or ValueError (keeping
+	# the calibrations as they were) if it can't be
+	def load(self):
+		mtime = os.stat(self.path).st_mtime
+		f = open(self.path)
+		try:
+			entries = json.load(f)
+		finally:
+			f.close()
+		if (not isinstance(entries, dict)):
+			raise ValueError("%s: expected an object of meter addresses" % self.path)
+		for (address, constants) in entries.items():
+			if (not isinstance(constants, dict)):
+				raise ValueError("%s: entry %s isn't an object of constants" % (self.path, address))
+			for (name, value) in constants.items():
+				if (name not in CONSTANTS):
+					raise ValueError("%s: entry %s has unknown constant %s" % (self.path, address, name))
+				if (not isinstance(value, (int, long, float))):
+					raise ValueError("%s: entry %s has a non-numeric %s" % (self.path, address, name))
+			if (constants.get('current_divisor', 1) == 0):
+				raise ValueError("%s: entry %s has a zero current_divisor" % (self.path, address))
+
+		# Addresses are matched as upper case hex
+		self.entries = dict([(str(address).upper(), constants) for (address, constants) in entries.items()])
+		self.mtime = mtime
+		self.calibrations = {}
+
+	# Reload the calibration file if it has changed since it was read,
+	# returning whether it was. A change that can't be read raises
+	# IOError or ValueError, once.
+	def reload(self):
+		if (self.path is None):
+			return False
+		try:
+			mtime = os.stat(self.path).st_mtime
+		except OSError:
+			return False
+		if (mtime == self.mtime):
+			return False
+		self.mtime = mtime
+		self.load()
+		return True
+
+	# The calibration of a meter by its address, None for a meter without
+	# one (in transparent mode) which gets the defaults
+	def get(self, address=None):
+		constants = dict(self.defaults)
+		constants.update(self.entries.get(DEFAULT_ENTRY.upper(), {}))
+		if (address is not None):
+			constants.update(self.entries.get(address.upper(), {}))
+
+		key = tuple(sorted(constants.items()))
+		try:
+			return self.calibrations[key]
+		except KeyError:
+			calibration = Calibration(**constants)
+			self.calibrations[key] = calibration
+			return calibration
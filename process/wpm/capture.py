@@ -0,0 +1,178 @@
+import os
+import time
+
+################################################################################
+################################################################################
+
+# Bytes buffered before a capture writer writes them out, and the most seconds
+# it holds on to data before it does anyway
+BUFFER_SIZE = 1 << 20
+FLUSH_INTERVAL = 30.0
+
+# Each capture file has a sidecar index of "<host time> <byte offset>" lines,
+# an entry at most every INDEX_INTERVAL seconds, marking where the data
+# received at that time starts in the capture
+INDEX_SUFFIX = ".idx"
+INDEX_INTERVAL = 1.0
+
+# Rotated capture files are named after the UTC host time they were opened at,
+# so names don't repeat when daylight saving time ends. A file opened in the
+# same second as an existing one gets a sequence number after the time.
+ROTATE_TIME_FORMAT = "%Y%m%d-%H%M%SZ"
+ROTATE_SEQUENCE_FORMAT = "-%03d"
+
+################################################################################
+################################################################################
+
+# Writes a raw serial capture through a large buffer, written out when it
+# fills up or every flush_interval seconds, so a logger recording for weeks
+# writes to its SD card a few times a minute instead of on every read.
+#
+# With rotate_size (bytes) or rotate_hourly, the capture is split into files
+# named <path>.<UTC time opened>[-<sequence>], started at the first write past
+# the size or in a new hour, and never reusing an existing file. Otherwise
+# everything goes to path. Files are only ever split between reads, so a frame
+# may straddle two of them; concatenating the files in name order gives the
+# complete capture.
+class CaptureWriter:
+	def __init__(self, path, buffer_size=BUFFER_SIZE, flush_interval=FLUSH_INTERVAL, rotate_size=None, rotate_hourly=False, append=False):
+		self.path = path
+		self.buffer_size = buffer_size
+		self.flush_interval = flush_interval
+		self.rotate_size = rotate_size
+		self.rotate_hourly = rotate_hourly
+		self.append = append
+
+		# Data and index entries waiting to be written
+		self.chunks = []
+		self.buffered = 0
+		self.entries = []
+		self.lastEntry = None
+		self.lastFlush = time.time()
+
+		# The open capture file, its index, its name, the hour it was
+		# opened in and its size including what's buffered
+		self.dataFile = None
+		self.indexFile = None
+		self.filename = None
+		self.hour = None
+		self.size = 0
+
+		# Statistics
+		self.bytes = 0
+		self.flushes = 0
+		self.files = 0
+
+	# A name for a new rotated capture file opened at time now
+	def _rotated_name(self, now):
+		base = "%s.%s" % (self.path, time.strftime(ROTATE_TIME_FORMAT, time.gmtime(now)))
+		filename = base
+		sequence = 0
+		while (os.path.exists(filename) or os.path.exists(filename + INDEX_SUFFIX)):
+			sequence += 1
+			filename = base + ROTATE_SEQUENCE_FORMAT % sequence
+		return filename
+
+	# Open a capture file and its index for data received at time now
+	def _open(self, now):
+		if (self.rotate_size is None and not self.rotate_hourly):
+			filename = self.path
+			mode = "ab" if self.append else "wb"
+		else:
+			filename = self._rotated_name(now)
+			mode = "wb"
+		self.dataFile = open(filename, mode, 0)
+		self.indexFile = open(filename + INDEX_SUFFIX, mode[0], 0)
+		self.filename = filename
+		self.hour = int(now // 3600)
+		self.size = os.fstat(self.dataFile.fileno()).st_size
+		self.lastEntry = None
+		self.files += 1
+
+	# Write out and close the capture file, the next write opens another
+	def _close(self):
+		self.flush()
+		self.dataFile.close()
+		self.indexFile.close()
+		self.dataFile = None
+		self.indexFile = None
+
+	# Whether data received at time now goes in a new capture file
+	def _rotate_due(self, now):
+		if (self.rotate_hourly and int(now // 3600) != self.hour):
+			return True
+		return (self.rotate_size is not None and self.size >= self.rotate_size)
+
+	# Buffer data received at time now (the current time if not given)
+	def write(self, data, now=None):
+		if (len(data) == 0):
+			return
+		if (now is None):
+			now = time.time()
+
+		if (self.dataFile is not None and self._rotate_due(now)):
+			self._close()
+		if (self.dataFile is None):
+			self._open(now)
+
+		if (self.lastEntry is None or now - self.lastEntry >= INDEX_INTERVAL):
+			self.entries.append("%.3f %d\n" % (now, self.size))
+			self.lastEntry = now
+
+		self.chunks.append(data)
+		self.buffered += len(data)
+		self.size += len(data)
+		self.bytes += len(data)
+
+		if (self.buffered >= self.buffer_size):
+			self.flush()
+		else:
+			self.poll(now)
+
+	# Write the buffer out if it has been flush_interval seconds since the
+	# last time, call this now and then when no data is coming in
+	def poll(self, now=None):
+		if (now is None):
+			now = time.time()
+		if (now - self.lastFlush >= self.flush_interval):
+			self.flush()
+
+	# Write out everything buffered
+	def flush(self):
+		self.lastFlush = time.time()
+		if (self.dataFile is None or self.buffered == 0):
+			return
+		self.dataFile.write(b"".join(self.chunks))
+		self.indexFile.write("".join(self.entries))
+		self.chunks = []
+		self.entries = []
+		self.buffered = 0
+		self.flushes += 1
+
+	def close(self):
+		if (self.dataFile is not None):
+			self._close()
+
+################################################################################
+################################################################################
+
+# Read a capture file's index, as a list of (host time, byte offset)
+def read_index(filename):
+	entries = []
+	f = open(filename + INDEX_SUFFIX)
+	for line in f:
+		fields = line.split()
+		if (len(fields) == 2):
+			entries.append((float(fields[0]), int(fields[1])))
+	f.close()
+	return entries
+
+# The byte offset in a capture file of the data received at host time t,
+# from its index entries: the start of the latest entry at or before t
+def index_offset(entries, t):
+	offset = 0
+	for (entryTime, entryOffset) in entries:
+		if (entryTime > t):
+			break
+		offset = entryOffset
+	return offset
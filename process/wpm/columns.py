@@ -0,0 +1,125 @@
+import os
+import json
+import numpy
+
+################################################################################
+################################################################################
+
+# Each meter gets its own directory of append-only column files, with a small
+# JSON header describing them
+HEADER_FILE = "header.json"
+TIME_COLUMN = "time.f64"
+CODE_COLUMN = "code.u16"
+
+# Column data types, stored little endian regardless of the host
+TIME_DTYPE = numpy.dtype('<f8')
+CODE_DTYPE = numpy.dtype('<u2')
+
+################################################################################
+################################################################################
+
+# Append-only timestamp and ADC code columns for a single meter
+class ColumnWriter:
+	def __init__(self, directory, address, sample_period, scaling, append=False):
+		self.directory = directory
+		if (not os.path.isdir(directory)):
+			os.makedirs(directory)
+
+		header = {
+			'address': address,
+			'sample_period': sample_period,
+			'scaling': scaling,
+			'columns': {
+				'time': {'file': TIME_COLUMN, 'dtype': TIME_DTYPE.str},
+				'code': {'file': CODE_COLUMN, 'dtype': CODE_DTYPE.str},
+			},
+		}
+		f = open(os.path.join(directory, HEADER_FILE), "w")
+		json.dump(header, f, indent=1, sort_keys=True)
+		f.close()
+
+		mode = "ab" if append else "wb"
+		self.timeFile = open(os.path.join(directory, TIME_COLUMN), mode)
+		self.codeFile = open(os.path.join(directory, CODE_COLUMN), mode)
+
+	# Append a block of sample timestamps and their ADC codes
+	def write(self, timestamps, codes):
+		self.timeFile.write(numpy.asarray(timestamps, dtype=TIME_DTYPE).tostring())
+		self.codeFile.write(numpy.asarray(codes, dtype=CODE_DTYPE).tostring())
+
+	def flush(self):
+		self.timeFile.flush()
+		self.codeFile.flush()
+
+	def close(self):
+		self.timeFile.close()
+		self.codeFile.close()
+
+# A directory of per-meter column writers, created as meters show up
+class ColumnStore:
+	def __init__(self, directory, sample_period, scaling, append=False):
+		self.directory = directory
+		self.sample_period = sample_period
+		self.scaling = scaling
+		self.append = append
+		self.writers = {}
+
+	# Get the column writer for a meter address
+	def writer(self, address):
+		try:
+			return self.writers[address]
+		except KeyError:
+			w = ColumnWriter(os.path.join(self.directory, address), address, self.sample_period, self.scaling, self.append)
+			self.writers[address] = w
+			return w
+
+	def write(self, address, timestamps, codes):
+		self.writer(address).write(timestamps, codes)
+
+	def flush(self):
+		for w in self.writers.values():
+			w.flush()
+
+	def close(self):
+		for w in self.writers.values():
+			w.close()
+
+################################################################################
+################################################################################
+
+# Memory map a column file read-only, an empty column is an empty array
+def _map_column(path, dtype):
+	# Only map whole records, a writer may be part way through one
+	count = os.path.getsize(path) // dtype.itemsize
+	if (count == 0):
+		return numpy.zeros(0, dtype=dtype)
+	return numpy.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+# Open a meter directory, returning its header and memory mapped timestamp and
+# ADC code columns
+def open_meter(directory):
+	f = open(os.path.join(directory, HEADER_FILE))
+	header = json.load(f)
+	f.close()
+
+	columns = header['columns']
+	timestamps = _map_column(os.path.join(directory, columns['time']['file']), numpy.dtype(str(columns['time']['dtype'])))
+	codes = _map_column(os.path.join(directory, columns['code']['file']), numpy.dtype(str(columns['code']['dtype'])))
+
+	# Trim to the rows both columns have
+	count = min(len(timestamps), len(codes))
+	return (header, timestamps[:count], codes[:count])
+
+# Open every meter directory of a column store, keyed by meter address
+def open_store(directory):
+	meters = {}
+	for name in sorted(os.listdir(directory)):
+		if (os.path.isfile(os.path.join(directory, name, HEADER_FILE))):
+			header, timestamps, codes = open_meter(os.path.join(directory, name))
+			meters[header['address']] = (header, timestamps, codes)
+	return meters
+
+# Convert ADC codes to physical values with a header's scaling
+def scale_codes(header, codes):
+	scaling = header['scaling']
+	return codes*scaling['scale'] + scaling['offset']
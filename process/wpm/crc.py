@@ -0,0 +1,70 @@
+import struct
+
+################################################################################
+################################################################################
+
+# The meter firmware's CRC16 (crc16_bits() in main_logging.c) shifts the data
+# MSB first into a 16-bit register with taps at bits 4, 11 and the input, which
+# is the 0x1021 polynomial with a zero seed.
+CRC16_POLY = 0x1021
+
+################################################################################
+################################################################################
+
+# Perform a CRC16 on 8-bit data blocks with a 16-bit seed, bit by bit, exactly
+# as the firmware does. This is the reference the table below is built from.
+def crc16_bits(data, seed):
+	feedback = 0
+
+	# Keep our variables bound to 8/16 bits
+	data = data & 0xFF
+	seed = seed & 0xFFFF
+
+	# CRC16 Algorithm
+	for i in range(8):
+		feedback = ((data>>7) ^ (seed>>15)) & 0x1
+		if (feedback == 0):
+			seed <<= 1
+			seed = seed & 0xFFFF
+		else:
+			seed ^= (0x10 | 0x800)
+			seed <<= 1
+			seed |= 0x01
+			seed = seed & 0xFFFF
+		data <<= 1
+		data = data & 0xFF
+
+	return seed
+
+# The register after feeding a zero byte into a seed of (i << 8), for every
+# high byte i. Since the CRC is linear, one byte step is then a shift of the
+# seed and an XOR with the entry indexed by the seed's high byte and the data.
+CRC16_TABLE = tuple(crc16_bits(0, i << 8) for i in range(256))
+
+# Perform a CRC16 on a single byte using the lookup table
+def crc16_byte(data, seed):
+	return ((seed << 8) & 0xFFFF) ^ CRC16_TABLE[((seed >> 8) ^ data) & 0xFF]
+
+# Perform a CRC16 over a whole buffer of bytes (str, bytearray, memoryview, or
+# anything else bytearray() accepts) with a 16-bit seed
+def crc16(buffer, seed=0):
+	table = CRC16_TABLE
+	seed = seed & 0xFFFF
+	for data in bytearray(buffer):
+		seed = ((seed << 8) & 0xFFFF) ^ table[(seed >> 8) ^ data]
+	return seed
+
+# Perform a CRC16 over a sequence of 16-bit words, each fed high byte first
+# like the firmware feeds its ADC samples and timestamp halves
+def crc16_words(words, seed=0):
+	# NumPy arrays can be byte swapped in one go
+	if hasattr(words, "astype"):
+		return crc16(words.astype(">u2").tostring(), seed)
+	words = list(words)
+	return crc16(struct.pack(">%dH" % len(words), *words), seed)
+
+# Perform the CRC16 of a complete sample block: the 32-bit millisecond
+# timestamp followed by the ADC sample words
+def crc16_block(timestamp, samples):
+	seed = crc16_words(((timestamp >> 16) & 0xFFFF, timestamp & 0xFFFF))
+	return crc16_words(samples, seed)
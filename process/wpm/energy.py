@@ -0,0 +1,124 @@
+import os
+import time
+from wpm.statefile import save_state, load_state
+
+################################################################################
+################################################################################
+
+# Device timestamps are 32-bit millisecond counts (adc_msHigh and adc_msLow in
+# main_logging.c), which wrap around after about 49 days
+TIMESTAMP_MODULUS = 1 << 32
+
+# Readings further apart than this many milliseconds of device time have a
+# gap between them. No energy is counted for a gap, it's recorded instead.
+MAX_GAP_MS = 60000
+
+# Seconds between checkpoints
+CHECKPOINT_INTERVAL = 60.0
+
+################################################################################
+################################################################################
+
+# The energy drawn by one meter, integrated from its power readings weighted
+# by the device time between them
+class MeterEnergy(object):
+	__slots__ = ('energy', 'covered', 'gaps', 'gap_time', 'readings', 'last_timestamp', 'updated')
+
+	def __init__(self):
+		# Watt hours, and the milliseconds of device time they cover
+		self.energy = 0.0
+		self.covered = 0
+		# Gaps between readings, and the milliseconds they add up to
+		# where that's known
+		self.gaps = 0
+		self.gap_time = 0
+		self.readings = 0
+		# Device timestamp of the last reading, None before the first, and
+		# the host time it arrived at
+		self.last_timestamp = None
+		self.updated = None
+
+	# Add a power reading in watts, from the block with a device timestamp,
+	# returning the watt hours it added
+	def add(self, timestamp, power, now):
+		timestamp = int(timestamp) % TIMESTAMP_MODULUS
+		energy = 0.0
+		if (self.last_timestamp is not None):
+			elapsed = (timestamp - self.last_timestamp) % TIMESTAMP_MODULUS
+			if (elapsed == 0 or elapsed > TIMESTAMP_MODULUS // 2):
+				# A repeated or earlier timestamp, a duplicate block
+				# or the meter restarted; start over from this one
+				self.gaps += 1
+			elif (elapsed > MAX_GAP_MS):
+				self.gaps += 1
+				self.gap_time += elapsed
+			else:
+				energy = power * elapsed / 3600000.
+				self.energy += energy
+				self.covered += elapsed
+		self.last_timestamp = timestamp
+		self.updated = now
+		self.readings += 1
+		return energy
+
+	def to_dict(self):
+		return dict([(name, getattr(self, name)) for name in self.__slots__])
+
+	@classmethod
+	def from_dict(cls, state):
+		meter = cls()
+		for name in cls.__slots__:
+			if (name in state):
+				setattr(meter, name, state[name])
+		return meter
+
+# Every meter's energy, keyed by meter address, checkpointed to a JSON file
+# every checkpoint_interval seconds and on close. Checkpoints are written
+# atomically, so the file always holds a whole checkpoint, and an accumulator
+# opened on it resumes from there. Without a path the energy is only kept in
+# memory.
+class EnergyAccumulator:
+	def __init__(self, path=None, checkpoint_interval=CHECKPOINT_INTERVAL):
+		self.path = path
+		self.checkpoint_interval = checkpoint_interval
+		self.meters = {}
+		if (path is not None and os.path.exists(path)):
+			self.meters = load_checkpoint(path)
+		self.lastCheckpoint = time.time()
+
+	# Add a power reading from a meter, checkpointing if it's time to.
+	# Returns the watt hours it added.
+	def add(self, address, timestamp, power):
+		now = time.time()
+		try:
+			meter = self.meters[address]
+		except KeyError:
+			meter = MeterEnergy()
+			self.meters[address] = meter
+		energy = meter.add(timestamp, power, now)
+
+		if (self.path is not None and now - self.lastCheckpoint >= self.checkpoint_interval):
+			self.checkpoint()
+		return energy
+
+	# Write every meter's state to the checkpoint file
+	def checkpoint(self):
+		self.lastCheckpoint = time.time()
+		state = {
+			'time': self.lastCheckpoint,
+			'meters': dict([(address, meter.to_dict()) for (address, meter) in self.meters.items()]),
+		}
+
+		save_state(self.path, state)
+
+	def close(self):
+		if (self.path is not None):
+			self.checkpoint()
+
+################################################################################
+################################################################################
+
+# Read a checkpoint, as MeterEnergy keyed by meter address
+def load_checkpoint(path):
+	state = load_state(path)
+	return dict([(str(address), MeterEnergy.from_dict(meter)) for (address, meter) in state['meters'].items()])
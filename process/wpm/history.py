@@ -0,0 +1,200 @@
+import collections
+import numpy
+
+################################################################################
+################################################################################
+
+# Readings a time window has room for to start with, a little over an hour at
+# one reading a second. It doubles whenever it fills up with readings still in
+# the window, so a window always covers all of its time.
+WINDOW_CAPACITY = 4096
+
+################################################################################
+################################################################################
+
+# A fixed capacity ring buffer of timestamped readings, backed by NumPy arrays.
+# Pushing overwrites the oldest reading once it is full.
+class RingBuffer:
+	def __init__(self, capacity, dtype=numpy.float64):
+		self.capacity = capacity
+		self.times = numpy.zeros(capacity, dtype=numpy.float64)
+		self.values = numpy.zeros(capacity, dtype=dtype)
+		# Index of the oldest reading, and the number of readings
+		self.start = 0
+		self.count = 0
+
+	def __len__(self):
+		return self.count
+
+	def full(self):
+		return self.count == self.capacity
+
+	# Add a reading, returning the (time, value) it overwrote, or None
+	def push(self, t, value):
+		evicted = None
+		if (self.count == self.capacity):
+			evicted = self.pop()
+		i = (self.start + self.count) % self.capacity
+		self.times[i] = t
+		self.values[i] = value
+		self.count += 1
+		return evicted
+
+	# Remove and return the oldest (time, value)
+	def pop(self):
+		if (self.count == 0):
+			raise IndexError("pop from an empty ring buffer")
+		i = self.start
+		self.start = (self.start + 1) % self.capacity
+		self.count -= 1
+		return (self.times[i], self.values[i])
+
+	# The oldest (time, value)
+	def oldest(self):
+		if (self.count == 0):
+			raise IndexError("empty ring buffer")
+		return (self.times[self.start], self.values[self.start])
+
+	# The readings, oldest first, as (times, values) arrays
+	def arrays(self):
+		order = (self.start + numpy.arange(self.count)) % self.capacity
+		return (self.times[order], self.values[order])
+
+	# The last n values, newest first
+	def latest(self, n):
+		n = min(n, self.count)
+		order = (self.start + self.count - 1 - numpy.arange(n)) % self.capacity
+		return self.values[order]
+
+	# Make room for capacity readings, keeping the ones there are
+	def grow(self, capacity):
+		(times, values) = self.arrays()
+		self.times = numpy.zeros(capacity, dtype=numpy.float64)
+		self.values = numpy.zeros(capacity, dtype=self.values.dtype)
+		self.times[:self.count] = times
+		self.values[:self.count] = values
+		self.capacity = capacity
+		self.start = 0
+
+	def clear(self):
+		self.start = 0
+		self.count = 0
+
+################################################################################
+################################################################################
+
+# Rolling statistics over the last count readings, or the readings of the last
+# seconds seconds, or both. A window of only seconds grows its buffer to hold
+# however many readings arrive in that time. Mean and variance are kept up to date as readings
+# come and go (Welford's method, run backwards for removals), and min and max
+# with monotonic queues, so every push and every statistic is O(1) amortised.
+class RollingWindow:
+	def __init__(self, count=None, seconds=None, capacity=WINDOW_CAPACITY):
+		if (count is not None):
+			capacity = count
+		self.count = count
+		self.seconds = seconds
+		self.buffer = RingBuffer(capacity)
+
+		self._mean = 0.0
+		self._m2 = 0.0
+
+		# Candidate minimums (increasing) and maximums (decreasing) as
+		# (sequence number, value), and the sequence number of the
+		# next reading
+		self.mins = collections.deque()
+		self.maxs = collections.deque()
+		self.sequence = 0
+
+	def __len__(self):
+		return len(self.buffer)
+
+	def push(self, t, value):
+		value = float(value)
+
+		# Drop readings that have aged out of the window, then make
+		# room for this one
+		if (self.seconds is not None):
+			while (len(self.buffer) > 0 and t - self.buffer.oldest()[0] > self.seconds):
+				self._remove(self.buffer.pop()[1])
+		if (self.buffer.full()):
+			if (self.count is None):
+				self.buffer.grow(2 * self.buffer.capacity)
+			else:
+				self._remove(self.buffer.pop()[1])
+		self.buffer.push(t, value)
+		self._add(value)
+
+		while (len(self.mins) > 0 and self.mins[-1][1] >= value):
+			self.mins.pop()
+		self.mins.append((self.sequence, value))
+		while (len(self.maxs) > 0 and self.maxs[-1][1] <= value):
+			self.maxs.pop()
+		self.maxs.append((self.sequence, value))
+		self.sequence += 1
+
+		# Drop min and max candidates that have left the window
+		oldest = self.sequence - len(self.buffer)
+		while (self.mins[0][0] < oldest):
+			self.mins.popleft()
+		while (self.maxs[0][0] < oldest):
+			self.maxs.popleft()
+
+	def _add(self, value):
+		n = len(self.buffer)
+		delta = value - self._mean
+		self._mean += delta / n
+		self._m2 += delta * (value - self._mean)
+
+	# Called with the reading already out of the buffer
+	def _remove(self, value):
+		n = len(self.buffer)
+		if (n == 0):
+			self._mean = 0.0
+			self._m2 = 0.0
+			return
+		delta = value - self._mean
+		self._mean -= delta / n
+		self._m2 = max(0.0, self._m2 - delta * (value - self._mean))
+
+	def mean(self):
+		return self._mean
+
+	# Sample variance of the readings in the window
+	def variance(self):
+		n = len(self.buffer)
+		if (n < 2):
+			return 0.0
+		return self._m2 / (n - 1)
+
+	def std(self):
+		return numpy.sqrt(self.variance())
+
+	def min(self):
+		if (len(self.mins) == 0):
+			return None
+		return self.mins[0][1]
+
+	def max(self):
+		if (len(self.maxs) == 0):
+			return None
+		return self.maxs[0][1]
+
+	# The last n readings, newest first
+	def latest(self, n):
+		return self.buffer.latest(n)
+
+################################################################################
+################################################################################
+
+# A meter's power readings: the last few for the console, and rolling windows
+# of the last minute and hour
+class PowerHistory:
+	def __init__(self, latest=5, windows=(60, 3600)):
+		self.recent = RollingWindow(count=latest)
+		self.windows = [RollingWindow(seconds=seconds) for seconds in windows]
+
+	def push(self, t, power):
+		self.recent.push(t, power)
+		for window in self.windows:
+			window.push(t, power)
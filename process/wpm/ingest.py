@@ -0,0 +1,176 @@
+import os
+import time
+import errno
+import select
+import serial
+from wpm.xbee import APIFrameDecoder, API_RECEIVE_PACKET
+from wpm.samples import decode_samples
+from wpm.meters import MeterRegistry
+
+################################################################################
+################################################################################
+
+# Most bytes read from a port at a time
+READ_SIZE = 4096
+
+# Serial port settings of an XBee coordinator
+BAUDRATE = 9600
+
+# Seconds a partially received sample block is kept waiting for the rest of
+# its frames
+BLOCK_MAX_AGE = 10.0
+
+################################################################################
+################################################################################
+
+# A serial port (or a pty, FIFO or capture file standing in for one) with an
+# XBee coordinator in API mode on the other end. Time spent reading the port,
+# decoding sample blocks and in the handler is observed into the stages
+# histogram, if given.
+class PortStream:
+	def __init__(self, path, handler, max_age=BLOCK_MAX_AGE, stages=None):
+		self.path = path
+		self.handler = handler
+		self.stages = stages
+		self.serial = None
+
+		# Real serial ports and ptys get their line settings, anything
+		# else is read as is
+		fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK | os.O_NOCTTY)
+		if (os.isatty(fd)):
+			os.close(fd)
+			self.serial = serial.Serial(path, baudrate=BAUDRATE, bytesize=8, parity='N', stopbits=1, timeout=0)
+			fd = self.serial.fileno()
+		self.fd = fd
+
+		self.decoder = APIFrameDecoder()
+		# The meters on this port, keyed by the source address bytes of
+		# their frames
+		self.meters = MeterRegistry(max_age)
+
+		self.bytes = 0
+		self.frames = 0
+
+	# Read whatever the port has and route the frames in it to their
+	# meters. Returns False once the port has closed or hit its end.
+	def read(self):
+		try:
+			data = os.read(self.fd, READ_SIZE)
+		except OSError as (e):
+			if (e.errno == errno.EAGAIN or e.errno == errno.EINTR):
+				return True
+			# A pty whose other end closed reads as EIO
+			return False
+		if (len(data) == 0):
+			return False
+
+		self.bytes += len(data)
+		stages = self.stages
+		now = time.time()
+		for frame in self.decoder.feed(data):
+			self.frames += 1
+			if (frame.frame_type != API_RECEIVE_PACKET or frame.source is None):
+				continue
+			meter = self.meters.get(frame.source, frame.name)
+			meter.frames += 1
+
+			# Reassemble the meter's sample blocks, and only hand
+			# over blocks with a matching checksum
+			payload = meter.assembler.add(frame.frame_id, frame.payload, now)
+			if (payload is None):
+				continue
+			if (stages is not None):
+				t0 = time.time()
+			block = decode_samples(payload)
+			if (block is None or not block.checksum_ok()):
+				meter.bad_blocks += 1
+				continue
+			meter.blocks += 1
+			meter.samples += len(block.samples)
+			if (stages is not None):
+				t1 = time.time()
+				stages.observe(t1 - t0, "decode")
+			self.handler(self, meter, block)
+			if (stages is not None):
+				stages.observe(time.time() - t1, "sink")
+		if (stages is not None):
+			stages.observe(time.time() - now, "read")
+		return True
+
+	def close(self):
+		if (self.serial is not None):
+			self.serial.close()
+		else:
+			os.close(self.fd)
+
+################################################################################
+################################################################################
+
+# Reads any number of ports on one thread, waiting on all of them at once with
+# poll(), and hands every sample block with a good checksum to
+# handler(port, meter, block), meter being the port's Meter it came from.
+# Partial sample blocks are evicted after max_age seconds. Stage times go to
+# the stages histogram, if given, as PortStream's do.
+class IngestLoop:
+	def __init__(self, handler, max_age=BLOCK_MAX_AGE, stages=None):
+		self.handler = handler
+		self.max_age = max_age
+		self.stages = stages
+		self.ports = {}
+		self.closed = []
+		self.poller = select.poll()
+		self.stop = False
+
+	def add_port(self, path):
+		port = PortStream(path, self.handler, self.max_age, self.stages)
+		self.ports[port.fd] = port
+		self.poller.register(port.fd, select.POLLIN | select.POLLPRI)
+		return port
+
+	def remove_port(self, port):
+		self.poller.unregister(port.fd)
+		del self.ports[port.fd]
+		port.close()
+		self.closed.append(port)
+
+	# Every meter seen so far, on open and closed ports
+	def meters(self):
+		meters = []
+		for port in self.ports.values() + self.closed:
+			meters.extend(port.meters)
+		return meters
+
+	# Run until stopped, every port has closed, or duration seconds have
+	# passed. tick(), if given, is called about every interval seconds.
+	def run(self, duration=None, tick=None, interval=1.0):
+		start = time.time()
+		nextTick = start + interval
+		while not self.stop and len(self.ports) > 0:
+			now = time.time()
+			if (duration is not None and now - start >= duration):
+				break
+			if (now >= nextTick):
+				# Drop blocks from meters that stopped part way
+				# through
+				for port in self.ports.values():
+					port.meters.expire(now)
+				if (tick is not None):
+					tick()
+				nextTick = now + interval
+
+			# Wait for data until the next tick or the end of the run
+			wait = nextTick - now
+			if (duration is not None):
+				wait = min(wait, start + duration - now)
+
+			try:
+				events = self.poller.poll(int(1000*max(0, wait)))
+			except select.error as (e):
+				if (e.args[0] == errno.EINTR):
+					continue
+				raise
+
+			for (fd, event) in events:
+				port = self.ports[fd]
+				if (not port.read()):
+					self.remove_port(port)
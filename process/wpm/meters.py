@@ -0,0 +1,126 @@
+from wpm.reassembly import BlockAssembler
+
+################################################################################
+################################################################################
+
+# Everything tracked about one meter. Meters are created by the thousand on a
+# busy coordinator and looked at on every frame, so the state is kept in slots.
+class Meter(object):
+	__slots__ = ('index', 'source', 'name', '_address', 'assembler', 'last_timestamp', 'calibration', 'frames', 'blocks', 'bad_blocks', 'stale_blocks', 'samples')
+
+	def __init__(self, index, source, name=None, max_age=None):
+		# Order the meter was first seen in, the raw 64-bit source
+		# address of its frames, and the raw bytes of the name it's
+		# output under (see wpm.xbee), the source address if it has none
+		self.index = index
+		self.source = source
+		self.name = name if name is not None else source
+		self._address = None
+
+		# Sample block reassembly, which also counts the completed,
+		# incomplete and evicted blocks
+		self.assembler = BlockAssembler(max_age)
+
+		# Timestamp of the last sample block, -1 before the first
+		self.last_timestamp = -1
+		# Calibration of the meter's samples, None for the defaults
+		self.calibration = None
+
+		# Statistics: frames received, assembled blocks that decoded
+		# with a good checksum and that didn't, blocks dropped for an old
+		# timestamp, and samples passed on
+		self.frames = 0
+		self.blocks = 0
+		self.bad_blocks = 0
+		self.stale_blocks = 0
+		self.samples = 0
+
+	# The name as a hex string, for display and output only
+	@property
+	def address(self):
+		if (self._address is None):
+			self._address = "".join(["%02X" % b for b in bytearray(self.name)])
+		return self._address
+
+	# The meter's state, as a dict that can be saved as JSON. Calibration
+	# comes from its own configuration and isn't saved.
+	def save(self):
+		return {
+			'source': self.source.encode('hex'),
+			'name': self.name.encode('hex'),
+			'last_timestamp': self.last_timestamp,
+			'frames': self.frames,
+			'blocks': self.blocks,
+			'bad_blocks': self.bad_blocks,
+			'stale_blocks': self.stale_blocks,
+			'samples': self.samples,
+			'assembler': self.assembler.save(),
+		}
+
+	# Pick up the state from save()
+	def restore(self, state):
+		self.last_timestamp = state['last_timestamp']
+		self.frames = state['frames']
+		self.blocks = state['blocks']
+		self.bad_blocks = state['bad_blocks']
+		self.stale_blocks = state.get('stale_blocks', 0)
+		self.samples = state.get('samples', 0)
+		self.assembler.restore(state['assembler'])
+
+# Meters keyed by the raw 64-bit source address of their frames, in the order
+# they were first seen. Partial sample blocks are evicted after max_age seconds,
+# if one is given.
+class MeterRegistry:
+	def __init__(self, max_age=None):
+		self.max_age = max_age
+		self.meters = {}
+		self.ordered = []
+
+	def __len__(self):
+		return len(self.ordered)
+
+	def __iter__(self):
+		return iter(self.ordered)
+
+	# The meter with an index
+	def __getitem__(self, index):
+		return self.ordered[index]
+
+	# The meter with a source address, registering it under a name if it's
+	# new
+	def get(self, source, name=None):
+		try:
+			return self.meters[source]
+		except KeyError:
+			meter = Meter(len(self.ordered), source, name, self.max_age)
+			self.meters[source] = meter
+			self.ordered.append(meter)
+			return meter
+
+	# The meter with a source address, or None if it hasn't been seen
+	def find(self, source):
+		return self.meters.get(source)
+
+	# Every meter's state, in the order they were first seen, as a list that
+	# can be saved as JSON
+	def save(self):
+		return [meter.save() for meter in self.ordered]
+
+	# Register the meters saved with save(), in the same order
+	def restore(self, states):
+		for state in states:
+			self.get(state['source'].decode('hex'), state['name'].decode('hex')).restore(state)
+
+	# Drop every meter's partial sample block
+	def clear_reassembly(self):
+		for meter in self.ordered:
+			meter.assembler.reset()
+
+	# Evict partial sample blocks older than max_age at time now, returns
+	# how many were
+	def expire(self, now):
+		evicted = 0
+		for meter in self.ordered:
+			if (meter.assembler.expire(now)):
+				evicted += 1
+		return evicted
@@ -0,0 +1,202 @@
+import sys
+import time
+import bisect
+import signal
+import threading
+import BaseHTTPServer
+
+################################################################################
+################################################################################
+
+# Histogram bucket upper bounds for stage processing times, in seconds
+STAGE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Metrics are served to localhost only, on a port given on the command line
+METRICS_HOST = "127.0.0.1"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+################################################################################
+################################################################################
+
+# Format a metric's labels, {name="value",...}
+def _labels(labels):
+	if (not labels):
+		return ""
+	pairs = []
+	for (name, value) in sorted(labels.items()):
+		value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+		pairs.append("%s=\"%s\"" % (name, value))
+	return "{" + ",".join(pairs) + "}"
+
+# Format a value the way Prometheus expects
+def _value(value):
+	if (isinstance(value, float)):
+		return repr(value)
+	return str(value)
+
+# A histogram of observations, such as how long a processing stage took, with
+# a series for each value of an optional label. The lock is reentrant because
+# the SIGUSR1 dump renders on the main thread, which may be in observe() with
+# the lock held when the signal arrives; a dump then sees that one
+# observation half counted.
+class Histogram:
+	def __init__(self, name, help, label=None, buckets=STAGE_BUCKETS):
+		self.name = name
+		self.help = help
+		self.label = label
+		self.buckets = tuple(buckets)
+		self.series = {}
+		self.lock = threading.RLock()
+
+	def observe(self, value, label=None):
+		i = bisect.bisect_left(self.buckets, value)
+		with self.lock:
+			try:
+				series = self.series[label]
+			except KeyError:
+				series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+				self.series[label] = series
+			series[0][i] += 1
+			series[1] += value
+			series[2] += 1
+
+	# Every series' (label, count, total), sorted by label
+	def totals(self):
+		with self.lock:
+			return sorted([(label, count, total) for (label, (counts, total, count)) in self.series.items()])
+
+	def render(self):
+		lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s histogram" % self.name]
+		with self.lock:
+			series = [(label, list(counts), total, count) for (label, (counts, total, count)) in self.series.items()]
+		for (label, counts, total, count) in sorted(series):
+			labels = {}
+			if (self.label is not None):
+				labels[self.label] = label
+			cumulative = 0
+			for (bound, n) in zip(self.buckets + (float('inf'),), counts):
+				cumulative += n
+				le = "+Inf" if bound == float('inf') else repr(bound)
+				lines.append("%s_bucket%s %d" % (self.name, _labels(dict(labels, le=le)), cumulative))
+			lines.append("%s_sum%s %s" % (self.name, _labels(labels), _value(total)))
+			lines.append("%s_count%s %d" % (self.name, _labels(labels), count))
+		return lines
+
+# The metrics of a script: histograms it observes into, and collectors that
+# read counters kept elsewhere when the metrics are rendered. A collector
+# returns a list of (name, type, help, samples), samples being a list of
+# (labels dict, value).
+class Metrics:
+	def __init__(self):
+		self.histograms = []
+		self.collectors = []
+		self.started = time.time()
+
+	def histogram(self, name, help, label=None, buckets=STAGE_BUCKETS):
+		h = Histogram(name, help, label, buckets)
+		self.histograms.append(h)
+		return h
+
+	def collector(self, collect):
+		self.collectors.append(collect)
+
+	# Every metric in the Prometheus text format
+	def render(self):
+		lines = [
+			"# HELP wpm_uptime_seconds Seconds since the script started.",
+			"# TYPE wpm_uptime_seconds gauge",
+			"wpm_uptime_seconds %s" % _value(time.time() - self.started),
+		]
+		for collect in self.collectors:
+			for (name, kind, help, samples) in collect():
+				lines.append("# HELP %s %s" % (name, help))
+				lines.append("# TYPE %s %s" % (name, kind))
+				for (labels, value) in samples:
+					lines.append("%s%s %s" % (name, _labels(labels), _value(value)))
+		for h in self.histograms:
+			lines.extend(h.render())
+		return "\n".join(lines) + "\n"
+
+################################################################################
+################################################################################
+
+# The counters of frame decoding and of the meters behind it, as a collector.
+# sources() returns the pipelines to report as a list of (labels, bytes,
+# frame stats, meter registry), the labels telling them apart.
+def pipeline_collector(sources):
+	def collect():
+		pipelines = []
+		meters = []
+		for (labels, byteCount, stats, registry) in sources():
+			pipelines.append((labels, byteCount, stats, len(registry)))
+			for meter in registry:
+				meters.append((dict(labels, meter=meter.address), meter))
+		return [
+			("wpm_bytes_total", "counter", "Bytes of raw data read.", [(labels, n) for (labels, n, stats, count) in pipelines]),
+			("wpm_frames_total", "counter", "API frames with a good checksum.", [(labels, stats.frames) for (labels, n, stats, count) in pipelines]),
+			("wpm_frame_checksum_errors_total", "counter", "Start delimiters whose frame failed its API checksum, corrupt frames or 0x7E bytes in frame data.", [(labels, stats.checksum_errors) for (labels, n, stats, count) in pipelines]),
+			("wpm_meters", "gauge", "Meters seen.", [(labels, count) for (labels, n, stats, count) in pipelines]),
+			("wpm_meter_frames_total", "counter", "Sample data frames received from a meter.", [(labels, m.frames) for (labels, m) in meters]),
+			("wpm_meter_blocks_total", "counter", "Sample blocks from a meter with a good CRC.", [(labels, m.blocks) for (labels, m) in meters]),
+			("wpm_meter_bad_blocks_total", "counter", "Sample blocks from a meter with a CRC mismatch, or that didn't decode.", [(labels, m.bad_blocks) for (labels, m) in meters]),
+			("wpm_meter_stale_blocks_total", "counter", "Sample blocks from a meter dropped for a timestamp older than the last.", [(labels, m.stale_blocks) for (labels, m) in meters]),
+			("wpm_meter_incomplete_blocks_total", "counter", "Sample blocks from a meter dropped with frames missing.", [(labels, m.assembler.incomplete) for (labels, m) in meters]),
+			("wpm_meter_evicted_blocks_total", "counter", "Partial sample blocks from a meter evicted for being too old.", [(labels, m.assembler.evicted) for (labels, m) in meters]),
+			("wpm_meter_samples_total", "counter", "Samples from a meter passed on, take its rate for the sample rate.", [(labels, m.samples) for (labels, m) in meters]),
+		]
+	return collect
+
+# The counters of StageQueues handing data between threads, as a collector
+def queue_collector(queues):
+	def collect():
+		return [
+			("wpm_queue_items_total", "counter", "Items passed through a queue.", [({'queue': q.name}, q.passed) for q in queues]),
+			("wpm_queue_dropped_total", "counter", "Items a queue dropped for being full.", [({'queue': q.name}, q.dropped) for q in queues]),
+			("wpm_queue_waits_total", "counter", "Times a queue made its producer wait for room.", [({'queue': q.name}, q.waited) for q in queues]),
+		]
+	return collect
+
+################################################################################
+################################################################################
+
+# Serves the metrics as /metrics over HTTP from a thread of its own
+class MetricsServer(threading.Thread):
+	def __init__(self, metrics, port, host=METRICS_HOST):
+		threading.Thread.__init__(self)
+		self.daemon = True
+
+		class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+			def do_GET(self):
+				if (self.path.split("?")[0] != "/metrics"):
+					self.send_error(404)
+					return
+				body = metrics.render()
+				self.send_response(200)
+				self.send_header("Content-Type", CONTENT_TYPE)
+				self.send_header("Content-Length", str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			# Scrapes would flood the scripts' own output
+			def log_message(self, format, *args):
+				pass
+
+		self.server = BaseHTTPServer.HTTPServer((host, port), Handler)
+
+	def run(self):
+		self.server.serve_forever()
+
+# Serve the metrics on a localhost port if one is given, and dump them to
+# stderr on SIGUSR1 either way
+def export_metrics(metrics, port=None):
+	def dump(signum, frame):
+		sys.stderr.write(metrics.render())
+		sys.stderr.flush()
+	signal.signal(signal.SIGUSR1, dump)
+
+	if (port is not None):
+		server = MetricsServer(metrics, port)
+		server.start()
+		return server
+	return None
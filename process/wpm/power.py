@@ -0,0 +1,44 @@
+import collections
+import numpy
+
+################################################################################
+################################################################################
+
+# Measurements over a block of samples. Real power is the mean of i*v, and the
+# power factor is real over apparent power (0 with no current or voltage).
+# rectified is the mean of |i|*v, the figure the live demos have always
+# integrated into their power readings, kept so those readings don't change.
+PowerReading = collections.namedtuple('PowerReading', 'vrms irms real apparent power_factor rectified samples')
+
+################################################################################
+################################################################################
+
+# Bring a channel sampled on every other sample onto the full sample grid,
+# interpolating half a sample period between its samples: each sample is
+# preceded by the mean of it and the one before it (the first by itself)
+def align_channel(channel):
+	aligned = numpy.empty(2*len(channel), dtype=numpy.float64)
+	if (len(channel) == 0):
+		return aligned
+	aligned[1::2] = channel
+	aligned[0] = channel[0]
+	aligned[2::2] = (channel[:-1] + channel[1:]) / 2
+	return aligned
+
+# Measure aligned current and voltage, over the samples both have
+def measure(current, voltage):
+	n = min(len(current), len(voltage))
+	if (n == 0):
+		return PowerReading(0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0)
+	current = current[:n]
+	voltage = voltage[:n]
+
+	vrms = numpy.sqrt(numpy.dot(voltage, voltage) / n)
+	irms = numpy.sqrt(numpy.dot(current, current) / n)
+	real = numpy.dot(current, voltage) / n
+	rectified = numpy.dot(numpy.abs(current), voltage) / n
+	apparent = vrms * irms
+	power_factor = 0.0
+	if (apparent > 0):
+		power_factor = real / apparent
+	return PowerReading(float(vrms), float(irms), float(real), float(apparent), float(power_factor), float(rectified), n)
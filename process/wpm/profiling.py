@@ -0,0 +1,249 @@
+import gc
+import os
+import sys
+import time
+import atexit
+import pstats
+import cProfile
+import threading
+import collections
+from wpm.statefile import write_atomic
+
+# tracemalloc only comes with Python 3.4 and later, --trace-malloc counts
+# objects by type without it
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+
+################################################################################
+################################################################################
+
+# Milliseconds between stack samples, unless given on the command line
+SAMPLE_INTERVAL = 20
+# Seconds between rewriting the stack sample file, so a script left running
+# with sampling on always has a recent one
+SAMPLE_WRITE_INTERVAL = 60.0
+# Innermost frames of a stack kept per sample
+SAMPLE_DEPTH = 32
+
+# Allocation sites (or object types) reported per --trace-malloc snapshot
+MALLOC_TOP = 10
+
+################################################################################
+################################################################################
+
+# Add the profiling options to a script's command line
+def add_profile_arguments(parser):
+	group = parser.add_argument_group("profiling")
+	group.add_argument("--profile", metavar="FILE", help="write a cProfile dump of every thread to FILE on exit, and print the wall time spent in each processing stage")
+	group.add_argument("--trace-malloc", type=float, metavar="SECONDS", help="report the top allocation sites every SECONDS (object counts by type where tracemalloc isn't available)")
+	group.add_argument("--sample", metavar="FILE", help="sample every thread's stack and write the counts to FILE as collapsed stacks (flamegraph.pl input), cheap enough to leave on")
+	group.add_argument("--sample-interval", type=float, default=SAMPLE_INTERVAL, metavar="MS", help="milliseconds between stack samples (default: %(default)s)")
+
+################################################################################
+################################################################################
+
+# cProfile of every thread started after start(), and the main thread. Each
+# thread gets its own profiler (cProfile only sees the thread enabling it),
+# and they're merged into one dump.
+class ThreadProfiler:
+	def __init__(self, path):
+		self.path = path
+		self.profiles = []
+		self.lock = threading.Lock()
+
+	def _start_thread(self, frame, event, arg):
+		profile = cProfile.Profile()
+		with self.lock:
+			self.profiles.append(profile)
+		# Replaces this hook as the thread's profile function
+		profile.enable()
+
+	def start(self):
+		threading.setprofile(self._start_thread)
+		self._start_thread(None, None, None)
+
+	def stop(self):
+		threading.setprofile(None)
+		with self.lock:
+			profiles = list(self.profiles)
+		profiles[0].disable()
+		stats = pstats.Stats(profiles[0])
+		for profile in profiles[1:]:
+			stats.add(profile)
+		stats.dump_stats(self.path)
+
+# Samples the stack of every thread but the profiling ones every interval
+# seconds from a thread of its own, counting each distinct stack. Costs a stack
+# walk per thread per sample and nothing in between.
+class StackSampler(threading.Thread):
+	def __init__(self, path, interval):
+		threading.Thread.__init__(self, name="stack sampler")
+		self.daemon = True
+		self.path = path
+		self.interval = interval
+		self.counts = collections.defaultdict(int)
+		self.samples = 0
+		self.lock = threading.Lock()
+		self.stopping = threading.Event()
+
+	# A frame's stack as "file:function;...", outermost first
+	def _stack(self, frame):
+		names = []
+		while (frame is not None and len(names) < SAMPLE_DEPTH):
+			code = frame.f_code
+			names.append("%s:%s" % (os.path.basename(code.co_filename), code.co_name))
+			frame = frame.f_back
+		names.reverse()
+		return ";".join(names)
+
+	def run(self):
+		names = {}
+		lastWrite = time.time()
+		while not self.stopping.wait(self.interval):
+			for thread in threading.enumerate():
+				if (isinstance(thread, (StackSampler, MallocTracer))):
+					names[thread.ident] = None
+				else:
+					names[thread.ident] = thread.name
+			with self.lock:
+				for (ident, frame) in sys._current_frames().items():
+					if (names.get(ident, "") is None):
+						continue
+					self.counts[names.get(ident, "thread") + ";" + self._stack(frame)] += 1
+				self.samples += 1
+
+			if (time.time() - lastWrite >= SAMPLE_WRITE_INTERVAL):
+				self.write()
+				lastWrite = time.time()
+
+	def stop(self):
+		self.stopping.set()
+		self.join()
+
+	# Write the counts as collapsed stacks, most sampled first
+	def write(self):
+		with self.lock:
+			counts = sorted(self.counts.items(), key=lambda item: -item[1])
+		write_atomic(self.path, "".join(["%s %d\n" % (stack, count) for (stack, count) in counts]))
+
+# Reports the top allocation sites every interval seconds, with how much they
+# grew since the last report. Without tracemalloc it counts the objects the
+# garbage collector tracks by type instead, which still shows which lists and
+# dicts pile up, though not where they were allocated.
+class MallocTracer(threading.Thread):
+	def __init__(self, interval, output=sys.stderr):
+		threading.Thread.__init__(self, name="malloc tracer")
+		self.daemon = True
+		self.interval = interval
+		self.output = output
+		self.stopping = threading.Event()
+		if (tracemalloc is not None):
+			tracemalloc.start()
+
+	def _report_tracemalloc(self, last):
+		snapshot = tracemalloc.take_snapshot()
+		if (last is None):
+			stats = snapshot.statistics('lineno')
+		else:
+			stats = snapshot.compare_to(last, 'lineno')
+		lines = ["malloc: top %d allocation sites" % MALLOC_TOP]
+		for stat in stats[:MALLOC_TOP]:
+			lines.append("  %s" % stat)
+		return (snapshot, lines)
+
+	def _report_types(self, last):
+		counts = collections.defaultdict(int)
+		sizes = collections.defaultdict(int)
+		for obj in gc.get_objects():
+			name = type(obj).__name__
+			counts[name] += 1
+			sizes[name] += sys.getsizeof(obj, 0)
+		if (last is None):
+			last = {}
+		lines = ["malloc: top %d object types (tracemalloc isn't available)" % MALLOC_TOP]
+		for name in sorted(sizes.keys(), key=lambda n: -sizes[n])[:MALLOC_TOP]:
+			lines.append("  %-24s %9d objects (%+d) %12d bytes" % (name, counts[name], counts[name] - last.get(name, 0), sizes[name]))
+		return (dict(counts), lines)
+
+	def report(self, last=None):
+		if (tracemalloc is not None):
+			(snapshot, lines) = self._report_tracemalloc(last)
+		else:
+			(snapshot, lines) = self._report_types(last)
+		self.output.write("\n".join(lines) + "\n")
+		self.output.flush()
+		return snapshot
+
+	def run(self):
+		last = None
+		while not self.stopping.wait(self.interval):
+			last = self.report(last)
+
+	def stop(self):
+		self.stopping.set()
+		self.join()
+
+################################################################################
+################################################################################
+
+# The profiling a script was asked for on its command line. The stage summary
+# comes from the script's stage timing histogram, if it has one.
+class Profiler:
+	def __init__(self, args, stages=None, output=sys.stderr):
+		self.args = args
+		self.stages = stages
+		self.output = output
+		self.profiler = None
+		self.sampler = None
+		self.tracer = None
+		self.started = None
+		self.stopped = False
+
+	# The profiling threads start before cProfile, so it leaves them out
+	def start(self):
+		self.started = time.time()
+		if (self.args.sample is not None):
+			self.sampler = StackSampler(self.args.sample, self.args.sample_interval / 1000.)
+			self.sampler.start()
+		if (self.args.trace_malloc is not None):
+			self.tracer = MallocTracer(self.args.trace_malloc, self.output)
+			self.tracer.start()
+		if (self.args.profile is not None):
+			self.profiler = ThreadProfiler(self.args.profile)
+			self.profiler.start()
+
+	# The wall time spent in each stage, as lines of text
+	def stage_summary(self):
+		elapsed = max(time.time() - self.started, 1e-9)
+		lines = ["Stage wall time over %.3f seconds:" % elapsed]
+		for (label, count, total) in self.stages.totals():
+			lines.append("  %-12s %9d calls %10.3f s %9.3f ms average %6.1f%%" % (label, count, total, 1000*total/max(count, 1), 100*total/elapsed))
+		return lines
+
+	# Write out the profiles, once, however the script ends
+	def stop(self):
+		if (self.stopped):
+			return
+		self.stopped = True
+		if (self.tracer is not None):
+			self.tracer.stop()
+		if (self.sampler is not None):
+			self.sampler.stop()
+			self.sampler.write()
+			self.output.write("Wrote %d stack samples to %s\n" % (self.sampler.samples, self.args.sample))
+		if (self.profiler is not None):
+			self.profiler.stop()
+			self.output.write("Wrote profile to %s\n" % self.args.profile)
+			if (self.stages is not None):
+				self.output.write("\n".join(self.stage_summary()) + "\n")
+		self.output.flush()
+
+# Start the profiling asked for on the command line, stopping it when the
+# script exits. Call before starting any threads, so they're profiled too.
+def start_profiling(args, stages=None):
+	profiler = Profiler(args, stages)
+	profiler.start()
+	atexit.register(profiler.stop)
+	return profiler
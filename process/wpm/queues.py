@@ -0,0 +1,71 @@
+import Queue
+
+################################################################################
+################################################################################
+
+# What a full stage queue does with a new item: BLOCK makes the producer wait
+# for room (backpressure), dropping the new item only if the wait times out;
+# DROP_OLDEST discards the oldest queued item to make room, so a consumer that
+# falls behind only ever sees the most recent items.
+BLOCK = "block"
+DROP_OLDEST = "drop-oldest"
+
+################################################################################
+################################################################################
+
+# A bounded queue between two pipeline stages, counting the items it drops
+# and how often its producer had to wait
+class StageQueue(Queue.Queue):
+	def __init__(self, name, maxsize, policy=BLOCK, timeout=None):
+		Queue.Queue.__init__(self, maxsize)
+		self.name = name
+		self.policy = policy
+		self.timeout = timeout
+		self.dropped = 0
+		self.waited = 0
+		self.passed = 0
+
+	def put(self, item, block=True, timeout=None):
+		if (self.policy == DROP_OLDEST):
+			self.not_full.acquire()
+			try:
+				while (self.maxsize > 0 and self._qsize() >= self.maxsize):
+					self._get()
+					self.unfinished_tasks -= 1
+					self.dropped += 1
+				self._put(item)
+				self.unfinished_tasks += 1
+				self.passed += 1
+				self.not_empty.notify()
+			finally:
+				self.not_full.release()
+			return
+
+		if (timeout is None):
+			timeout = self.timeout
+		if (self.full()):
+			self.waited += 1
+		try:
+			Queue.Queue.put(self, item, block, timeout)
+			self.passed += 1
+		except Queue.Full:
+			self.dropped += 1
+
+	# Get the next item, or None if none arrived within timeout seconds
+	def take(self, timeout):
+		try:
+			return self.get(True, timeout)
+		except Queue.Empty:
+			return None
+
+	# Get everything queued right now without waiting
+	def drain(self):
+		items = []
+		while True:
+			try:
+				items.append(self.get_nowait())
+			except Queue.Empty:
+				return items
+
+	def stats(self):
+		return "%s: %d passed, %d dropped, %d waits for room (%s)" % (self.name, self.passed, self.dropped, self.waited, self.policy)
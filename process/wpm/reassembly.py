@@ -0,0 +1,122 @@
+import base64
+################################################################################
+################################################################################
+
+# The meters split a sample block into API frames of XBEE_PAYLOAD_MAX bytes
+# each (see main_logging.c), only the last one being shorter, and number them
+# with a frame ID from 0
+XBEE_PAYLOAD_MAX = 83
+
+# Frames of room a block buffer starts with, enough for a transparent mode
+# sized block. It grows if a meter sends more.
+ASSEMBLY_FRAMES = 20
+
+################################################################################
+################################################################################
+
+# Reassembles a meter's sample blocks from their frames. Each frame's data is
+# written straight into a preallocated buffer at frameID*XBEE_PAYLOAD_MAX, and
+# the frames received are tracked in a bitmask, so the frame with the end of
+# the block completes it in O(1) if frame IDs 0 up to it have all arrived.
+#
+# A repeated frame ID means the rest of the block went missing, the partial
+# block is dropped and assembly starts over with the new frame. So is a block
+# whose end arrives with frames missing. A frame before the end of the block
+# that isn't exactly XBEE_PAYLOAD_MAX bytes would leave a hole or an overlap in
+# the buffer, so it is treated as missing. Partial blocks are also evicted once
+# they are older than max_age seconds, if a max_age is given.
+class BlockAssembler(object):
+	__slots__ = ('buffer', 'mask', 'started', 'max_age', 'completed', 'incomplete', 'evicted')
+
+	def __init__(self, max_age=None):
+		self.buffer = bytearray(ASSEMBLY_FRAMES * XBEE_PAYLOAD_MAX)
+		# Bit n set for each frame ID n received
+		self.mask = 0
+		# When the first frame of the partial block arrived
+		self.started = None
+		self.max_age = max_age
+
+		# Statistics
+		self.completed = 0
+		self.incomplete = 0
+		self.evicted = 0
+
+	# Whether part of a block has been received
+	def pending(self):
+		return self.mask != 0
+
+	# Drop any partial block without counting it
+	def reset(self):
+		self.mask = 0
+
+	# The partial block and statistics, as a dict that can be saved as JSON
+	# and restored with restore()
+	def save(self):
+		frames = self.mask.bit_length()
+		return {
+			'data': base64.b64encode(bytes(self.buffer[:frames * XBEE_PAYLOAD_MAX])),
+			'mask': self.mask,
+			'started': self.started,
+			'completed': self.completed,
+			'incomplete': self.incomplete,
+			'evicted': self.evicted,
+		}
+
+	# Pick up a partial block and statistics from save()
+	def restore(self, state):
+		data = base64.b64decode(state['data'])
+		if (len(data) > len(self.buffer)):
+			self.buffer.extend(bytearray(len(data) - len(self.buffer)))
+		self.buffer[:len(data)] = data
+		self.mask = state['mask']
+		self.started = state['started']
+		self.completed = state['completed']
+		self.incomplete = state['incomplete']
+		self.evicted = state['evicted']
+
+	# Evict the partial block if it's older than max_age seconds at time
+	# now, returns whether it did
+	def expire(self, now):
+		if (self.mask == 0 or self.max_age is None or self.started is None):
+			return False
+		if (now - self.started <= self.max_age):
+			return False
+		self.mask = 0
+		self.evicted += 1
+		return True
+
+	# Add the data of a frame, received at time now (only needed with a
+	# max_age). Returns the sample block it completes as a string, or None.
+	def add(self, frameID, data, now=None):
+		if (now is not None):
+			self.expire(now)
+
+		bit = 1 << frameID
+		if (self.mask & bit):
+			# The rest of the last block never arrived, start over
+			self.mask = 0
+			self.incomplete += 1
+		if (self.mask == 0):
+			self.started = now
+
+		offset = frameID * XBEE_PAYLOAD_MAX
+		end = offset + len(data)
+		if (end > len(self.buffer)):
+			self.buffer.extend(bytearray(end - len(self.buffer)))
+		self.buffer[offset:end] = data
+
+		# Wait for the frame with the end of the block, any other frame
+		# has to fill its place exactly
+		if (self.buffer.find(b'Z', offset, end) < 0):
+			if (len(data) == XBEE_PAYLOAD_MAX):
+				self.mask |= bit
+			return None
+		self.mask |= bit
+
+		complete = (self.mask == (bit << 1) - 1)
+		self.mask = 0
+		if (not complete):
+			self.incomplete += 1
+			return None
+		self.completed += 1
+		return bytes(self.buffer[:end])
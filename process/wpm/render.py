@@ -0,0 +1,107 @@
+import time
+
+################################################################################
+################################################################################
+
+# An axes whose line artists are animated: the rest of the axes (frame, ticks,
+# labels) is rendered once and cached, and new line data is drawn by restoring
+# that background and blitting just the lines over it. The canvas needs to
+# support blitting, like FigureCanvasGTKAgg.
+class BlitAxes:
+	def __init__(self, canvas, axes, lines):
+		self.canvas = canvas
+		self.axes = axes
+		self.lines = lines
+		for line in self.lines:
+			line.set_animated(True)
+
+		self.background = None
+		self.dirty = True
+
+		# Every full draw of the canvas (first show, resize, new
+		# limits) leaves out the lines, recache the background then
+		self.canvas.mpl_connect('draw_event', self.on_draw)
+		self.canvas.mpl_connect('resize_event', self.on_resize)
+
+	def on_draw(self, event):
+		self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+		# Put the lines back in, the canvas shows what was just drawn
+		for line in self.lines:
+			self.axes.draw_artist(line)
+
+	def on_resize(self, event):
+		self.background = None
+		self.dirty = True
+
+	# Set a line's data, marking the axes for redrawing
+	def set_data(self, line, x, y):
+		line.set_data(x, y)
+		self.dirty = True
+
+	# Set the x limits, which only needs the background redrawn when they
+	# actually change
+	def set_xlim(self, left, right):
+		if (tuple(self.axes.get_xlim()) != (left, right)):
+			self.axes.set_xlim(left, right)
+			self.background = None
+		self.dirty = True
+
+	# Redraw the axes if anything changed, returns whether it did
+	def render(self):
+		if (not self.dirty):
+			return False
+		self.dirty = False
+
+		if (self.background is None):
+			# Draws the whole figure, on_draw() caches the background
+			self.canvas.draw()
+			return True
+
+		self.canvas.restore_region(self.background)
+		for line in self.lines:
+			self.axes.draw_artist(line)
+		self.canvas.blit(self.axes.bbox)
+		return True
+
+################################################################################
+################################################################################
+
+# Caps how often frames are rendered and keeps statistics of how long they
+# take to render
+class FrameClock:
+	def __init__(self, fps):
+		self.interval = 1.0/fps
+		self.last_frame = 0
+		self.frames = 0
+		self.frame_total = 0.0
+		self.frame_max = 0.0
+		self.window_start = time.time()
+
+	# Whether enough time has passed since the last frame for another
+	def ready(self):
+		return time.time() - self.last_frame >= self.interval
+
+	# Time a frame, rendered by the function passed in
+	def frame(self, render):
+		start = time.time()
+		render()
+		end = time.time()
+		self.last_frame = start
+		self.frames += 1
+		self.frame_total += end - start
+		self.frame_max = max(self.frame_max, end - start)
+
+	# Statistics of the frames since the last call, as a line of text
+	def stats(self):
+		now = time.time()
+		elapsed = max(now - self.window_start, 1e-6)
+		average = 0.0
+		if (self.frames > 0):
+			average = self.frame_total / self.frames
+		text = "%.1f fps, frame time %.1f ms average, %.1f ms max" % (self.frames / elapsed, 1000*average, 1000*self.frame_max)
+
+		self.frames = 0
+		self.frame_total = 0.0
+		self.frame_max = 0.0
+		self.window_start = now
+		return text
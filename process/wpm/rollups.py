@@ -0,0 +1,184 @@
+import os
+import time
+import numpy
+
+################################################################################
+################################################################################
+
+# Rollup resolutions, each with a file per meter, and their bucket length in
+# seconds. Buckets start on whole multiples of their length since the epoch,
+# so hours and days are UTC hours and days.
+RESOLUTIONS = (
+	('minute', 60),
+	('hour', 3600),
+	('day', 86400),
+)
+ROLLUP_SUFFIX = ".rollup"
+
+# A bucket as stored: its start time, the power readings in it, their mean,
+# min and max in watts, the energy in watt hours drawn over it, and the exact
+# sum of the readings the mean comes from, so a resumed bucket carries on
+# from it
+ROLLUP_DTYPE = numpy.dtype([
+	('start', '<i8'),
+	('count', '<u4'),
+	('mean', '<f4'),
+	('min', '<f4'),
+	('max', '<f4'),
+	('energy', '<f8'),
+	('total', '<f8'),
+])
+
+# Seconds between writing out the buckets still being filled
+FLUSH_INTERVAL = 10.0
+
+################################################################################
+################################################################################
+
+# The rollup buckets of one resolution for a meter, in an append-only file of
+# ROLLUP_DTYPE records. The last record is the bucket being filled, rewritten
+# in place as it's flushed, so a restart picks up where it left off and a
+# crash loses at most the readings since the last flush.
+class RollupSeries:
+	def __init__(self, path, length):
+		self.length = length
+		self.record = numpy.zeros(1, dtype=ROLLUP_DTYPE)
+		self.total = 0.0
+		self.dirty = False
+
+		# Resume the last bucket if the file has one, the next one goes
+		# after it
+		if (os.path.exists(path)):
+			self.file = open(path, "r+b")
+		else:
+			self.file = open(path, "w+b")
+		self.file.seek(0, os.SEEK_END)
+		size = self.file.tell() - self.file.tell() % ROLLUP_DTYPE.itemsize
+		self.offset = size
+		if (size > 0):
+			self.offset = size - ROLLUP_DTYPE.itemsize
+			self.file.seek(self.offset)
+			self.record = numpy.fromstring(self.file.read(ROLLUP_DTYPE.itemsize), dtype=ROLLUP_DTYPE)
+			self.total = float(self.record['total'][0])
+
+	# Add a power reading at time t, with the energy drawn since the last one
+	def add(self, t, power, energy):
+		record = self.record
+		start = int(t // self.length) * self.length
+		if (record['count'][0] > 0 and start != record['start'][0]):
+			if (start < record['start'][0]):
+				# Readings from before the bucket being filled
+				# have already been rolled up
+				return
+			# The bucket is done, write it out and start the next
+			self._write()
+			self.offset += ROLLUP_DTYPE.itemsize
+			record[0] = (start, 0, 0.0, power, power, 0.0, 0.0)
+			self.total = 0.0
+		elif (record['count'][0] == 0):
+			record[0] = (start, 0, 0.0, power, power, 0.0, 0.0)
+
+		self.total += power
+		record['total'] = self.total
+		record['count'] += 1
+		record['mean'] = self.total / record['count'][0]
+		record['min'] = min(record['min'][0], power)
+		record['max'] = max(record['max'][0], power)
+		record['energy'] += energy
+		self.dirty = True
+
+	# Write the bucket being filled in place
+	def _write(self):
+		self.file.seek(self.offset)
+		self.file.write(self.record.tostring())
+		self.file.flush()
+		self.dirty = False
+
+	def flush(self):
+		if (self.dirty):
+			self._write()
+
+	def close(self):
+		self.flush()
+		self.file.close()
+
+# A meter's rollups at every resolution, in a directory of its own
+class MeterRollups:
+	def __init__(self, directory):
+		if (not os.path.isdir(directory)):
+			os.makedirs(directory)
+		self.series = [RollupSeries(os.path.join(directory, name + ROLLUP_SUFFIX), length) for (name, length) in RESOLUTIONS]
+
+	# Add a power reading in watts at time t, with the watt hours drawn
+	# since the last one as integrated by wpm.energy
+	def push(self, t, power, energy):
+		for series in self.series:
+			series.add(t, power, energy)
+
+	def flush(self):
+		for series in self.series:
+			series.flush()
+
+	def close(self):
+		for series in self.series:
+			series.close()
+
+# A directory of per-meter rollups, keyed by meter address and created as
+# meters show up. Buckets being filled are written out every flush_interval
+# seconds.
+class RollupStore:
+	def __init__(self, directory, flush_interval=FLUSH_INTERVAL):
+		self.directory = directory
+		self.flush_interval = flush_interval
+		self.meters = {}
+		self.lastFlush = time.time()
+
+	# The rollups of a meter address
+	def meter(self, address):
+		try:
+			return self.meters[address]
+		except KeyError:
+			m = MeterRollups(os.path.join(self.directory, address))
+			self.meters[address] = m
+			return m
+
+	# Add a power reading from a meter at time t, with the energy since its
+	# last one
+	def push(self, address, t, power, energy):
+		self.meter(address).push(t, power, energy)
+		now = time.time()
+		if (now - self.lastFlush >= self.flush_interval):
+			self.flush()
+
+	def flush(self):
+		self.lastFlush = time.time()
+		for m in self.meters.values():
+			m.flush()
+
+	def close(self):
+		for m in self.meters.values():
+			m.close()
+
+################################################################################
+################################################################################
+
+# Read a meter's rollup buckets at a resolution, as a ROLLUP_DTYPE array
+def read_rollups(directory, address, resolution):
+	path = os.path.join(directory, address, resolution + ROLLUP_SUFFIX)
+	if (not os.path.exists(path)):
+		return numpy.zeros(0, dtype=ROLLUP_DTYPE)
+	return numpy.fromfile(path, dtype=ROLLUP_DTYPE)
+
+# The addresses of the meters with rollups in a directory
+def rollup_meters(directory):
+	return [name for name in sorted(os.listdir(directory)) if os.path.isdir(os.path.join(directory, name))]
+
+# The buckets starting in [start, end), either bound None to leave it open
+def bucket_range(buckets, start=None, end=None):
+	lo = 0
+	hi = len(buckets)
+	if (start is not None):
+		lo = numpy.searchsorted(buckets['start'], start, 'left')
+	if (end is not None):
+		hi = numpy.searchsorted(buckets['start'], end, 'left')
+	return buckets[lo:hi]
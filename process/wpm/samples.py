@@ -0,0 +1,195 @@
+import collections
+import numpy
+from wpm.crc import crc16_block
+
+################################################################################
+################################################################################
+
+# Sample blocks are sent as ASCII hex: T<8 hex timestamp>S followed by
+# "hhh," for every 10-bit ADC sample, then X (or Y) <4 hex CRC16> Z
+SAMPLE_STRIDE = 4
+
+# Most bytes kept of a block that hasn't ended, anything longer is line noise
+# (a transparent mode block is under 2 kB)
+BLOCK_MAX_LENGTH = 1 << 16
+
+# ASCII character to hex digit value, -1 for anything that isn't one
+HEX_DIGITS = "0123456789ABCDEFabcdef"
+HEX_VALUES = numpy.full(256, -1, dtype=numpy.int16)
+for c in HEX_DIGITS:
+	HEX_VALUES[ord(c)] = int(c, 16)
+
+# A decoded sample block: the millisecond timestamp of its first sample, a
+# uint16 array of the ADC codes, and the transmitted checksum (None if the
+# block ended before it)
+class SampleBlock(collections.namedtuple('SampleBlock', 'timestamp samples checksum')):
+	__slots__ = ()
+
+	# Check the transmitted checksum against the block's contents
+	def checksum_ok(self):
+		return (self.checksum is not None and crc16_block(self.timestamp, self.samples) == self.checksum)
+
+################################################################################
+################################################################################
+
+# Timestamps of count samples starting at timestamp. Each one is the last
+# plus period, accumulated in order the way the scripts always have, so the
+# values match a running "timestamp += TIME_PER_SAMPLE" exactly.
+def sample_times(timestamp, count, period):
+	steps = numpy.empty(count, dtype=numpy.float64)
+	if (count > 0):
+		steps[0] = timestamp
+		steps[1:] = period
+	return numpy.add.accumulate(steps)
+
+# Parse a fixed length ASCII hex field, None if it isn't one
+def _parse_hex(field, length):
+	if (len(field) != length or field.strip(HEX_DIGITS) != ''):
+		return None
+	return int(field, 16)
+
+# Decode a sample block from its ASCII hex payload (str, bytearray or
+# memoryview). Returns a SampleBlock, or None if there is no usable block.
+def decode_samples(payload):
+	if isinstance(payload, memoryview):
+		payload = payload.tobytes()
+	elif isinstance(payload, bytearray):
+		payload = bytes(payload)
+
+	# Find the timestamp and the sample span
+	t = payload.find(b'T')
+	if (t < 0):
+		return None
+	s = t+9
+	x = payload.find(b'X', s)
+	y = payload.find(b'Y', s)
+	if (x < 0 or (y >= 0 and y < x)):
+		x = y
+
+	# A well formed block has an exact 8 digit timestamp, a whole number
+	# of "hhh," samples, and an exact 4 digit checksum if it has one
+	if (x < 0 or payload[s:s+1] != b'S' or (x-s-1) % SAMPLE_STRIDE != 0):
+		return _decode_samples_slow(payload)
+	timestamp = _parse_hex(payload[t+1:s], 8)
+	if (timestamp is None):
+		return _decode_samples_slow(payload)
+	checksum = None
+	if (payload.find(b'Z', x) >= 0):
+		checksum = _parse_hex(payload[x+1:x+5], 4)
+		if (checksum is None or payload[x+5:x+6] != b'Z'):
+			return _decode_samples_slow(payload)
+
+	# View the samples as rows of three hex digits and a comma, and
+	# convert all of them at once
+	span = numpy.frombuffer(payload, dtype=numpy.uint8, count=x-s-1, offset=s+1)
+	span = span.reshape(-1, SAMPLE_STRIDE)
+	digits = HEX_VALUES[span[:, :3]]
+	if ((span[:, 3] != ord(',')).any() or (digits < 0).any()):
+		return _decode_samples_slow(payload)
+	samples = ((digits[:, 0] << 8) | (digits[:, 1] << 4) | digits[:, 2]).astype(numpy.uint16)
+
+	return SampleBlock(timestamp, samples, checksum)
+
+# Character by character decoding of a malformed block, following the state
+# machine the scripts have always used. Samples that aren't three digits long
+# are skipped, but a sample that isn't hex drops the whole block.
+def _decode_samples_slow(payload):
+	timestamp_str = ''
+	timestamp = None
+	number_str = ''
+	samples = []
+	checksum_str = ''
+	checksum = None
+
+	state = -1
+	for rawData in bytearray(payload):
+		rawData = chr(rawData)
+		if (rawData == 'T'):
+			state = 1
+			timestamp_str = ''
+			samples = []
+			continue
+		elif (rawData == 'S' and state != -1):
+			state = 2
+			continue
+		elif ((rawData == 'X' or rawData == 'Y') and state != -1):
+			state = 3
+			continue
+		elif ((rawData == 'Z') and state != -1):
+			break
+
+		# State: Timestamp Data
+		if (state == 1):
+			timestamp_str += rawData
+			if (len(timestamp_str) == 8):
+				timestamp = _parse_hex(timestamp_str, 8)
+				if (timestamp is None):
+					return None
+				timestamp_str = ''
+				state = 0
+
+		# State: Sample Data
+		if (state == 2):
+			if (rawData == ',' or len(number_str) == 3):
+				if (len(number_str) == 3):
+					data = _parse_hex(number_str, 3)
+					if (data is None):
+						return None
+					samples.append(data)
+				number_str = ''
+			else:
+				number_str += rawData
+
+		# State: Checksum Data
+		if (state == 3):
+			checksum_str += rawData
+			if (len(checksum_str) > 4):
+				checksum_str = ''
+				state = 0
+			elif (len(checksum_str) == 4):
+				checksum = _parse_hex(checksum_str, 4)
+				if (checksum is None):
+					return None
+				checksum_str = ''
+				state = 0
+
+	if (timestamp is None):
+		return None
+
+	return SampleBlock(timestamp, numpy.array(samples, dtype=numpy.uint16), checksum)
+
+################################################################################
+################################################################################
+
+# Splits a raw transparent mode stream, read in chunks of any size, into its
+# sample blocks. A block runs from a T to the next Z, and a T before the Z
+# starts the block over, as in the byte at a time state machine the loggers
+# used to run.
+class BlockSplitter:
+	def __init__(self):
+		self.buffer = bytearray()
+
+	# Add a chunk of the stream, returning the blocks it completes as
+	# strings from their T to their Z
+	def feed(self, data):
+		buffer = self.buffer
+		buffer.extend(data)
+
+		blocks = []
+		start = 0
+		while True:
+			z = buffer.find(b'Z', start)
+			if (z < 0):
+				break
+			t = buffer.rfind(b'T', start, z)
+			if (t >= 0):
+				blocks.append(bytes(buffer[t:z+1]))
+			start = z+1
+
+		# Keep the start of the next block, if it has started
+		t = buffer.rfind(b'T', start)
+		if (t < 0 or len(buffer) - t > BLOCK_MAX_LENGTH):
+			del buffer[:]
+		else:
+			del buffer[:t]
+		return blocks
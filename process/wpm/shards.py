@@ -0,0 +1,66 @@
+import numpy
+from wpm.xbee import scan_frames
+
+################################################################################
+################################################################################
+
+# Split size bytes of capture into count roughly equal [start, end) ranges
+def split_shards(size, count):
+	count = max(1, min(count, size))
+	bounds = [(size * i) // count for i in range(count + 1)]
+	return [(bounds[i], bounds[i+1]) for i in range(count)]
+
+# Scan a shard of a capture for API frames. The scan re-synchronises on the
+# first start delimiter at or after start that begins a frame with a valid
+# checksum, and takes every frame starting before end, reading past end to
+# finish the last one. Returns arrays of the frame offsets and lengths, and
+# the offset of an incomplete frame the capture ends in (or -1).
+def scan_shard(data, view, start, end):
+	offsets = []
+	lengths = []
+	incomplete = -1
+	for (offset, frameLen) in scan_frames(data, view, start, len(data)):
+		if (frameLen < 0):
+			incomplete = offset
+			break
+		if (offset >= end):
+			break
+		offsets.append(offset)
+		lengths.append(frameLen)
+
+	return (numpy.array(offsets, dtype=numpy.int64), numpy.array(lengths, dtype=numpy.int64), incomplete)
+
+# Merge the scan_shard() results of consecutive shards into the frames a
+# single scan of the whole capture finds, yielding (offset, frameLen) in
+# order. A shard can start inside a frame and lock on to a false frame in its
+# data, so each shard's frames are only taken from the first one the scan
+# carried over from the previous shard reaches; from there on both scans are
+# the same. Frames before that point are found by scanning serially.
+def merge_shards(data, view, shards, results):
+	pos = 0
+	for ((start, end), (offsets, lengths, incomplete)) in zip(shards, results):
+		converged = -1
+		for (offset, frameLen) in scan_frames(data, view, pos, len(data)):
+			# The capture ended part way through a frame
+			if (frameLen < 0):
+				return
+			# Leave frames past this shard to the next one
+			if (offset >= end):
+				break
+			i = numpy.searchsorted(offsets, offset)
+			if (i < len(offsets) and offsets[i] == offset):
+				converged = i
+				break
+			yield (offset, frameLen)
+			pos = offset+3+frameLen+1
+
+		if (converged < 0):
+			continue
+
+		for i in range(converged, len(offsets)):
+			yield (int(offsets[i]), int(lengths[i]))
+		pos = int(offsets[-1] + 3 + lengths[-1] + 1)
+
+		# The capture ended part way through a frame
+		if (incomplete >= 0):
+			return
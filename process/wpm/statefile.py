@@ -0,0 +1,40 @@
+import os
+import json
+import tempfile
+
+################################################################################
+################################################################################
+
+# Write a file so that it always holds either its old or its new contents,
+# even across a crash: the data goes to a temporary file in the same directory
+# that is synced and renamed over it, and then the rename is synced too
+def write_atomic(path, data):
+	directory = os.path.dirname(os.path.abspath(path))
+	fd, tempPath = tempfile.mkstemp(prefix=os.path.basename(path) + ".", dir=directory)
+	try:
+		f = os.fdopen(fd, "w")
+		f.write(data)
+		f.flush()
+		os.fsync(f.fileno())
+		f.close()
+		os.rename(tempPath, path)
+	except (IOError, OSError):
+		os.unlink(tempPath)
+		raise
+
+	fd = os.open(directory, os.O_RDONLY)
+	try:
+		os.fsync(fd)
+	finally:
+		os.close(fd)
+
+# Save a JSON state file atomically
+def save_state(path, state):
+	write_atomic(path, json.dumps(state, sort_keys=True))
+
+# Load a JSON state file
+def load_state(path):
+	f = open(path)
+	state = json.load(f)
+	f.close()
+	return state
@@ -0,0 +1,192 @@
+import os
+import struct
+import numpy
+from wpm.crc import crc16_block
+from wpm.xbee import API_START, API_RECEIVE_PACKET
+
+################################################################################
+################################################################################
+
+# The most sample block bytes the firmware puts in one API frame, after the
+# frame ID
+XBEE_PAYLOAD_MAX = 83
+
+# Samples per block the firmware sends in XBee API mode, and in transparent
+# mode
+SAMPLES_PER_BLOCK = 203
+SAMPLES_PER_BLOCK_TRANSPARENT = 405
+
+# 16-bit network address and receive options of a synthesised Zigbee Receive
+# Packet, the processing scripts ignore both
+RX_ADDRESS16 = b'\xFF\xFE'
+RX_OPTIONS = b'\x01'
+
+# ADC code to its three uppercase hex digits and the comma after them
+HEX_CHARS = numpy.frombuffer(b"0123456789ABCDEF", dtype=numpy.uint8)
+
+################################################################################
+################################################################################
+
+# Encode a sample block the way the firmware sends it, as ASCII hex:
+# T<timestamp>S followed by "hhh," per sample, then X<checksum>Z
+def encode_block(timestamp, samples, terminator=b'X'):
+	samples = numpy.asarray(samples, dtype=numpy.uint16)
+	text = numpy.empty((len(samples), 4), dtype=numpy.uint8)
+	text[:, 0] = HEX_CHARS[(samples >> 8) & 0xF]
+	text[:, 1] = HEX_CHARS[(samples >> 4) & 0xF]
+	text[:, 2] = HEX_CHARS[samples & 0xF]
+	text[:, 3] = ord(',')
+	return b'T%08XS' % timestamp + text.tostring() + terminator + b'%04XZ' % crc16_block(timestamp, samples)
+
+# Wrap frame data in an API frame: start delimiter, length and checksum
+def api_frame(frameData):
+	checksum = 0xFF - (sum(bytearray(frameData)) & 0xFF)
+	return API_START + struct.pack('>H', len(frameData)) + frameData + struct.pack('B', checksum)
+
+# The Zigbee Receive Packet a coordinator outputs for RF data sent by the
+# meter with a 64-bit address
+def receive_packet(address64, rfData):
+	return api_frame(struct.pack('B', API_RECEIVE_PACKET) + address64 + RX_ADDRESS16 + RX_OPTIONS + rfData)
+
+# Split an encoded sample block into the API frames it arrives in, each
+# carrying the next frame ID and up to XBEE_PAYLOAD_MAX bytes of the block
+def block_frames(address64, payload):
+	step = XBEE_PAYLOAD_MAX
+	return [receive_packet(address64, struct.pack('B', i // step) + payload[i:i+step]) for i in range(0, len(payload), step)]
+
+# The 64-bit address of the n-th synthetic meter
+def meter_address(n):
+	return b'\x00\x13\xA2\x00' + struct.pack('>I', 0x40000000 + n)
+
+################################################################################
+################################################################################
+
+# Sample content for a block of count samples, as ADC codes before noise
+
+# 60 Hz line voltage on even samples and a phase shifted current on odd ones,
+# both riding on the ADC's mid-scale, like the firmware's alternating channels
+def sine_wave(count, rng):
+	t = numpy.arange(count) * (0.083e-3 * 2 * numpy.pi * 60.)
+	phase = rng.uniform(0, numpy.pi)
+	current = rng.uniform(50, 400)
+	return numpy.where(numpy.arange(count) % 2 == 0, 512 + 400*numpy.sin(t), 512 + current*numpy.sin(t - phase))
+
+# Uniformly random codes, the worst case for anything compressing samples
+def random_wave(count, rng):
+	return rng.randint(0, 1024, size=count).astype(numpy.float64)
+
+# A ramp through every code
+def ramp_wave(count, rng):
+	return (numpy.arange(count) * 5 % 1024).astype(numpy.float64)
+
+WAVEFORMS = {'sine': sine_wave, 'random': random_wave, 'ramp': ramp_wave}
+
+################################################################################
+################################################################################
+
+# Recorded traces of a meter's ADC input, one "<sample> <volts>" line per
+# sample, in data/ next to the scripts
+TRACE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+# The recorded current traces, by load, and the line voltage trace. The idle
+# traces were recorded with the channels alternating, current on the even
+# samples, the others from one channel at the full sample rate.
+CURRENT_TRACES = {
+	'idle': "current-idle-no-transformers.dat",
+	'transformers': "current-idle-transformers.dat",
+	'laptop': "current-laptop-power-supply.dat",
+}
+VOLTAGE_TRACE = "voltage.dat"
+
+# Load a recorded trace as ADC codes
+def load_trace(filename):
+	volts = numpy.loadtxt(os.path.join(TRACE_DIR, filename), usecols=(1,))
+	return volts * (1024 / 5.0)
+
+# Sample content from the recorded traces: every other sample of a load's
+# current trace and of the voltage trace, which is the current channel of the
+# alternating recordings and each channel's rate for the others, interleaved
+# current first the way the firmware alternates its channels. Both are cut to
+# the shorter of the two.
+def trace_wave(load):
+	current = load_trace(CURRENT_TRACES[load])[0::2]
+	# The idle recordings have a 0 V sample at the start of every block,
+	# which the current sensor's offset never reads
+	current[current == 0] = numpy.median(current)
+	voltage = load_trace(VOLTAGE_TRACE)[0::2]
+	n = min(len(current), len(voltage))
+	wave = numpy.empty(2*n, dtype=numpy.float64)
+	wave[0::2] = current[:n]
+	wave[1::2] = voltage[:n]
+	return wave
+
+################################################################################
+################################################################################
+
+# A meter sending sample blocks of a waveform, given as ADC codes (one block's
+# worth, or more to step through), or named from WAVEFORMS. Every block gets a
+# little ADC noise on top. Meters sending transparent (raw block) data instead
+# of API frames have no address64.
+class SyntheticMeter:
+	def __init__(self, address64, samples=SAMPLES_PER_BLOCK, interval=1000, seed=0, waveform='sine', noise=2):
+		self.address64 = address64
+		self.samples = samples
+		self.interval = interval
+		self.noise = noise
+		self.rng = numpy.random.RandomState(seed)
+		self.timestamp = self.rng.randint(0, 1 << 20)
+
+		if (isinstance(waveform, str)):
+			waveform = WAVEFORMS[waveform](samples, self.rng)
+		self.wave = numpy.asarray(waveform, dtype=numpy.float64)
+		self.position = 0
+
+	# The next sample block's samples
+	def next_samples(self):
+		indices = (self.position + numpy.arange(self.samples)) % len(self.wave)
+		self.position = (self.position + self.samples) % len(self.wave)
+		samples = self.wave[indices]
+		if (self.noise > 0):
+			samples = samples + self.rng.randint(-self.noise, self.noise+1, size=self.samples)
+		return numpy.clip(numpy.round(samples), 0, 1023).astype(numpy.uint16)
+
+	# Encode the next sample block, returning its timestamp, its samples and
+	# the API frames it is sent in (or the block itself, in transparent mode)
+	def next_block(self):
+		timestamp = self.timestamp
+		samples = self.next_samples()
+		self.timestamp = (self.timestamp + self.interval) & 0xFFFFFFFF
+		payload = encode_block(timestamp, samples)
+		if (self.address64 is None):
+			return (timestamp, samples, [payload])
+		return (timestamp, samples, block_frames(self.address64, payload))
+
+################################################################################
+################################################################################
+
+# Flip a bit in a random byte of a frame after its start delimiter, which
+# breaks its checksum (or, hitting the length, its framing)
+def corrupt_frame(frame, rng):
+	data = bytearray(frame)
+	i = rng.randint(1, len(data))
+	data[i] ^= 1 << rng.randint(0, 8)
+	return bytes(data)
+
+# Generate a capture of blocks sample blocks from each of a list of meters, as
+# the frames a coordinator would output. Meters send their blocks at the same
+# time, so their frames arrive interleaved. A corrupt fraction of the frames
+# get a flipped bit and a loss fraction never arrive.
+def capture_frames(meters, blocks, corrupt=0.0, loss=0.0, seed=0):
+	rng = numpy.random.RandomState(seed)
+	for b in range(blocks):
+		sending = [meter.next_block()[2] for meter in meters]
+		for i in range(max([len(frames) for frames in sending])):
+			for frames in sending:
+				if (i >= len(frames)):
+					continue
+				if (loss > 0 and rng.random_sample() < loss):
+					continue
+				frame = frames[i]
+				if (corrupt > 0 and rng.random_sample() < corrupt):
+					frame = corrupt_frame(frame, rng)
+				yield frame
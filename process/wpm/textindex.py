@@ -0,0 +1,310 @@
+import os
+import json
+import numpy
+
+################################################################################
+################################################################################
+
+# A text sample file's index is kept next to it, as a line of JSON describing
+# the file and the index, then the index entries as ENTRY_DTYPE records
+INDEX_SUFFIX = ".tidx"
+INDEX_VERSION = 1
+
+# An entry is made every INDEX_EVERY samples of each meter
+INDEX_EVERY = 1024
+
+# Text is indexed CHUNK_SIZE bytes at a time
+CHUNK_SIZE = 1 << 24
+
+# An index entry: the meter (by its number in the header's list), the run of
+# the meter's samples it's in, the timestamp of the sample and the byte offset
+# of its line. A meter's timestamps only go up within a run, a new run starts
+# wherever they go back (the meter restarted), so entries can be binary
+# searched run by run.
+ENTRY_DTYPE = numpy.dtype([
+	('meter', '<u4'),
+	('run', '<u4'),
+	('timestamp', '<f8'),
+	('offset', '<u8'),
+])
+
+# Timestamps are written "%f", with exactly six decimals
+TIMESTAMP_DECIMALS = 6
+
+################################################################################
+################################################################################
+
+# Parse the "%f" timestamps of lines, from each line's start to its first
+# space, as integer millionths. Returns None if any of them isn't one.
+def _parse_timestamps(buf, starts, ends):
+	width = ends - starts
+	if (len(width) == 0):
+		return numpy.zeros(0, dtype=numpy.int64)
+	if (width.min() < TIMESTAMP_DECIMALS + 2):
+		return None
+
+	# Right align every timestamp in a matrix of characters, padded with
+	# zeros, and take out the decimal point
+	columns = int(width.max())
+	index = ends[:, None] - columns + numpy.arange(columns)
+	chars = buf[numpy.maximum(index, 0)]
+	chars[index < starts[:, None]] = ord('0')
+	point = columns - TIMESTAMP_DECIMALS - 1
+	if ((chars[:, point] != ord('.')).any()):
+		return None
+	digits = numpy.delete(chars, point, axis=1).astype(numpy.int64) - ord('0')
+	if (((digits < 0) | (digits > 9)).any() or columns > 18):
+		return None
+	return digits.dot(10 ** numpy.arange(columns-2, -1, -1, dtype=numpy.int64))
+
+# Parse timestamps one at a time, for text _parse_timestamps() can't
+def _parse_timestamps_slow(buf, starts, ends):
+	text = buf.tostring()
+	return numpy.array([int(round(float(text[s:e]) * 10**TIMESTAMP_DECIMALS)) for (s, e) in zip(starts.tolist(), ends.tolist())], dtype=numpy.int64)
+
+# The address field of lines, between their first and second spaces
+def _addresses(buf, starts, ends):
+	width = ends - starts
+	if (len(width) > 0 and width.min() == width.max() and width[0] > 0):
+		index = starts[:, None] + numpy.arange(width[0])
+		return buf[index].view('S%d' % width[0]).ravel()
+	text = buf.tostring()
+	return numpy.array([text[s:e] for (s, e) in zip(starts.tolist(), ends.tolist())])
+
+# Builds the index of a text sample file, from its lines of "timestamp address
+# voltage", or of "timestamp voltage" for a single meter
+class IndexBuilder:
+	def __init__(self, every=INDEX_EVERY):
+		self.every = every
+		self.addressed = None
+		self.meters = []
+		self.meterIDs = {}
+		# Per meter: samples since its last entry, its last timestamp,
+		# and its run
+		self.since = []
+		self.last = []
+		self.runs = []
+		self.entries = []
+
+	def _meter(self, address):
+		try:
+			return self.meterIDs[address]
+		except KeyError:
+			m = len(self.meters)
+			self.meterIDs[address] = m
+			self.meters.append(address)
+			self.since.append(0)
+			self.last.append(None)
+			self.runs.append(0)
+			return m
+
+	# Index a chunk of whole lines starting at byte offset base of the file
+	def add(self, data, base):
+		buf = numpy.frombuffer(data, dtype=numpy.uint8)
+		ends = numpy.flatnonzero(buf == ord('\n'))
+		starts = numpy.concatenate(([0], ends[:-1] + 1))
+		# Skip blank lines
+		keep = ends > starts
+		starts = starts[keep]
+		ends = ends[keep]
+		if (len(starts) == 0):
+			return
+
+		spaces = numpy.flatnonzero(buf == ord(' '))
+		first = numpy.searchsorted(spaces, starts)
+		if (first.max() >= len(spaces)):
+			raise ValueError("not a text sample file, a line has no spaces")
+		firstSpace = spaces[first]
+		if ((firstSpace > ends).any()):
+			raise ValueError("not a text sample file, a line has no spaces")
+
+		# Whether the lines have an address column, from the first line
+		if (self.addressed is None):
+			self.addressed = (first[0] + 1 < len(spaces) and spaces[first[0] + 1] < ends[0])
+
+		timestamps = _parse_timestamps(buf, starts, firstSpace)
+		if (timestamps is None):
+			timestamps = _parse_timestamps_slow(buf, starts, firstSpace)
+
+		# Number the meters of the lines
+		if (self.addressed):
+			secondSpace = spaces[numpy.minimum(first + 1, len(spaces) - 1)]
+			addresses, inverse = numpy.unique(_addresses(buf, firstSpace + 1, secondSpace), return_inverse=True)
+			ids = numpy.array([self._meter(str(a)) for a in addresses], dtype=numpy.int64)[inverse]
+		else:
+			ids = numpy.zeros(len(starts), dtype=numpy.int64)
+			self._meter("")
+
+		# Go through each meter's lines in order
+		order = numpy.argsort(ids, kind='mergesort')
+		groups = numpy.flatnonzero(numpy.diff(ids[order])) + 1
+		for lines in numpy.split(order, groups):
+			m = int(ids[lines[0]])
+			t = timestamps[lines]
+
+			# Runs break wherever the timestamps go back
+			breaks = numpy.flatnonzero(numpy.diff(t) < 0) + 1
+			if (self.last[m] is not None and t[0] < self.last[m]):
+				breaks = numpy.concatenate(([0], breaks))
+			bounds = numpy.concatenate(([0], breaks, [len(t)]))
+
+			for i in range(len(bounds) - 1):
+				lo = bounds[i]
+				hi = bounds[i+1]
+				if (lo == hi):
+					continue
+				if (i > 0):
+					self.runs[m] += 1
+					self.since[m] = 0
+				# Entries where a multiple of every samples have
+				# passed since the last one
+				k = numpy.arange((-self.since[m]) % self.every, hi - lo, self.every) + lo
+				if (len(k) > 0):
+					entries = numpy.empty(len(k), dtype=ENTRY_DTYPE)
+					entries['meter'] = m
+					entries['run'] = self.runs[m]
+					entries['timestamp'] = t[k] / float(10**TIMESTAMP_DECIMALS)
+					entries['offset'] = base + starts[lines[k]]
+					self.entries.append(entries)
+				self.since[m] = (self.since[m] + hi - lo) % self.every
+			self.last[m] = t[-1]
+
+	# The index entries, sorted by meter, then by offset
+	def finish(self):
+		if (len(self.entries) == 0):
+			return numpy.zeros(0, dtype=ENTRY_DTYPE)
+		entries = numpy.concatenate(self.entries)
+		return entries[numpy.lexsort((entries['offset'], entries['meter']))]
+
+################################################################################
+################################################################################
+
+# Build and write the index of a text sample file, returning it
+def build_index(path, every=INDEX_EVERY):
+	builder = IndexBuilder(every)
+	f = open(path, "rb")
+	size = os.fstat(f.fileno()).st_size
+	base = 0
+	rest = b""
+	while (True):
+		data = f.read(CHUNK_SIZE)
+		if (len(data) == 0):
+			break
+		data = rest + data
+		end = data.rfind(b'\n') + 1
+		builder.add(data[:end], base)
+		base += end
+		rest = data[end:]
+	f.close()
+	if (len(rest.strip()) > 0):
+		builder.add(rest + b'\n', base)
+		base += len(rest)
+
+	entries = builder.finish()
+	header = {
+		'version': INDEX_VERSION,
+		'every': every,
+		'size': size,
+		'addressed': bool(builder.addressed),
+		'meters': builder.meters,
+	}
+	f = open(path + INDEX_SUFFIX, "wb")
+	f.write(json.dumps(header, sort_keys=True) + "\n")
+	f.write(entries.tostring())
+	f.close()
+	return TextIndex(path, header, entries)
+
+# Open the index of a text sample file, None if it has none or it's out of
+# date with the file
+def open_index(path):
+	try:
+		f = open(path + INDEX_SUFFIX, "rb")
+	except IOError:
+		return None
+	header = json.loads(f.readline())
+	entries = numpy.fromstring(f.read(), dtype=ENTRY_DTYPE)
+	f.close()
+	if (header.get('version') != INDEX_VERSION or header.get('size') != os.path.getsize(path)):
+		return None
+	return TextIndex(path, header, entries)
+
+################################################################################
+################################################################################
+
+# Range queries over an indexed text sample file
+class TextIndex:
+	def __init__(self, path, header, entries):
+		self.path = path
+		self.header = header
+		self.entries = entries
+		self.size = header['size']
+		self.addressed = header['addressed']
+		self.meters = [str(m) for m in header['meters']]
+
+	# The byte ranges of the file holding a meter's samples with timestamps
+	# in [start, end], either bound None to leave it open
+	def ranges(self, address, start=None, end=None):
+		if (not self.addressed):
+			address = ""
+		if (address not in self.meters):
+			return []
+		m = self.meters.index(address)
+		lo = numpy.searchsorted(self.entries['meter'], m, 'left')
+		hi = numpy.searchsorted(self.entries['meter'], m, 'right')
+		entries = self.entries[lo:hi]
+
+		ranges = []
+		runBounds = numpy.flatnonzero(numpy.diff(entries['run'])) + 1
+		runStarts = numpy.concatenate(([0], runBounds))
+		runEnds = numpy.concatenate((runBounds, [len(entries)]))
+		for (r0, r1) in zip(runStarts, runEnds):
+			run = entries[r0:r1]
+			# The run's samples go on until the meter's next run starts
+			runEnd = self.size
+			if (r1 < len(entries)):
+				runEnd = int(entries['offset'][r1])
+
+			# From the last entry before start, up to the first entry
+			# after end
+			i = 0
+			if (start is not None):
+				i = max(numpy.searchsorted(run['timestamp'], start, 'left') - 1, 0)
+			rangeEnd = runEnd
+			if (end is not None):
+				j = numpy.searchsorted(run['timestamp'], end, 'right')
+				if (j == 0):
+					continue
+				if (j < len(run)):
+					rangeEnd = int(run['offset'][j])
+			ranges.append((int(run['offset'][i]), rangeEnd))
+
+		# Merge overlapping ranges
+		ranges.sort()
+		merged = []
+		for (s, e) in ranges:
+			if (len(merged) > 0 and s <= merged[-1][1]):
+				merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+			else:
+				merged.append((s, e))
+		return merged
+
+	# Generate a meter's lines with timestamps in [start, end], in file
+	# order, reading only the parts of the file they can be in
+	def query(self, address, start=None, end=None):
+		f = open(self.path, "rb")
+		try:
+			for (s, e) in self.ranges(address, start, end):
+				f.seek(s)
+				data = f.read(e - s)
+				for line in data.splitlines(True):
+					fields = line.split()
+					if (len(fields) < 2):
+						continue
+					if (self.addressed and fields[1] != address):
+						continue
+					t = float(fields[0])
+					if ((start is not None and t < start) or (end is not None and t > end)):
+						continue
+					yield line
+		finally:
+			f.close()
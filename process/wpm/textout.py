@@ -0,0 +1,81 @@
+import os
+import numpy
+
+################################################################################
+################################################################################
+
+# Text output is written through a buffer this big, it's a lot of text
+BUFFER_SIZE = 1 << 20
+
+# Split text output has a file per meter, named after its address, with the
+# address column dropped so gnuplot can plot it as is, like the traces in data/.
+# There can be a lot of meters, so each file gets a smaller buffer.
+SPLIT_SUFFIX = ".dat"
+SPLIT_BUFFER_SIZE = 1 << 16
+
+################################################################################
+################################################################################
+
+# Format samples as text lines of "timestamp address voltage", or of
+# "timestamp voltage" without an address, the way the scripts always have.
+# The lines are formatted with a single % over one long format string rather
+# than one per sample, which is the same formatting but done in C.
+def format_samples(timestamps, voltages, address=None):
+	count = len(timestamps)
+	values = numpy.empty(2*count, dtype=numpy.float64)
+	values[0::2] = timestamps
+	values[1::2] = voltages
+	if (address is None):
+		line = "%f %f\n"
+	else:
+		line = "%%f %s %%f\n" % address.replace("%", "%%")
+	return (line * count) % tuple(values.tolist())
+
+################################################################################
+################################################################################
+
+# Text output in one file, written through a large buffer
+class TextWriter:
+	def __init__(self, path, buffer_size=BUFFER_SIZE, append=False):
+		self.file = open(path, "a" if append else "w", buffer_size)
+
+	# Write formatted samples, the address is already in every line
+	def write(self, address, text):
+		self.file.write(text)
+
+	def flush(self):
+		self.file.flush()
+
+	def close(self):
+		self.file.close()
+
+# Text output in a directory of per-meter files, opened as meters show up
+class SplitTextWriter:
+	def __init__(self, directory, buffer_size=SPLIT_BUFFER_SIZE, append=False):
+		self.directory = directory
+		self.buffer_size = buffer_size
+		self.append = append
+		if (not os.path.isdir(directory)):
+			os.makedirs(directory)
+		self.files = {}
+
+	# The file for a meter address
+	def file(self, address):
+		try:
+			return self.files[address]
+		except KeyError:
+			f = open(os.path.join(self.directory, address + SPLIT_SUFFIX), "a" if self.append else "w", self.buffer_size)
+			self.files[address] = f
+			return f
+
+	# Write formatted samples from a meter
+	def write(self, address, text):
+		self.file(address).write(text)
+
+	def flush(self):
+		for f in self.files.values():
+			f.flush()
+
+	def close(self):
+		for f in self.files.values():
+			f.close()
@@ -0,0 +1,153 @@
+import struct
+import collections
+
+################################################################################
+################################################################################
+
+# API frame start delimiter
+API_START = b'\x7E'
+# API frame type of a Zigbee Receive Packet
+API_RECEIVE_PACKET = 0x90
+
+# Bytes around the frame data: start delimiter, two length bytes, checksum
+API_FRAME_OVERHEAD = 4
+
+# Offsets into the frame data of a Zigbee Receive Packet. Meters are keyed by
+# the 64-bit source address in bytes 1-8. Their name in outputs is frame data
+# bytes 2-9, as the processing scripts have always printed it, so it matches
+# previously recorded outputs. That takes in the high byte of the 16-bit
+# network address, which changes when a meter rejoins, so a meter keeps the
+# name of its first frame. The first RF data byte is the frame ID the firmware
+# counts up within each sample block.
+RX_SOURCE = 1
+RX_SOURCE_END = 9
+RX_NAME = 2
+RX_NAME_END = 10
+RX_FRAME_ID = 12
+RX_PAYLOAD = 13
+
+# A decoded API frame. The payload is a memoryview into the decoded buffer, so
+# it is only valid until the next feed(), copy it to keep it longer. Frames
+# other than Zigbee Receive Packets have no source, name or frame ID and carry
+# their whole frame data after the type byte as the payload.
+APIFrame = collections.namedtuple('APIFrame', 'frame_type source name frame_id payload')
+
+################################################################################
+################################################################################
+
+# Get a memoryview of a buffer, going through NumPy for objects like mmap that
+# only offer the old buffer interface
+def buffer_view(data):
+	try:
+		return memoryview(data)
+	except TypeError:
+		import numpy
+		return memoryview(numpy.frombuffer(data, numpy.uint8))
+
+# Counts of what a frame scan found: frames with a good checksum, and start
+# delimiters whose frame failed its checksum
+class FrameStats(object):
+	__slots__ = ('frames', 'checksum_errors')
+
+	def __init__(self):
+		self.frames = 0
+		self.checksum_errors = 0
+
+# Scan data[pos:end] for API frames with valid checksums, where view is
+# buffer_view(data). Yields (offset, frameLen) for each frame found, offset
+# being that of its start delimiter, and skips past it. If the data ends inside
+# a frame, yields (offset, -1) for its start delimiter and stops. Frames and
+# checksum failures are counted in stats, if given.
+def scan_frames(data, view, pos, end, stats=None):
+	while True:
+		# Find the next start of an API frame
+		pos = data.find(API_START, pos, end)
+		if (pos < 0):
+			return
+
+		# Check that the next two length bytes and at least the checksum
+		# byte exist
+		if (end < pos+3):
+			yield (pos, -1)
+			return
+
+		# Pull out the API frame length from the next two bytes
+		frameLen = struct.unpack_from('>H', view, pos+1)[0]
+
+		# Check that the frame actually contains this specified frame
+		# length
+		if (end < pos+3+frameLen+1):
+			yield (pos, -1)
+			return
+
+		# Check the checksum of the frame, a false start delimiter is
+		# skipped by resuming the search on the byte after it
+		if ((sum(bytearray(view[pos+3 : pos+3+frameLen+1])) & 0xFF) != 0xFF):
+			if (stats is not None):
+				stats.checksum_errors += 1
+			pos += 1
+			continue
+
+		if (stats is not None):
+			stats.frames += 1
+		yield (pos, frameLen)
+
+		# Resume after this frame, its data can't hold another frame
+		pos += 3+frameLen+1
+
+# Decode the frame data of an API frame starting at offset in a view
+def decode_frame(view, offset, frameLen):
+	start = offset + 3
+	frameType = struct.unpack_from('B', view, start)[0]
+
+	# Check for a Zigbee Receive Packet with sample data in it
+	if (frameType == API_RECEIVE_PACKET and frameLen > RX_PAYLOAD):
+		source = view[start+RX_SOURCE : start+RX_SOURCE_END].tobytes()
+		name = view[start+RX_NAME : start+RX_NAME_END].tobytes()
+		frameID = struct.unpack_from('B', view, start+RX_FRAME_ID)[0]
+		return APIFrame(frameType, source, name, frameID, view[start+RX_PAYLOAD : start+frameLen])
+
+	return APIFrame(frameType, None, None, None, view[start+1 : start+frameLen])
+
+################################################################################
+################################################################################
+
+# Incremental API frame decoder for a stream of serial port data
+class APIFrameDecoder:
+	def __init__(self):
+		# Yet to be processed data: the start of an incomplete frame
+		self.pending = bytearray()
+		self.stats = FrameStats()
+
+	# Discard any partially received frame
+	def reset(self):
+		self.pending = bytearray()
+
+	# Feed more data from the stream in and yield the complete frames in
+	# it. Frames are decoded in place in the data passed in, or in the
+	# pending buffer when an earlier feed() ended inside a frame, only that
+	# incomplete tail is ever copied.
+	def feed(self, data):
+		if (len(self.pending) > 0):
+			# No views of the pending buffer were handed out, it was
+			# created at the end of the last feed()
+			self.pending += data
+			data = self.pending
+		self.pending = bytearray()
+
+		view = buffer_view(data)
+		end = len(data)
+		pos = 0
+		try:
+			for (offset, frameLen) in scan_frames(data, view, 0, end, self.stats):
+				if (frameLen < 0):
+					pos = offset
+					break
+				pos = offset+3+frameLen+1
+				yield decode_frame(view, offset, frameLen)
+			else:
+				pos = end
+		finally:
+			# Save whatever we didn't get through for next time, in
+			# a new buffer so views of this one stay valid
+			self.pending = bytearray(view[pos:end])